@@ -14,6 +14,7 @@ from datetime import datetime
 from polaris.common.test_support import dbtest_addoption
 from polaris.common.test_support import init_db
 from polaris.work_tracking.db import model
+from polaris.work_tracking import commands, connector_factory, work_items_source_factory
 from polaris.integrations.db import model as integrations_model
 from polaris.common import db
 from test.constants import *
@@ -34,6 +35,16 @@ def setup_schema(db_up):
     integrations_model.recreate_all(db.engine())
 
 
+@pytest.fixture(autouse=True)
+def clear_caches():
+    # Test fixtures reuse connector and work items source keys, so cached connectors
+    # and providers must not outlive the test that created them.
+    yield
+    connector_factory.connector_cache.invalidate_all()
+    work_items_source_factory.invalidate_all_providers()
+    commands.missing_work_items_cache.invalidate_all()
+
+
 @pytest.fixture
 def setup_connectors(setup_schema):
     pivotal_connector_key = uuid.uuid4()
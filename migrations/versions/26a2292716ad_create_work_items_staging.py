@@ -0,0 +1,60 @@
+"""create_work_items_staging
+
+Revision ID: 26a2292716ad
+Revises: e2b89a19f167
+Create Date: 2026-10-18 11:47:52.118364
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = '26a2292716ad'
+down_revision = 'e2b89a19f167'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('work_items_staging',
+    sa.Column('batch_id', postgresql.UUID(as_uuid=True), nullable=False),
+    sa.Column('key', postgresql.UUID(as_uuid=True), nullable=True),
+    sa.Column('source_id', sa.String(), nullable=True),
+    sa.Column('work_item_type', sa.String(), nullable=True),
+    sa.Column('name', sa.String(length=256), nullable=True),
+    sa.Column('description', sa.Text(), nullable=True),
+    sa.Column('is_bug', sa.Boolean(), nullable=True),
+    sa.Column('tags', postgresql.ARRAY(sa.String()), nullable=True),
+    sa.Column('url', sa.String(), nullable=True),
+    sa.Column('source_state', sa.String(), nullable=True),
+    sa.Column('source_display_id', sa.String(), nullable=True),
+    sa.Column('priority', sa.String(), nullable=True),
+    sa.Column('releases', postgresql.ARRAY(sa.String()), nullable=True),
+    sa.Column('story_points', sa.Integer(), nullable=True),
+    sa.Column('sprints', postgresql.ARRAY(sa.String()), nullable=True),
+    sa.Column('flagged', sa.Boolean(), nullable=True),
+    sa.Column('changelog', postgresql.JSONB(astext_type=sa.Text()), nullable=True),
+    sa.Column('source_created_at', sa.DateTime(), nullable=True),
+    sa.Column('source_last_updated', sa.DateTime(), nullable=True),
+    sa.Column('last_sync', sa.DateTime(), nullable=True),
+    sa.Column('deleted_at', sa.DateTime(), nullable=True),
+    sa.Column('is_epic', sa.Boolean(), nullable=True),
+    sa.Column('parent_source_display_id', sa.String(), nullable=True),
+    sa.Column('parent_id', sa.Integer(), nullable=True),
+    sa.Column('commit_identifiers', postgresql.JSONB(astext_type=sa.Text()), nullable=True),
+    sa.Column('is_moved_from_current_source', sa.Boolean(), nullable=True),
+    sa.Column('work_items_source_id', sa.Integer(), nullable=True),
+    sa.Column('organization_key', postgresql.UUID(as_uuid=True), nullable=True),
+    sa.Column('api_payload', postgresql.JSONB(astext_type=sa.Text()), nullable=True),
+    sa.Column('content_hash', sa.String(), nullable=True),
+    sa.Column('is_new', sa.Boolean(), nullable=True),
+    sa.Column('has_changes', sa.Boolean(), nullable=True),
+    sa.UniqueConstraint('batch_id', 'source_id'),
+    schema='work_tracking',
+    prefixes=['UNLOGGED']
+    )
+
+
+def downgrade():
+    op.drop_table('work_items_staging', schema='work_tracking')
@@ -0,0 +1,35 @@
+"""create_work_item_events
+
+Revision ID: 3527ef0e2470
+Revises: 26a2292716ad
+Create Date: 2026-10-18 12:36:05.204419
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = '3527ef0e2470'
+down_revision = '26a2292716ad'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('work_item_events',
+    sa.Column('id', sa.BigInteger(), nullable=False),
+    sa.Column('work_items_source_id', sa.Integer(), nullable=False),
+    sa.Column('source_id', sa.String(), nullable=False),
+    sa.Column('event_type', sa.String(), nullable=False),
+    sa.Column('payload', postgresql.JSONB(astext_type=sa.Text()), nullable=False),
+    sa.Column('received_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['work_items_source_id'], ['work_tracking.work_items_sources.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('work_items_source_id', 'source_id'),
+    schema='work_tracking'
+    )
+
+
+def downgrade():
+    op.drop_table('work_item_events', schema='work_tracking')
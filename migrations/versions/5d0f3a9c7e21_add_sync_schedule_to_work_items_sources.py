@@ -0,0 +1,33 @@
+"""add_sync_schedule_to_work_items_sources
+
+Revision ID: 5d0f3a9c7e21
+Revises: 8c41d5e0b7a3
+Create Date: 2026-10-18 17:02:44.519306
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '5d0f3a9c7e21'
+down_revision = '8c41d5e0b7a3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('work_items_sources', sa.Column('next_sync_at', sa.DateTime(), nullable=True),
+                  schema='work_tracking')
+    op.add_column('work_items_sources', sa.Column('sync_interval_seconds', sa.Integer(), nullable=True),
+                  schema='work_tracking')
+    op.add_column('work_items_sources', sa.Column('sync_leased_until', sa.DateTime(), nullable=True),
+                  schema='work_tracking')
+    op.create_index('ix_work_items_sources_next_sync_at', 'work_items_sources', ['next_sync_at'], unique=False,
+                    schema='work_tracking')
+
+
+def downgrade():
+    op.drop_index('ix_work_items_sources_next_sync_at', table_name='work_items_sources', schema='work_tracking')
+    op.drop_column('work_items_sources', 'sync_leased_until', schema='work_tracking')
+    op.drop_column('work_items_sources', 'sync_interval_seconds', schema='work_tracking')
+    op.drop_column('work_items_sources', 'next_sync_at', schema='work_tracking')
@@ -0,0 +1,92 @@
+"""add_content_hash_to_work_items
+
+Revision ID: 76ea14502ccf
+Revises: 3b9eec79e130
+Create Date: 2026-10-18 10:12:41.318207
+
+"""
+import hashlib
+import json
+import uuid
+from datetime import datetime, date
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '76ea14502ccf'
+down_revision = '3b9eec79e130'
+branch_labels = None
+depends_on = None
+
+backfill_batch_size = 1000
+
+# Frozen copies of model.work_item_content_attributes and model.work_item_content_hash as of this revision,
+# so that later changes to the model do not change what this migration does.
+work_item_content_attributes = [
+    'name', 'description', 'is_bug', 'work_item_type', 'is_epic', 'tags', 'url', 'source_state',
+    'source_display_id', 'api_payload', 'work_items_source_id', 'commit_identifiers',
+    'parent_source_display_id', 'priority', 'releases', 'story_points', 'sprints', 'flagged', 'changelog'
+]
+
+
+def normalize_content_value(value):
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    return value
+
+
+def work_item_content_hash(row):
+    content = [normalize_content_value(row[attribute]) for attribute in work_item_content_attributes]
+    return hashlib.sha256(
+        json.dumps(content, sort_keys=True, separators=(',', ':'), default=str).encode('utf-8')
+    ).hexdigest()
+
+
+def backfill_content_hash():
+    # The hash has to match the one computed on sync, so we compute it in python
+    # rather than in sql. Each batch is committed on its own, so the backfill does not hold
+    # locks on the whole of work_items in one long transaction.
+    connection = op.get_bind()
+    last_id = 0
+    while True:
+        batch = connection.execute(
+            sa.text(
+                f"select id, {', '.join(work_item_content_attributes)} from work_tracking.work_items "
+                f"where id > :last_id order by id limit :batch_size"
+            ),
+            last_id=last_id,
+            batch_size=backfill_batch_size
+        ).fetchall()
+        if len(batch) == 0:
+            break
+
+        connection.execute(
+            sa.text("update work_tracking.work_items set content_hash=:content_hash where id=:id"),
+            [
+                dict(
+                    id=row.id,
+                    content_hash=work_item_content_hash(row)
+                )
+                for row in batch
+            ]
+        )
+        last_id = batch[-1].id
+
+
+def upgrade():
+    op.add_column('work_items', sa.Column('content_hash', sa.String(), nullable=True), schema='work_tracking')
+    with op.get_context().autocommit_block():
+        backfill_content_hash()
+    op.create_index('ix_work_items_work_item_source_id_source_id_content_hash', 'work_items',
+                    ['work_items_source_id', 'source_id', 'content_hash'], unique=False, schema='work_tracking')
+
+
+def downgrade():
+    op.drop_index('ix_work_items_work_item_source_id_source_id_content_hash', table_name='work_items',
+                  schema='work_tracking')
+    op.drop_column('work_items', 'content_hash', schema='work_tracking')
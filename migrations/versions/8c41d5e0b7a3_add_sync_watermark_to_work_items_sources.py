@@ -0,0 +1,43 @@
+"""add_sync_watermark_to_work_items_sources
+
+Revision ID: 8c41d5e0b7a3
+Revises: 3527ef0e2470
+Create Date: 2026-10-18 15:21:06.402817
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '8c41d5e0b7a3'
+down_revision = '3527ef0e2470'
+branch_labels = None
+depends_on = None
+
+
+def backfill_sync_watermark():
+    op.execute("""
+                update work_tracking.work_items_sources
+                set latest_work_item_updated_at=latest_update.source_last_updated,
+                    latest_updated_work_item_source_id=latest_update.source_id
+                from (
+                    select distinct on (work_items_source_id) work_items_source_id, source_id, source_last_updated
+                    from work_tracking.work_items
+                    where source_last_updated is not null
+                    order by work_items_source_id, source_last_updated desc
+                ) as latest_update
+                where work_items_sources.id = latest_update.work_items_source_id
+            """)
+
+
+def upgrade():
+    op.add_column('work_items_sources', sa.Column('latest_work_item_updated_at', sa.DateTime(), nullable=True),
+                  schema='work_tracking')
+    op.add_column('work_items_sources', sa.Column('latest_updated_work_item_source_id', sa.String(), nullable=True),
+                  schema='work_tracking')
+    backfill_sync_watermark()
+
+
+def downgrade():
+    op.drop_column('work_items_sources', 'latest_updated_work_item_source_id', schema='work_tracking')
+    op.drop_column('work_items_sources', 'latest_work_item_updated_at', schema='work_tracking')
@@ -0,0 +1,31 @@
+"""add_claims_to_work_item_events
+
+Revision ID: 9e4b7c1d2f60
+Revises: 5d0f3a9c7e21
+Create Date: 2026-10-18 19:21:37.602148
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = '9e4b7c1d2f60'
+down_revision = '5d0f3a9c7e21'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('work_item_events', sa.Column('claim_token', postgresql.UUID(as_uuid=True), nullable=True),
+                  schema='work_tracking')
+    op.add_column('work_item_events', sa.Column('claimed_until', sa.DateTime(), nullable=True),
+                  schema='work_tracking')
+    op.add_column('work_item_events', sa.Column('attempts', sa.Integer(), server_default='0', nullable=False),
+                  schema='work_tracking')
+
+
+def downgrade():
+    op.drop_column('work_item_events', 'attempts', schema='work_tracking')
+    op.drop_column('work_item_events', 'claimed_until', schema='work_tracking')
+    op.drop_column('work_item_events', 'claim_token', schema='work_tracking')
@@ -0,0 +1,41 @@
+"""add_organization_key_to_work_items
+
+Revision ID: e2b89a19f167
+Revises: 76ea14502ccf
+Create Date: 2026-10-18 11:02:17.540913
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = 'e2b89a19f167'
+down_revision = '76ea14502ccf'
+branch_labels = None
+depends_on = None
+
+
+def copy_organization_key_from_work_items_sources():
+    op.execute("""
+                update work_tracking.work_items set organization_key=work_items_sources.organization_key
+                from work_tracking.work_items_sources
+                where work_items.work_items_source_id = work_items_sources.id
+            """)
+
+
+def upgrade():
+    op.add_column('work_items', sa.Column('organization_key', postgresql.UUID(as_uuid=True), nullable=True), schema='work_tracking')
+    copy_organization_key_from_work_items_sources()
+    op.create_index('ix_work_items_organization_key_source_display_id', 'work_items',
+                    ['organization_key', 'source_display_id'], unique=False, schema='work_tracking')
+    op.create_index('ix_work_items_organization_key_parent_source_display_id', 'work_items',
+                    ['organization_key', 'parent_source_display_id'], unique=False, schema='work_tracking')
+
+
+def downgrade():
+    op.drop_index('ix_work_items_organization_key_parent_source_display_id', table_name='work_items',
+                  schema='work_tracking')
+    op.drop_index('ix_work_items_organization_key_source_display_id', table_name='work_items',
+                  schema='work_tracking')
+    op.drop_column('work_items', 'organization_key', schema='work_tracking')
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+
+# Copyright: © Exathink, LLC (2011-2026) All Rights Reserved
+
+# Unauthorized use or copying of this file and its contents, via any medium
+# is strictly prohibited. The work product in this file is proprietary and
+# confidential.
+
+# Author: Krishna Kumar
+
+import logging
+import time
+from collections import OrderedDict
+from threading import RLock
+
+logger = logging.getLogger('polaris.work_tracking.cache')
+
+# Passed as the version to a lookup that accepts whichever version of the value is cached.
+any_version = object()
+
+
+class ExpiringCache:
+    """
+    An in-process, thread safe LRU cache of objects that are expensive to load.
+
+    Each entry is stored along with a version stamp and expires after ttl seconds. A lookup
+    whose version does not match the cached entry reloads it. Entries can also be invalidated
+    explicitly when we learn that the underlying data has changed.
+    """
+
+    def __init__(self, name, ttl=300, max_size=1000, log_interval=1000):
+        self.name = name
+        self.ttl = ttl
+        self.max_size = max_size
+        self.log_interval = log_interval
+        self.entries = OrderedDict()
+        self.lock = RLock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key, load, version=None):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                entry_version, value, expires_at = entry
+                if entry_version == version and expires_at > time.monotonic():
+                    self.hits = self.hits + 1
+                    self.entries.move_to_end(key)
+                    self.log_stats()
+                    return value
+                # the entry is stale or has expired
+                del self.entries[key]
+                self.evictions = self.evictions + 1
+            self.misses = self.misses + 1
+            self.log_stats()
+
+        # we load outside the lock so that a slow load does not block lookups of other keys.
+        value = load()
+
+        self.put(key, value, version)
+        return value
+
+    def peek(self, key, version=any_version):
+        # Returns the cached value without loading it on a miss. By default any version of the
+        # cached value is returned, for callers that cannot tell which version is current.
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                entry_version, value, expires_at = entry
+                if (version is any_version or entry_version == version) and expires_at > time.monotonic():
+                    self.hits = self.hits + 1
+                    self.entries.move_to_end(key)
+                    return value
+            self.misses = self.misses + 1
+
+    def put(self, key, value, version=None):
+        with self.lock:
+            self.entries[key] = (version, value, time.monotonic() + self.ttl)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+                self.evictions = self.evictions + 1
+
+    def invalidate(self, key):
+        with self.lock:
+            if self.entries.pop(key, None) is not None:
+                self.invalidations = self.invalidations + 1
+
+    def invalidate_all(self):
+        with self.lock:
+            self.invalidations = self.invalidations + len(self.entries)
+            self.entries.clear()
+
+    @property
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return dict(
+                name=self.name,
+                size=len(self.entries),
+                hits=self.hits,
+                misses=self.misses,
+                hit_rate=self.hits / lookups if lookups > 0 else None,
+                evictions=self.evictions,
+                invalidations=self.invalidations
+            )
+
+    def log_stats(self):
+        lookups = self.hits + self.misses
+        if self.log_interval and lookups % self.log_interval == 0:
+            logger.info(f"Cache stats: {self.stats}")
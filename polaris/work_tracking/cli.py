@@ -33,6 +33,12 @@ def import_work_items(organization_key=None, work_items_source_key=None):
             ImportWorkItems(send=dict(organization_key=organization_key, work_items_source_key=work_items_source_key)))
 
 
+def import_work_items_concurrently(*work_items_source_keys):
+    results = commands.import_work_items_concurrently(token_provider, work_items_source_keys)
+    for work_items_source_key, result in results.items():
+        print(f'{work_items_source_key}: {result}')
+
+
 def import_work_items_sources(connector_name):
     connector = polaris.work_tracking.connector_factory.get_connector(connector_name="Polaris Gitlab")
     if connector:
@@ -58,5 +64,6 @@ if __name__ == '__main__':
     argh.dispatch_commands([
         import_work_items_sources,
         import_work_items,
+        import_work_items_concurrently,
         list_jira_projects
     ])
@@ -9,6 +9,10 @@
 # Author: Krishna Kumar
 
 import logging
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
 
 import polaris.work_tracking.db.model
 from polaris.common import db
@@ -16,6 +20,8 @@ from polaris.common.enums import WorkItemsSourceImportState, TrackingReceiptStat
 from polaris.utils.config import get_config_provider
 from polaris.work_tracking import publish
 from polaris.work_tracking import work_items_source_factory, connector_factory
+from polaris.work_tracking.cache import ExpiringCache
+from polaris.work_tracking.fetch_engine import FetchEngine
 from polaris.work_tracking.db import api
 from polaris.work_tracking.db.model import WorkItemsSource, Project
 from polaris.utils.exceptions import ProcessingException
@@ -26,26 +32,25 @@ from polaris.work_tracking.messages import ResolveWorkItemsForEpic
 logger = logging.getLogger('polaris.work_tracking.work_tracker')
 config = get_config_provider()
 
+# Source ids of work items that could not be found in their work items source, keyed by
+# (work_items_source_key, source_id), so that we dont keep asking the api for them on every child update.
+# This is a per process cache: each listener process finds out for itself that a work item is missing,
+# so with n processes a missing work item is fetched at most n times per missing_work_items_ttl_seconds.
+missing_work_items_cache = ExpiringCache(
+    'missing_work_items',
+    ttl=int(config.get('missing_work_items_ttl_seconds', 3600)),
+    max_size=int(config.get('missing_work_items_cache_size', 100000))
+)
+
 
 def success(result):
     return dict(success=True, **result)
 
 
-def update_work_items_source_before_work_item_sync(work_items_source_provider):
-    work_items_source = work_items_source_provider.work_items_source
-    with db.orm_session() as session:
-        session.add(work_items_source)
-        if work_items_source.import_state == WorkItemsSourceImportState.ready.value:
-            # Initial Import
-            work_items_source.import_state = WorkItemsSourceImportState.importing.value
-        if getattr(work_items_source_provider, 'before_work_item_sync', None):
-            work_items_source_data = work_items_source_provider.before_work_item_sync()
-            work_items_source.update(work_items_source_data)
-
-
 def sync_work_item(token_provider, work_items_source_key, source_id):
     try:
-        work_items_source_provider = work_items_source_factory.get_provider_impl(token_provider, work_items_source_key)
+        work_items_source_provider = work_items_source_factory.get_cached_provider_impl(token_provider,
+                                                                                        work_items_source_key)
         work_items_source = work_items_source_provider.work_items_source
         sync_result = []
         if work_items_source.import_state != WorkItemsSourceImportState.disabled.value:
@@ -64,21 +69,183 @@ def sync_work_item(token_provider, work_items_source_key, source_id):
         raise ProcessingException(f"Unexpected error raised on sync_work_item {source_id}")
 
 
-def sync_work_items(token_provider, work_items_source_key):
-    work_items_source_provider = work_items_source_factory.get_provider_impl(token_provider, work_items_source_key)
+def is_missing_work_item(work_items_source_key, source_id):
+    return missing_work_items_cache.peek((str(work_items_source_key), source_id)) is not None
+
+
+def import_missing_work_items(token_provider, work_items_source_key, source_ids):
+    """
+    Fetch the work items with the given source ids in a single batch and sync them.
+    Source ids that are not returned by the source are remembered as missing for missing_work_items_ttl_seconds,
+    and subsequent requests to import them in this process are skipped until then.
+    """
+    source_ids = [
+        source_id for source_id in sorted(set(source_ids))
+        if not is_missing_work_item(work_items_source_key, source_id)
+    ]
+    if len(source_ids) == 0:
+        return []
+
+    # We go by the import state of the cached provider's copy of the work items source here, which is refreshed
+    # by the syncs in this process and can otherwise lag a change made elsewhere by up to the provider cache ttl.
+    work_items_source_provider = work_items_source_factory.get_cached_provider_impl(token_provider,
+                                                                                    work_items_source_key)
     work_items_source = work_items_source_provider.work_items_source
-    if work_items_source.import_state != WorkItemsSourceImportState.disabled.value:
-        update_work_items_source_before_work_item_sync(work_items_source_provider)
-        for work_items in work_items_source_provider.fetch_work_items_to_sync():
-            yield api.sync_work_items(work_items_source_key, work_items) or []
-
-        with db.orm_session() as session:
-            session.add(work_items_source)
-            work_items_source.import_state = WorkItemsSourceImportState.auto_update.value
-            work_items_source.set_synced()
+    if work_items_source.import_state == WorkItemsSourceImportState.disabled.value:
+        logger.info(f'Attempted to call import_missing_work_items on a disabled work_item_source: {work_items_source.key}.'
+                    f'Import request will be ignored')
+        return []
+
+    if getattr(work_items_source_provider, 'fetch_work_items_by_source_ids', None):
+        work_items_data = work_items_source_provider.fetch_work_items_by_source_ids(source_ids)
+    elif getattr(work_items_source_provider, 'fetch_work_item', None):
+        work_items_data = [
+            work_item_data
+            for work_item_data in map(work_items_source_provider.fetch_work_item, source_ids)
+            if work_item_data
+        ]
     else:
-        logger.info(f'Attempted to call sync_work_items on a disabled work_item_source: {work_items_source.key}.'
-                    f'Sync request will be ignored')
+        return []
+
+    found = {work_item_data['source_display_id'] for work_item_data in work_items_data}
+    for source_id in source_ids:
+        if source_id not in found:
+            missing_work_items_cache.put((str(work_items_source_key), source_id), True)
+    logger.info(f'import_missing_work_items: {len(found)} of {len(source_ids)} work items found')
+
+    return api.sync_work_items(work_items_source_key, work_items_data) or []
+
+
+def begin_work_items_sync(token_provider, work_items_source_key):
+    with db.orm_session() as session:
+        work_items_source = WorkItemsSource.find_by_key(session, work_items_source_key)
+        if work_items_source is None:
+            raise ProcessingException(f'Could not find work_items_source with key {work_items_source_key}')
+
+        if work_items_source.import_state != WorkItemsSourceImportState.disabled.value:
+            work_items_source_provider = work_items_source_factory.get_cached_provider_impl(
+                token_provider, work_items_source_key, work_items_source
+            )
+            if work_items_source.import_state == WorkItemsSourceImportState.ready.value:
+                # Initial Import
+                work_items_source.import_state = WorkItemsSourceImportState.importing.value
+            work_items_source.take_sync_lease()
+            if getattr(work_items_source_provider, 'before_work_item_sync', None):
+                work_items_source_data = work_items_source_provider.before_work_item_sync()
+                work_items_source.update(work_items_source_data)
+            session.flush()
+            work_items_source_factory.refresh_work_items_source(work_items_source_provider, work_items_source)
+            return work_items_source_provider
+        else:
+            logger.info(f'Attempted to call sync_work_items on a disabled work_item_source: {work_items_source.key}.'
+                        f'Sync request will be ignored')
+
+
+def count_changes(synced_work_items):
+    return len([
+        work_item for work_item in synced_work_items
+        if work_item.get('is_new') or work_item.get('is_updated')
+    ])
+
+
+def latest_update(work_items_source_key, synced_work_items, latest=None):
+    # The latest (updated_at, source_id) among the synced work items of the source and latest. Work items
+    # of other sources can be returned by a sync when their parents are resolved, so these are ignored.
+    for work_item in synced_work_items:
+        if work_item['work_items_source_key'] == str(work_items_source_key) and work_item['updated_at'] is not None:
+            if latest is None or work_item['updated_at'] > latest[0]:
+                latest = (work_item['updated_at'], work_item['source_id'])
+    return latest
+
+
+def finish_work_items_sync(work_items_source_provider, changes=0, latest=None):
+    with db.orm_session() as session:
+        work_items_source = WorkItemsSource.find_by_key(session, work_items_source_provider.work_items_source.key)
+        work_items_source.import_state = WorkItemsSourceImportState.auto_update.value
+        work_items_source.set_synced()
+        work_items_source.schedule_next_sync(changes)
+        if latest is not None:
+            # The sync has synced all its pages, so the watermark can move past them.
+            api.advance_sync_watermark(work_items_source.key, *latest, join_this=session)
+        session.flush()
+        session.refresh(work_items_source)
+        work_items_source_factory.refresh_work_items_source(work_items_source_provider, work_items_source)
+
+
+def fail_work_items_sync(work_items_source_key):
+    # Releases the lease of a sync that failed and backs off its next sync, so that the
+    # sync agent does not queue the source again right away.
+    with db.orm_session() as session:
+        work_items_source = WorkItemsSource.find_by_key(session, work_items_source_key)
+        if work_items_source is not None:
+            work_items_source.schedule_sync_retry()
+
+
+def sync_work_items(token_provider, work_items_source_key):
+    try:
+        work_items_source_provider = begin_work_items_sync(token_provider, work_items_source_key)
+        if work_items_source_provider is not None:
+            changes = 0
+            latest = None
+            for work_items in work_items_source_provider.fetch_work_items_to_sync():
+                synced_work_items = api.sync_work_items(work_items_source_key, work_items) or []
+                api.renew_sync_lease(work_items_source_key)
+                changes = changes + count_changes(synced_work_items)
+                latest = latest_update(work_items_source_key, synced_work_items, latest)
+                yield synced_work_items
+
+            finish_work_items_sync(work_items_source_provider, changes, latest)
+    except Exception:
+        # The sync does not advance the watermark, so the next sync picks up from where this one started.
+        fail_work_items_sync(work_items_source_key)
+        raise
+
+
+def import_work_items_concurrently(token_provider, work_items_source_keys, engine=None):
+    """
+    Import work items for a set of work items sources concurrently, using the fetch engine to
+    page through the sources in parallel, while syncing the pages to the database in the order in which
+    they were fetched for each source. Each source is still paged through one page at a time.
+
+    Returns a dict mapping each work items source key to the number of work items synced and the error that
+    stopped its import, if any.
+    """
+    providers = dict()
+    sources = []
+    for work_items_source_key in work_items_source_keys:
+        work_items_source_provider = begin_work_items_sync(token_provider, work_items_source_key)
+        if work_items_source_provider is not None:
+            work_items_source = work_items_source_provider.work_items_source
+            providers[str(work_items_source_key)] = work_items_source_provider
+            sources.append((
+                str(work_items_source_key),
+                str(work_items_source.connector_key),
+                work_items_source_provider.fetch_work_items_to_sync()
+            ))
+
+    changes = {work_items_source_key: 0 for work_items_source_key in providers}
+    latest = {work_items_source_key: None for work_items_source_key in providers}
+
+    def sync_page(work_items_source_key, work_items):
+        synced_work_items = api.sync_work_items(work_items_source_key, work_items) or []
+        api.renew_sync_lease(work_items_source_key)
+        changes[work_items_source_key] = changes[work_items_source_key] + count_changes(synced_work_items)
+        latest[work_items_source_key] = latest_update(
+            work_items_source_key, synced_work_items, latest[work_items_source_key]
+        )
+        return synced_work_items
+
+    def finish_source(work_items_source_key):
+        finish_work_items_sync(
+            providers[work_items_source_key], changes[work_items_source_key], latest[work_items_source_key]
+        )
+
+    results = (engine or FetchEngine()).run(sources, sync_page, finish_source)
+    for work_items_source_key, result in results.items():
+        if result['error'] is not None:
+            fail_work_items_sync(work_items_source_key)
+
+    return results
 
 
 
@@ -102,54 +269,146 @@ def sync_work_items_sources(connector_key, tracking_receipt_key=None):
             for work_items_sources in connector.fetch_work_items_sources_to_sync():
                 yield api.sync_work_items_sources(connector, work_items_sources)
 
-"""
-Find the work items in reprocessed_work_items that have changed from the original work items in work_items_batch
-and return a list of the changed work items
-"""
-def changed_work_items(work_items_batch, reprocessed_work_items, attributes_to_check):
-    changed_items = reprocessed_work_items
-    if attributes_to_check is not None:
-        changed_items = []
-        for work_item, reprocessed_work_item in zip(work_items_batch, reprocessed_work_items):
-            if any(getattr(work_item, attr, None) != reprocessed_work_item.get(attr, None) for attr in attributes_to_check):
+
+def reprocess_work_items_input(work_items, attributes_to_check):
+    # Reduces a batch of work items to plain (source_display_id, api_payload, original attribute values) tuples
+    # so that it can be remapped in this process or shipped to a worker process.
+    return [
+        (
+            work_item.source_display_id,
+            work_item.api_payload,
+            tuple(getattr(work_item, attr, None) for attr in attributes_to_check or [])
+        )
+        for work_item in work_items
+    ]
+
+
+def remap_work_items(work_items_source_provider, work_items, attributes_to_check):
+    """
+    Remap the api payloads of a batch of work items returned by reprocess_work_items_input and
+    return the remapped work items where any of the attributes_to_check have changed, or all of them if
+    attributes_to_check is None
+    """
+    changed_items = []
+    for source_display_id, api_payload, original_values in work_items:
+        if api_payload is not None and len(api_payload) > 0:
+            try:
+                reprocessed_work_item = work_items_source_provider.map_issue_to_work_item_data(api_payload)
+            except Exception as exc:
+                logger.warning(f"Could not remap work item {source_display_id}: exception {str(exc)} was raised.")
+                continue
+
+            if reprocessed_work_item is not None and (
+                    attributes_to_check is None or
+                    any(
+                        original_value != reprocessed_work_item.get(attr, None)
+                        for attr, original_value in zip(attributes_to_check, original_values)
+                    )
+            ):
                 changed_items.append(reprocessed_work_item)
 
     return changed_items
 
 
+# The work items source, provider and attributes to check used by a reprocess worker process. These are set once
+# when the worker is forked, so that only the id ranges of the work items need to be shipped to the worker.
+reprocess_worker_state = dict()
+
+
+def init_reprocess_worker(work_items_source_key, work_items_source_provider, attributes_to_check, batch_size):
+    # The worker reads its work items over connections of its own. It must not close the connections
+    # it inherited from the parent's pool: closing a psycopg2 connection sends a terminate message on the
+    # socket the parent is still using. So we swap in a new pool, and keep a reference to the inherited one
+    # so that its connections are never garbage collected in the worker.
+    engine = db.engine()
+    reprocess_worker_state['inherited_pool'] = engine.pool
+    engine.pool = engine.pool.recreate()
+
+    reprocess_worker_state['work_items_source_key'] = work_items_source_key
+    reprocess_worker_state['work_items_source_provider'] = work_items_source_provider
+    reprocess_worker_state['attributes_to_check'] = attributes_to_check
+    reprocess_worker_state['batch_size'] = batch_size
+
+
+def remap_work_items_in_worker(id_range):
+    attributes_to_check = reprocess_worker_state['attributes_to_check']
+    changed_items = []
+    for work_items in WorkItemsSource.stream_work_items_batches(
+            reprocess_worker_state['work_items_source_key'],
+            attributes_to_check,
+            reprocess_worker_state['batch_size'],
+            id_range=id_range
+    ):
+        changed_items.extend(
+            remap_work_items(
+                reprocess_worker_state['work_items_source_provider'],
+                reprocess_work_items_input(work_items, attributes_to_check),
+                attributes_to_check
+            )
+        )
+    return changed_items
 
-def reprocess_work_items(work_items_source_key, attributes_to_check=None, batch_size=1000, join_this=None):
-    def map_issue_to_work_item_data_ignore_exceptions(work_items_source_provider, work_item):
-        try:
-            return work_items_source_provider.map_issue_to_work_item_data(work_item.api_payload)
-        except Exception as exc:
-            logger.warning(f"Could not remap work item {work_item.source_display_id}: exception {str(exc)} was raised.")
 
-    starting = None
-    while True:
+def reprocess_work_items(work_items_source_key, attributes_to_check=None, batch_size=None, join_this=None, workers=None):
+    batch_size = batch_size or int(config.get('reprocess_work_items_batch_size', 1000))
+    workers = workers or int(config.get('reprocess_work_items_workers', 1))
+    if workers > 1:
+        yield from reprocess_work_items_in_parallel(work_items_source_key, attributes_to_check, batch_size, workers,
+                                                    join_this)
+        return
+
+    with db.orm_session(join_this) as session:
+        work_items_source_provider = work_items_source_factory.get_cached_provider_impl(
+            None, work_items_source_key, WorkItemsSource.find_by_key(session, work_items_source_key), join_this=session
+        )
+
+    for work_items in WorkItemsSource.stream_work_items_batches(work_items_source_key, attributes_to_check,
+                                                                batch_size, join_this=join_this):
+        changed_items = remap_work_items(
+            work_items_source_provider,
+            reprocess_work_items_input(work_items, attributes_to_check),
+            attributes_to_check
+        )
         # We always want to use a new session for each batch of work items
-        # so that a single transaction covers the fetch of the batch, the remapping of the
-        # payload, the sync of the changed items and any downstream processing triggered by the yield statement
+        # so that a single transaction covers the sync of the changed items and any downstream
+        # processing triggered by the yield statement.
         # The downstream usually yields to a publish operation to the message bus, and this transaction
         # should fail if the message publication fails.
         with db.orm_session(join_this) as session:
-            work_items_source_provider = work_items_source_factory.get_provider_impl(None, work_items_source_key, join_this=session)
-            original_work_items, starting = WorkItemsSource.fetch_work_items_batch(work_items_source_key, batch_size, starting)
-
-            if len(original_work_items) > 0:
-                reprocessed_work_items = []
-                for work_item in original_work_items:
-                    if len(work_item.api_payload) > 0:
-                        reprocessed_work_item = map_issue_to_work_item_data_ignore_exceptions(work_items_source_provider, work_item)
-                        if reprocessed_work_item is not None:
-                            reprocessed_work_items.append(reprocessed_work_item)
-
-                changed_items = changed_work_items(original_work_items, reprocessed_work_items, attributes_to_check)
-                yield api.sync_work_items(work_items_source_key, changed_items, session) or []
+            yield api.sync_work_items(work_items_source_key, changed_items, session) or []
+
 
+def reprocess_work_items_in_parallel(work_items_source_key, attributes_to_check, batch_size, workers, join_this=None):
+    # Remapping the api payloads is CPU bound, so here we partition the ids of the work items of the source into
+    # ranges of batch_size work items, in descending id order, and hand up to 2 * workers ranges at a time to a pool
+    # of worker processes, each of which reads and remaps the work items in its range.
+    # The results are synced back in range order, each in its own transaction
+    # that also covers the downstream processing triggered by the yield statement.
+    # The workers are forked after the provider is constructed so they inherit it.
+    with db.orm_session(join_this) as session:
+        work_items_source_provider = work_items_source_factory.get_cached_provider_impl(
+            None, work_items_source_key, WorkItemsSource.find_by_key(session, work_items_source_key), join_this=session
+        )
+        id_ranges = iter(WorkItemsSource.work_item_id_ranges(work_items_source_key, batch_size, join_this=session))
+
+    with ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context('fork'),
+            initializer=init_reprocess_worker,
+            initargs=(work_items_source_key, work_items_source_provider, attributes_to_check, batch_size)
+    ) as executor:
+        pending = deque(
+            executor.submit(remap_work_items_in_worker, id_range) for id_range in islice(id_ranges, 2 * workers)
+        )
+        while len(pending) > 0:
+            changed_items = pending.popleft().result()
+            id_range = next(id_ranges, None)
+            if id_range is not None:
+                pending.append(executor.submit(remap_work_items_in_worker, id_range))
+
+            with db.orm_session(join_this) as session:
+                yield api.sync_work_items(work_items_source_key, changed_items, session) or []
 
-        if starting is None:
-            break
 
 def register_work_items_source_webhooks(connector_key, work_items_source_key, join_this=None):
     with db.orm_session(join_this) as session:
@@ -252,6 +511,7 @@ def update_work_items_source_custom_fields(update_work_items_source_custom_field
                                                                 join_this=session)
                     if hasattr(connector, 'fetch_custom_fields') and callable(connector.fetch_custom_fields):
                         work_items_source.custom_fields = connector.fetch_custom_fields()
+                        work_items_source_factory.invalidate_provider(params.work_items_source_key)
                         projects.append(params.work_items_source_key)
                 else:
                     return db.failure_message(
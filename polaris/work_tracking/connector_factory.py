@@ -8,6 +8,7 @@
 
 # Author: Krishna Kumar
 from polaris.common import db
+from polaris.utils.config import get_config_provider
 from polaris.common.enums import ConnectorType, ConnectorProductType
 from polaris.integrations.db.api import find_connector, find_connector_by_name
 from polaris.utils.exceptions import ProcessingException
@@ -16,6 +17,30 @@ from polaris.work_tracking.integrations.pivotal_tracker import PivotalTrackerCon
 from polaris.work_tracking.integrations.github import GithubWorkTrackingConnector
 from polaris.work_tracking.integrations.gitlab import GitlabWorkTrackingConnector
 from polaris.work_tracking.integrations.trello import TrelloWorkTrackingConnector
+from polaris.work_tracking.cache import ExpiringCache
+
+config = get_config_provider()
+
+connector_cache = ExpiringCache(
+    'work_tracking_connectors',
+    ttl=int(config.get('work_tracking_connector_cache_ttl_seconds', 300)),
+    max_size=int(config.get('work_tracking_connector_cache_max_size', 1000))
+)
+
+
+def create_connector(connector):
+    if connector.type == ConnectorType.atlassian.value and connector.product_type == ConnectorProductType.jira.value:
+        return JiraConnector(connector)
+    elif connector.type == ConnectorType.pivotal.value:
+        return PivotalTrackerConnector(connector)
+    elif connector.type == ConnectorType.github.value:
+        return GithubWorkTrackingConnector(connector)
+    elif connector.type == ConnectorType.gitlab.value:
+        return GitlabWorkTrackingConnector(connector)
+    elif connector.type == ConnectorType.trello.value:
+        return TrelloWorkTrackingConnector(connector)
+    else:
+        raise ProcessingException(f'Cannot create a work tracking connector for connector_key {connector.key}')
 
 
 def get_connector(connector_name=None, connector_key=None, join_this=None):
@@ -26,18 +51,25 @@ def get_connector(connector_name=None, connector_key=None, join_this=None):
         if connector_name is not None:
             connector = find_connector_by_name(connector_name, join_this=session)
         if connector:
-            if connector.type == ConnectorType.atlassian.value and connector.product_type == ConnectorProductType.jira.value:
-                return JiraConnector(connector)
-            elif connector.type == ConnectorType.pivotal.value:
-                return PivotalTrackerConnector(connector)
-            elif connector.type == ConnectorType.github.value:
-                return GithubWorkTrackingConnector(connector)
-            elif connector.type == ConnectorType.gitlab.value:
-                return GitlabWorkTrackingConnector(connector)
-            elif connector.type == ConnectorType.trello.value:
-                return TrelloWorkTrackingConnector(connector)
-            else:
-                raise ProcessingException(f'Cannot create a work tracking connector for connector_key {connector_key}')
+            return create_connector(connector)
 
         else:
             raise ProcessingException(f'Cannot find connector for connector_key {connector_key}')
+
+
+def get_cached_connector(connector_key, join_this=None):
+    # Connectors are looked up whenever we build a provider, so we reuse the connector
+    # and its http session across providers until the entry expires or a connector event
+    # invalidates it. A cached connector is returned without loading the connector row.
+    def load_connector():
+        with db.orm_session(join_this) as session:
+            connector = find_connector(connector_key, join_this=session)
+            if connector is None:
+                raise ProcessingException(f'Cannot find connector for connector_key {connector_key}')
+            return create_connector(connector)
+
+    return connector_cache.get(str(connector_key), load_connector)
+
+
+def invalidate_connector(connector_key):
+    connector_cache.invalidate(str(connector_key))
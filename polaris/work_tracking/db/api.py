@@ -7,22 +7,102 @@
 
 # Author: Krishna Kumar
 
+import io
+import json
 import logging
 import uuid
-from datetime import datetime
+from datetime import datetime, date, timedelta
 from polaris.utils.collections import dict_drop
-from sqlalchemy import select, and_, or_, func, literal, Column, Integer, Boolean, UniqueConstraint
-from sqlalchemy.dialects.postgresql import insert, UUID
+from sqlalchemy import select, and_, or_, func, literal, tuple_, true, Column, Integer, Boolean, UniqueConstraint
+from sqlalchemy.dialects.postgresql import insert, UUID, JSONB, ARRAY
 from sqlalchemy.exc import SQLAlchemyError
 
 from polaris.common import db
 from polaris.common.enums import WorkTrackingIntegrationType, WorkItemsSourceImportState
 from polaris.utils.collections import dict_select
 from polaris.utils.exceptions import IllegalArgumentError, ProcessingException
-from .model import WorkItemsSource, work_items, work_items_sources, WorkItem, Project
+from polaris.utils.config import get_config_provider
+from polaris.work_tracking.enums import SyncIngestMode, SyncStagingMode
+from .model import WorkItemsSource, work_items, work_items_sources, work_items_staging, work_item_events, \
+    WorkItem, Project, work_item_content_hash
 from polaris.integrations.db.model import Connector
 
 logger = logging.getLogger('polaris.work_tracker.db.api')
+config = get_config_provider()
+
+
+def copy_csv_value(column, value):
+    # Formats a single value as a field in a postgres CSV COPY stream.
+    # An unquoted empty field is read as NULL by COPY, so every non-null value is quoted.
+    if isinstance(column.type, JSONB):
+        # JSONB payloads are serialized exactly once, here. A None value is written
+        # as a json null to match what the insert path does.
+        text_value = json.dumps(value)
+    elif value is None:
+        return ''
+    elif isinstance(column.type, ARRAY):
+        text_value = '{' + ','.join(
+            'NULL' if element is None
+            else '"' + str(element).replace('\\', '\\\\').replace('"', '\\"') + '"'
+            for element in value
+        ) + '}'
+    elif isinstance(value, bool):
+        text_value = 't' if value else 'f'
+    elif isinstance(value, (datetime, date)):
+        text_value = value.isoformat()
+    else:
+        text_value = str(value)
+
+    return '"' + text_value.replace('"', '""') + '"'
+
+
+def copy_rows_into_table(session, table, rows):
+    """
+    Bulk load a list of row dicts into table using COPY FROM STDIN.
+
+    This bypasses statement compilation and parameter binding entirely, so it is much cheaper
+    than a multi-row insert for large batches. Columns that are not present in any row are left
+    to their server defaults, and columns missing from an individual row get the column default if
+    it is a scalar, or NULL otherwise.
+
+    :return: the number of rows copied.
+    """
+    if len(rows) == 0:
+        return 0
+
+    row_keys = set()
+    for row in rows:
+        row_keys.update(row.keys())
+    columns = [column for column in table.columns if column.name in row_keys]
+
+    def column_default(column):
+        if column.default is not None and column.default.is_scalar:
+            return column.default.arg
+
+    defaults = {column.name: column_default(column) for column in columns}
+
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write(
+            ','.join(
+                copy_csv_value(column, row.get(column.name, defaults[column.name]))
+                for column in columns
+            )
+        )
+        buffer.write('\n')
+    buffer.seek(0)
+
+    connection = session.connection()
+    preparer = connection.dialect.identifier_preparer
+    copy_statement = f"COPY {preparer.format_table(table)} " \
+                     f"({', '.join(preparer.quote(column.name) for column in columns)}) " \
+                     f"FROM STDIN WITH (FORMAT csv)"
+    cursor = connection.connection.cursor()
+    try:
+        cursor.copy_expert(copy_statement, buffer)
+        return cursor.rowcount
+    finally:
+        cursor.close()
 
 """
 Sync work item data in the incoming list with the work items.
@@ -38,29 +118,81 @@ relationships.
 
 @param work_items_source_key: The key of the work items source to sync with.
 @param work_item_list: The list of work items to sync.
+@param ingest_mode: A SyncIngestMode value that determines how the incoming list is staged.
+                    Defaults to the work_items_sync_ingest_mode config setting (insert).
+@param skip_unchanged: If true, incoming items whose source_last_updated and content hash match the existing
+                       item are not written at all. They are returned as existing items with no updates.
+                       Defaults to the work_items_sync_skip_unchanged config setting (true).
+@param staging_mode: A SyncStagingMode value that determines where the incoming list is staged: a temp table
+                     created for the call, or the shared unlogged work_items_staging table.
+                     Defaults to the work_items_sync_staging_mode config setting (temp_table).
 @:return: A list of work items that were inserted and updated as result of the sync operation.
 
 """
 
 
-def sync_work_items(work_items_source_key, work_item_list, join_this=None):
-    def insert_incoming_into_work_items_temp(session, work_item_list, work_items_source, work_items_temp):
+def sync_work_items(work_items_source_key, work_item_list, join_this=None, ingest_mode=None, skip_unchanged=None,
+                    staging_mode=None):
+    def stage_incoming_work_items(work_item_list, work_items_source):
         last_sync = datetime.utcnow()
-        return session.connection().execute(
-            insert(work_items_temp).values(
-                [
-                    dict(
-                        key=uuid.uuid4(),
-                        work_items_source_id=work_items_source.id,
-                        last_sync=last_sync,
-                        is_new=True,  # we will mark existing later
-                        has_changes=True,  # we will mark unchanged later.
-                        **work_item
-                    )
-                    for work_item in work_item_list
-                ]
+        staged_items = []
+        for work_item in work_item_list:
+            staged_item = dict(
+                key=uuid.uuid4(),
+                work_items_source_id=work_items_source.id,
+                organization_key=work_items_source.organization_key,
+                last_sync=last_sync,
+                is_new=True,  # we will mark existing later
+                has_changes=True,  # we will mark unchanged later.
+                **work_item
             )
-        ).rowcount
+            staged_item['content_hash'] = work_item_content_hash(staged_item)
+            staged_items.append(staged_item)
+        return staged_items
+
+    def find_unchanged_incoming_work_items(session, work_items_source, staged_items):
+        # An incoming item is unchanged if an item with the same source_id, source_last_updated and content_hash
+        # already exists in the work items source. These can be dropped before anything is written, since
+        # syncing them would not change anything other than their last_sync timestamp.
+        # Existing items whose parent has not been resolved yet are kept, so that the sync can resolve the parent
+        # if it has since been imported.
+        candidates = [
+            (staged_item['source_id'], staged_item['source_last_updated'], staged_item['content_hash'])
+            for staged_item in staged_items
+            if staged_item.get('source_id') is not None and staged_item.get('source_last_updated') is not None
+        ]
+        if len(candidates) == 0:
+            return set()
+
+        return {
+            row.source_id
+            for row in session.connection().execute(
+                select([
+                    work_items.c.source_id
+                ]).where(
+                    and_(
+                        work_items.c.work_items_source_id == work_items_source.id,
+                        tuple_(
+                            work_items.c.source_id,
+                            work_items.c.source_last_updated,
+                            work_items.c.content_hash
+                        ).in_(candidates),
+                        or_(
+                            work_items.c.parent_source_display_id == None,
+                            work_items.c.parent_id != None
+                        )
+                    )
+                )
+            ).fetchall()
+        }
+
+    def insert_incoming_into_work_items_temp(session, staged_items, work_items_temp):
+        if ingest_mode == SyncIngestMode.copy.value:
+            return copy_rows_into_table(session, work_items_temp, staged_items)
+        else:
+            return session.connection().execute(
+                insert(work_items_temp).values(staged_items)
+            ).rowcount
 
     def mark_existing_work_items_in_temp_table(session, work_items_temp):
         # mark existing items in the set. We need this to properly
@@ -76,22 +208,25 @@ def sync_work_items(work_items_source_key, work_item_list, join_this=None):
                     work_items_temp.c.source_id == work_items.c.source_id
                 )
             )
+        ).where(
+            in_batch
         ).alias()
         return session.connection().execute(
             work_items_temp.update().values(
                 is_new=False
             ).where(
-                current_items.c.source_id == work_items_temp.c.source_id
+                and_(
+                    current_items.c.source_id == work_items_temp.c.source_id,
+                    in_batch
+                )
             )
         ).rowcount
 
     def mark_unchanged_work_items_in_temp_table(session, work_items_temp):
-        attributes_to_check = ['name', 'description', 'is_bug', 'work_item_type', 'is_epic', 'tags', 'url',
-                               'source_state',
-                               'source_display_id', 'api_payload', 'work_items_source_id', 'commit_identifiers',
-                               'parent_source_display_id','priority','releases','story_points','sprints','flagged','changelog']
         # mark unchanged items in the set. We use this downstream to
         # signal that there is no need to propagate this update beyond this subsystem.
+        # The content hash covers all the attributes whose changes are material downstream, so
+        # an item is unchanged if its hash matches the hash of the existing item.
         unchanged_items = select([
             work_items_temp.c.source_id
         ]).select_from(
@@ -103,25 +238,19 @@ def sync_work_items(work_items_source_key, work_item_list, join_this=None):
                 )
             )
         ).where(
-            and_(*[
-                or_(
-                    work_items.columns[attribute] == work_items_temp.columns[attribute],
-                    # we need this clause here because if both values are null,
-                    # postgres will not allow you to compare them with an == operator.
-                    # so we have to explictly check that both values are null.
-                    and_(
-                        work_items.columns[attribute] == None,
-                        work_items_temp.columns[attribute] == None
-                    )
-                )
-                for attribute in attributes_to_check
-            ])
+            and_(
+                work_items.c.content_hash == work_items_temp.c.content_hash,
+                in_batch
+            )
         ).alias()
         return session.connection().execute(
             work_items_temp.update().values(
                 has_changes=False
             ).where(
-                unchanged_items.c.source_id == work_items_temp.c.source_id
+                and_(
+                    unchanged_items.c.source_id == work_items_temp.c.source_id,
+                    in_batch
+                )
             )
         ).rowcount
 
@@ -129,11 +258,21 @@ def sync_work_items(work_items_source_key, work_item_list, join_this=None):
         # Now  upsert work items temp into work items so that the
         # new items are inserted and existing item attributes are updated.
         # we need to strip out the extra columns that are not in work_items
+        # Unchanged items are excluded here: rewriting them would rewrite the whole row including
+        # the api_payload, only to change the sync timestamps. These are updated separately.
         work_item_columns = [column for column in work_items_temp.columns if
-                             column.name not in ['is_new', 'has_changes']]
+                             column.name not in ['is_new', 'has_changes', 'batch_id']]
         upsert = insert(work_items).from_select(
             [column.name for column in work_item_columns],
-            select(work_item_columns)
+            select(work_item_columns).where(
+                and_(
+                    or_(
+                        work_items_temp.c.is_new,
+                        work_items_temp.c.has_changes
+                    ),
+                    in_batch
+                )
+            )
         )
         return session.connection().execute(
             upsert.on_conflict_do_update(
@@ -158,7 +297,29 @@ def sync_work_items(work_items_source_key, work_item_list, join_this=None):
                     parent_id=upsert.excluded.parent_id,
                     last_sync=upsert.excluded.last_sync,
                     api_payload=upsert.excluded.api_payload,
-                    commit_identifiers=upsert.excluded.commit_identifiers
+                    commit_identifiers=upsert.excluded.commit_identifiers,
+                    content_hash=upsert.excluded.content_hash,
+                    organization_key=upsert.excluded.organization_key
+                )
+            )
+        ).rowcount
+
+    def update_sync_state_of_unchanged_work_items(session, work_items_temp):
+        # For existing items with no changes we only update the sync timestamps and the parent_id.
+        # None of these columns are indexed, so postgres can do this as a heap only update
+        # without touching the indexes or the toasted columns of the row.
+        return session.connection().execute(
+            work_items.update().values(
+                last_sync=work_items_temp.c.last_sync,
+                source_last_updated=work_items_temp.c.source_last_updated,
+                parent_id=work_items_temp.c.parent_id
+            ).where(
+                and_(
+                    work_items.c.work_items_source_id == work_items_temp.c.work_items_source_id,
+                    work_items.c.source_id == work_items_temp.c.source_id,
+                    work_items_temp.c.is_new == False,
+                    work_items_temp.c.has_changes == False,
+                    in_batch
                 )
             )
         ).rowcount
@@ -170,26 +331,27 @@ def sync_work_items(work_items_source_key, work_item_list, join_this=None):
             work_items_temp.c.key,
             work_items.c.id.label('parent_id')
         ]).select_from(
-            # we are loading all work items_sources from the parent organization
+            # we are searching all work items from the parent organization
             # here because we want to be able to link work items in one work items source to parents
-            # in another work items source.
-            work_items_sources.join(
+            # in another work items source. The lookup uses the index on (organization_key, source_display_id)
+            work_items_temp.join(
                 work_items,
                 and_(
-                    work_items.c.work_items_source_id == work_items_sources.c.id,
-                    work_items_sources.c.organization_key == work_items_source.organization_key
+                    work_items.c.organization_key == work_items_source.organization_key,
+                    work_items.c.source_display_id == work_items_temp.c.parent_source_display_id
                 )
-            ).join(
-                work_items_temp,
-                work_items_temp.c.parent_source_display_id == work_items.c.source_display_id
             )
-
+        ).where(
+            in_batch
         ).cte()
         return session.connection().execute(
             work_items_temp.update().values(
                 parent_id=existing_parents.c.parent_id
             ).where(
-                work_items_temp.c.key == existing_parents.c.key
+                and_(
+                    work_items_temp.c.key == existing_parents.c.key,
+                    in_batch
+                )
             )
         ).rowcount
 
@@ -203,17 +365,19 @@ def sync_work_items(work_items_source_key, work_item_list, join_this=None):
             work_items.c.key,
             parent_work_items.c.id.label('parent_id')
         ]).select_from(
-            work_items.join(
-                work_items_sources, work_items.c.work_items_source_id == work_items_sources.c.id
-            ).join(
-                work_items_temp,
-                work_items.c.parent_source_display_id == work_items_temp.c.source_display_id
+            # The lookup of children uses the index on (organization_key, parent_source_display_id)
+            work_items_temp.join(
+                work_items,
+                and_(
+                    work_items.c.organization_key == work_items_source.organization_key,
+                    work_items.c.parent_source_display_id == work_items_temp.c.source_display_id
+                )
             ).join(
                 parent_work_items,
                 work_items_temp.c.key == parent_work_items.c.key
             )
         ).where(
-            work_items_sources.c.organization_key == work_items_source.organization_key
+            in_batch
         ).alias()
 
         # now update the parent id of these children in the work items table
@@ -233,17 +397,20 @@ def sync_work_items(work_items_source_key, work_item_list, join_this=None):
         work_items_temp_column_names = [column.name for column in work_items_temp.columns]
         work_items_temp_columns = [column for column in work_items.columns if
                                    column.name in work_items_temp_column_names]
+        batch_columns = [literal(batch_id, UUID(as_uuid=True)).label('batch_id')] if batch_id is not None else []
         insert_children_with_newly_resolved_parents_into_work_items_temp = \
             insert(work_items_temp).from_select(
                 [
                     *[column.name for column in work_items_temp_columns],
                     'is_new',
-                    'has_changes'
+                    'has_changes',
+                    *[column.name for column in batch_columns]
                 ],
                 select([
                     *work_items_temp_columns,
                     literal(False).label('is_new'),
-                    literal(True).label('has_changes')
+                    literal(True).label('has_changes'),
+                    *batch_columns
 
                 ]).select_from(
                     work_items.join(
@@ -258,114 +425,189 @@ def sync_work_items(work_items_source_key, work_item_list, join_this=None):
             # but we always want to choose the original item in temp table because it has the
             # correct value of  the is_new flag so we ignore duplicate insertions.
             insert_children_with_newly_resolved_parents_into_work_items_temp.on_conflict_do_nothing(
-                index_elements=['source_id'],
+                index_elements=['source_id'] if batch_id is None else ['batch_id', 'source_id'],
             )
         ).rowcount
 
     # main body
+    if ingest_mode is None:
+        ingest_mode = config.get('work_items_sync_ingest_mode', SyncIngestMode.insert.value)
+    elif isinstance(ingest_mode, SyncIngestMode):
+        ingest_mode = ingest_mode.value
+
+    if skip_unchanged is None:
+        skip_unchanged = str(config.get('work_items_sync_skip_unchanged', True)).lower() == 'true'
+
+    if staging_mode is None:
+        staging_mode = config.get('work_items_sync_staging_mode', SyncStagingMode.temp_table.value)
+    elif isinstance(staging_mode, SyncStagingMode):
+        staging_mode = staging_mode.value
+
     if len(work_item_list) > 0:
         with db.orm_session(join_this) as session:
             work_items_source = WorkItemsSource.find_by_key(session, work_items_source_key)
             logger.info(f"sync_work_items: {work_items_source.name} started")
-            work_items_temp = db.temp_table_from(
-                work_items,
-                table_name='work_items_temp',
-                exclude_columns=[work_items.c.id],
-                extra_columns=[
-                    Column('is_new', Boolean),
-                    Column('has_changes', Boolean)
-                ]
-            )
-            UniqueConstraint(work_items_temp.c.source_id)
-
-            # step: 0
-            work_items_temp.create(session.connection(), checkfirst=True)
-
-            # step: 1 Stage the incoming items
-            incoming = insert_incoming_into_work_items_temp(session, work_item_list, work_items_source, work_items_temp)
-            logger.info(f"sync_work_items_source: {incoming} rows inserted into temp table")
-
-            # step: 2 Mark new items
-            existing_items = mark_existing_work_items_in_temp_table(session, work_items_temp)
-            logger.info(
-                f"sync_work_items: there {existing_items} existing items and {len(work_item_list) - existing_items} new items")
-
-            # step: 3 Mark unchanged items
-            unchanged = mark_unchanged_work_items_in_temp_table(session, work_items_temp)
-            logger.info(
-                f"sync_work_items: {unchanged} existing items have no changes")
-
-            # step 3: parent resolution phase 1
-            # this marks the parent_ids of children in the temp table with parent in work items
-            # this is the case where the child arrives before the parent or with the parent
-            incoming_parents_resolved = resolve_children_in_temp_table_with_parents_in_work_items(session,
-                                                                                                  work_items_source,
-                                                                                                  work_items_temp)
-            logger.info(f"sync_work_items: parent resolution phase 1 - "
-                        f"{incoming_parents_resolved} items in the incoming list had existing parents in  work items")
-
-            # step: 4 upsert the temp table into work items
-            upserts = upsert_temp_table_items_into_work_items(session, work_items_temp)
-            logger.info(
-                f"sync_work_items: {upserts} items upserted into work items")
-
-            # step 5: parent resolution phase 2
-            # this marks the parent_ids of the children in work_items with parent in the temp table
-            # This is the case when the child arrives before the parent.
-
-            # Note: that this potentially inserts existing items into temp table as the newly updated children
-            # need to be returned as updated work items in the result of the sync.
-            existing_work_items_resolved = resolve_children_in_work_items_with_parents_in_temp_table(session,
-                                                                                                     work_items_source,
-                                                                                                     work_items_temp)
-            logger.info(f"sync_work_items: {existing_work_items_resolved} existing work items had parent id resolved"
-                        f" from items in the incoming list. These will be added to the resolution lists and marked as updated for"
-                        f" downstream processing ")
+            staged_items = stage_incoming_work_items(work_item_list, work_items_source)
+
+            unchanged_source_ids = set()
+            if skip_unchanged:
+                unchanged_source_ids = find_unchanged_incoming_work_items(session, work_items_source, staged_items)
+                if len(unchanged_source_ids) > 0:
+                    staged_items = [
+                        staged_item for staged_item in staged_items
+                        if staged_item['source_id'] not in unchanged_source_ids
+                    ]
+                    logger.info(f"sync_work_items: {len(unchanged_source_ids)} unchanged items skipped")
+
+            sync_result = []
+            if len(staged_items) > 0:
+                # step: 0
+                if staging_mode == SyncStagingMode.staging_table.value:
+                    # The staging table is shared by all syncs, so every operation on it
+                    # is restricted to the rows of this batch.
+                    batch_id = uuid.uuid4()
+                    work_items_temp = work_items_staging
+                    in_batch = work_items_temp.c.batch_id == batch_id
+                    for staged_item in staged_items:
+                        staged_item['batch_id'] = batch_id
+                else:
+                    batch_id = None
+                    work_items_temp = db.temp_table_from(
+                        work_items,
+                        table_name='work_items_temp',
+                        exclude_columns=[work_items.c.id],
+                        extra_columns=[
+                            Column('is_new', Boolean),
+                            Column('has_changes', Boolean)
+                        ]
+                    )
+                    UniqueConstraint(work_items_temp.c.source_id)
+                    in_batch = true()
+                    work_items_temp.create(session.connection(), checkfirst=True)
+
+                # step: 1 Stage the incoming items
+                incoming = insert_incoming_into_work_items_temp(session, staged_items, work_items_temp)
+                logger.info(f"sync_work_items_source: {incoming} rows inserted into temp table")
+
+                # step: 2 Mark new items
+                existing_items = mark_existing_work_items_in_temp_table(session, work_items_temp)
+                logger.info(
+                    f"sync_work_items: there {existing_items} existing items and {len(staged_items) - existing_items} new items")
+
+                # step: 3 Mark unchanged items
+                unchanged = mark_unchanged_work_items_in_temp_table(session, work_items_temp)
+                logger.info(
+                    f"sync_work_items: {unchanged} existing items have no changes")
+
+                # step 3: parent resolution phase 1
+                # this marks the parent_ids of children in the temp table with parent in work items
+                # this is the case where the child arrives before the parent or with the parent
+                incoming_parents_resolved = resolve_children_in_temp_table_with_parents_in_work_items(session,
+                                                                                                      work_items_source,
+                                                                                                      work_items_temp)
+                logger.info(f"sync_work_items: parent resolution phase 1 - "
+                            f"{incoming_parents_resolved} items in the incoming list had existing parents in  work items")
+
+                # step: 4 upsert the temp table into work items
+                upserts = upsert_temp_table_items_into_work_items(session, work_items_temp)
+                logger.info(
+                    f"sync_work_items: {upserts} items upserted into work items")
+
+                # step: 4a update the sync state of the unchanged items
+                sync_state_updates = update_sync_state_of_unchanged_work_items(session, work_items_temp)
+                logger.info(
+                    f"sync_work_items: {sync_state_updates} unchanged items had their sync state updated")
+
+                # step 5: parent resolution phase 2
+                # this marks the parent_ids of the children in work_items with parent in the temp table
+                # This is the case when the child arrives before the parent.
+
+                # Note: that this potentially inserts existing items into temp table as the newly updated children
+                # need to be returned as updated work items in the result of the sync.
+                existing_work_items_resolved = resolve_children_in_work_items_with_parents_in_temp_table(session,
+                                                                                                         work_items_source,
+                                                                                                         work_items_temp)
+                logger.info(f"sync_work_items: {existing_work_items_resolved} existing work items had parent id resolved"
+                            f" from items in the incoming list. These will be added to the resolution lists and marked as updated for"
+                            f" downstream processing ")
+
+
+                # Parents may be in other work items sources in the organization, but we only need to look up
+                # the keys of the parents of the returned rows, which we can do by primary key.
+                parent_work_items = work_items.alias()
+
+                # Return the current state of the work_items in the work_items_temp_table.
+                # include the is_new flag from the temp table.
+                # Since we can potentially insert new items into work_items_temp as a
+                # side effect of resolving parents of existing items, this
+                # means that the size of the result set from this operation can be
+                # bigger than the input list of this operation.
+                #
+                # For example, a single
+                # new epic arriving after all it's children have arrived could lead
+                # to the epic and all its children being returned as the changed items from this
+                # sync operation.
+                #
+                # This is the correct behavior
+                #
+                # Each row in the temp table matches exactly one work item on (work_items_source_id, source_id),
+                # so there are no duplicates to remove from the result.
+                sync_result.extend(session.connection().execute(
+                    select([
+                        work_items,
+                        work_items_sources.c.key.label('work_items_source_key'),
+                        parent_work_items.c.key.label('parent_key'),
+                        work_items_temp.c.is_new,
+                        work_items_temp.c.has_changes
+                    ]
+                    ).select_from(
+                        work_items_temp.join(
+                            work_items,
+                            and_(
+                                work_items_temp.c.work_items_source_id == work_items.c.work_items_source_id,
+                                work_items_temp.c.source_id == work_items.c.source_id
+                            )
+                        ).join(
+                            work_items_sources, work_items.c.work_items_source_id == work_items_sources.c.id
+                        ).outerjoin(
+                            parent_work_items,
+                            work_items.c.parent_id == parent_work_items.c.id
+                        )
+                    ).where(
+                        in_batch
+                    )
+                ).fetchall())
 
+                if batch_id is not None:
+                    # step: 6 clean up the staged rows of this batch
+                    session.connection().execute(
+                        work_items_staging.delete().where(in_batch)
+                    )
 
-            # we load all the work_items in the organization as the search set for parents
-            # since we need to consider cross project parents.
-            parent_work_items = select([work_items.c.id, work_items.c.key]).select_from(
-                work_items.join(
-                    work_items_sources, work_items.c.work_items_source_id == work_items_sources.c.id
-                )
-            ).where(
-                work_items_sources.c.organization_key == work_items_source.organization_key
-            ).alias()
-
-            # Return the current state of the work_items in the work_items_temp_table.
-            # include the is_new flag from the temp table.
-            # Since we can potentially insert new items into work_items_temp as a
-            # side effect of resolving parents of existing items, this
-            # means that the size of the result set from this operation can be
-            # bigger than the input list of this operation.
-            #
-            # For example, a single
-            # new epic arriving after all it's children have arrived could lead
-            # to the epic and all its children being returned as the changed items from this
-            # sync operation.
-            #
-            # This is the correct behavior
-            sync_result = session.connection().execute(
-                select([
-                    work_items,
-                    work_items_sources.c.key.label('work_items_source_key'),
-                    parent_work_items.c.key.label('parent_key'),
-                    work_items_temp.c.is_new,
-                    work_items_temp.c.has_changes
-                ]
-                ).distinct().select_from(
-                    work_items_temp.join(
+            if len(unchanged_source_ids) > 0:
+                # The skipped items are still part of the result, as existing items with no updates.
+                parent_work_items = work_items.alias()
+                sync_result.extend(session.connection().execute(
+                    select([
                         work_items,
-                        work_items_temp.c.source_id == work_items.c.source_id
-                    ).join(
-                        work_items_sources, work_items.c.work_items_source_id == work_items_sources.c.id
-                    ).outerjoin(
-                        parent_work_items,
-                        work_items.c.parent_id == parent_work_items.c.id
+                        work_items_sources.c.key.label('work_items_source_key'),
+                        parent_work_items.c.key.label('parent_key'),
+                        literal(False).label('is_new'),
+                        literal(False).label('has_changes')
+                    ]).select_from(
+                        work_items.join(
+                            work_items_sources, work_items.c.work_items_source_id == work_items_sources.c.id
+                        ).outerjoin(
+                            parent_work_items,
+                            work_items.c.parent_id == parent_work_items.c.id
+                        )
+                    ).where(
+                        and_(
+                            work_items.c.work_items_source_id == work_items_source.id,
+                            work_items.c.source_id.in_(list(unchanged_source_ids))
+                        )
                     )
-                )
-            ).fetchall()
+                ).fetchall())
             logger.info(
                 f"sync_work_items result:{len(work_item_list)} incoming items, {len(sync_result)} outgoing items")
             logger.info(f"sync_work_items: {work_items_source.name} completed")
@@ -468,28 +710,108 @@ def sync_work_item(work_items_source_key, work_item_data, join_this=None):
     return sync_work_items(work_items_source_key, [work_item_data], join_this) or []
 
 
-def get_work_items_sources_to_sync():
-    with db.create_session() as session:
+def claim_work_items_sources_to_sync(max_sources=None):
+    """
+    Lease the auto update sources whose next sync is due and that do not already have a sync in flight.
+
+    The lease is taken in the same statement that finds the due sources, and sources that are locked by a
+    concurrent claim are skipped, so a source is never handed out twice. The sync renews the lease as each page
+    of work items is synced, and releases it when it finishes and schedules the next one. If the sync dies, the
+    lease expires work_items_sources_sync_lease_secs after the last page it synced.
+
+    :return: the organization_key and work_items_source_key of each leased source, most overdue first.
+    """
+    if max_sources is None:
+        max_sources = int(config.get('work_items_sources_max_syncs_per_poll', 500))
+    lease_seconds = int(config.get('work_items_sources_sync_lease_secs', 1800))
+    now = datetime.utcnow()
+
+    with db.orm_session() as session:
+        due_sources = select([
+            work_items_sources.c.id
+        ]).where(
+            and_(
+                work_items_sources.c.project_id != None,
+                work_items_sources.c.integration_type.in_([
+                    WorkTrackingIntegrationType.jira.value
+                ]),
+                work_items_sources.c.import_state == WorkItemsSourceImportState.auto_update.value,
+                or_(
+                    work_items_sources.c.next_sync_at == None,
+                    work_items_sources.c.next_sync_at <= now
+                ),
+                or_(
+                    work_items_sources.c.sync_leased_until == None,
+                    work_items_sources.c.sync_leased_until <= now
+                )
+            )
+        ).order_by(
+            work_items_sources.c.next_sync_at.asc().nullsfirst()
+        ).limit(
+            max_sources
+        ).with_for_update(
+            skip_locked=True
+        )
+
+        leased = session.connection().execute(
+            work_items_sources.update().values(
+                sync_leased_until=now + timedelta(seconds=lease_seconds)
+            ).where(
+                work_items_sources.c.id.in_(due_sources)
+            ).returning(
+                work_items_sources.c.key,
+                work_items_sources.c.organization_key,
+                work_items_sources.c.next_sync_at
+            )
+        ).fetchall()
+
         return [
             dict(
                 organization_key=row.organization_key,
-                work_items_source_key=row.key,
+                work_items_source_key=row.key
             )
-            for row in session.connection.execute(
-                select([
-                    work_items_sources.c.key,
-                    work_items_sources.c.organization_key
-                ]).where(
-                    and_(
-                        work_items_sources.c.project_id != None,
-                        work_items_sources.c.integration_type.in_([
-                            WorkTrackingIntegrationType.jira.value
-                        ]),
-                        work_items_sources.c.import_state == WorkItemsSourceImportState.auto_update.value
+            for row in sorted(leased, key=lambda row: (row.next_sync_at is not None, row.next_sync_at))
+        ]
+
+
+def advance_sync_watermark(work_items_source_key, latest_updated_at, latest_source_id, join_this=None):
+    """
+    Moves the sync watermark of the work items source forward to the given update timestamp.
+
+    This is only called by poll syncs once all the pages of the sync have been synced: webhooks and other partial
+    syncs must not advance it, since the next poll only asks the source for work items updated after it.
+    """
+    with db.orm_session(join_this) as session:
+        return session.connection().execute(
+            work_items_sources.update().values(
+                latest_work_item_updated_at=latest_updated_at,
+                latest_updated_work_item_source_id=latest_source_id
+            ).where(
+                and_(
+                    work_items_sources.c.key == work_items_source_key,
+                    or_(
+                        work_items_sources.c.latest_work_item_updated_at == None,
+                        work_items_sources.c.latest_work_item_updated_at < latest_updated_at
                     )
                 )
-            ).fetchall()
-        ]
+            )
+        ).rowcount
+
+
+def renew_sync_lease(work_items_source_key):
+    # Extends the lease of a sync that is still in flight. Sources that are not leased are left alone.
+    lease_seconds = int(config.get('work_items_sources_sync_lease_secs', 1800))
+    with db.orm_session() as session:
+        return session.connection().execute(
+            work_items_sources.update().values(
+                sync_leased_until=datetime.utcnow() + timedelta(seconds=lease_seconds)
+            ).where(
+                and_(
+                    work_items_sources.c.key == work_items_source_key,
+                    work_items_sources.c.sync_leased_until != None
+                )
+            )
+        ).rowcount
 
 
 def get_parameters(work_items_source_input):
@@ -559,6 +881,7 @@ def move_work_item(source_work_items_source_key, target_work_items_source_key, w
                         parent_key = None
                 work_item_data['is_moved_from_current_source'] = False
                 is_moved = work_item.update(work_item_data)
+                work_item.organization_key = target_work_items_source.organization_key
                 session.flush()
                 work_item = session.connection().execute(
                     select([work_items]).where(
@@ -625,6 +948,262 @@ def delete_work_item(work_items_source_key, work_item_data, join_this=None):
             raise ProcessingException(f"Could not find work items source with key f{work_items_source_key}")
 
 
+def claimable_work_item_events(now):
+    # Events that are not claimed by a flush, or whose claim has lapsed.
+    return or_(
+        work_item_events.c.claim_token == None,
+        work_item_events.c.claimed_until <= now
+    )
+
+
+def buffer_work_item_event(work_items_source_key, source_id, event_type, payload, join_this=None):
+    """
+    Buffer an event for a work item so that it can be synced along with other pending events
+    for the same work items source. A pending event for the same work item is replaced by this one, and
+    if that event is claimed by a flush in progress, the replacement drops the claim so it is synced by the next flush.
+
+    Flushes only hold locks on events for the short transaction in which they claim them, so buffering
+    does not wait on the sync of a flush.
+
+    :return: True if the caller should schedule a flush of the pending events. This is the case if there were
+    no unclaimed events pending, or the oldest of them is more than work_item_events_flush_after_secs old,
+    which means the flush scheduled for it was lost.
+    """
+    flush_after_seconds = int(config.get('work_item_events_flush_after_secs', 60))
+    with db.orm_session(join_this) as session:
+        work_items_source = WorkItemsSource.find_by_key(session, work_items_source_key)
+        if work_items_source is None:
+            raise ProcessingException(f"Could not find work items source with key {work_items_source_key}")
+
+        now = datetime.utcnow()
+        pending, oldest_pending = session.connection().execute(
+            select([func.count(work_item_events.c.id), func.min(work_item_events.c.received_at)]).where(
+                and_(
+                    work_item_events.c.work_items_source_id == work_items_source.id,
+                    claimable_work_item_events(now)
+                )
+            )
+        ).fetchone()
+
+        upsert = insert(work_item_events).values(
+            work_items_source_id=work_items_source.id,
+            source_id=source_id,
+            event_type=event_type,
+            payload=payload,
+            received_at=now,
+            attempts=0
+        )
+        session.connection().execute(
+            upsert.on_conflict_do_update(
+                index_elements=['work_items_source_id', 'source_id'],
+                set_=dict(
+                    event_type=upsert.excluded.event_type,
+                    payload=upsert.excluded.payload,
+                    received_at=upsert.excluded.received_at,
+                    claim_token=None,
+                    claimed_until=None,
+                    attempts=0
+                )
+            )
+        )
+        return pending == 0 or oldest_pending <= now - timedelta(seconds=flush_after_seconds)
+
+
+def discard_work_item_events(work_items_source_key, source_ids, join_this=None):
+    with db.orm_session(join_this) as session:
+        work_items_source = WorkItemsSource.find_by_key(session, work_items_source_key)
+        if work_items_source is not None:
+            return session.connection().execute(
+                work_item_events.delete().where(
+                    and_(
+                        work_item_events.c.work_items_source_id == work_items_source.id,
+                        work_item_events.c.source_id.in_(source_ids)
+                    )
+                )
+            ).rowcount
+
+
+def flush_work_item_events(work_items_source_key, map_event, max_events=None):
+    """
+    Sync the pending events for a work items source in a single sync_work_items call.
+
+    The flush runs in separate transactions so that webhooks never wait on the sync:
+    the events are claimed with a token for work_item_events_claim_secs and the claim is committed,
+    the claimed events are synced, and then the events that still carry the token are deleted. Events replaced
+    by a webhook in the meantime have lost the claim and stay pending.
+
+    An event that fails to map is logged and dropped rather than failing the flush. If the sync fails, the claim
+    on the events is extended with an exponential backoff from work_item_events_retry_secs, and events that
+    have failed work_item_events_max_attempts times are dropped.
+
+    :param map_event: a function that maps a buffered event to work item data. Events that map to None are dropped.
+    :param max_events: the maximum number of events to flush.
+    :return: a dict with the result of the sync, the source ids of the events that could not be mapped
+    and the number of events still pending
+    """
+    claim_token = uuid.uuid4()
+    claim_seconds = int(config.get('work_item_events_claim_secs', 300))
+
+    with db.orm_session() as session:
+        work_items_source = WorkItemsSource.find_by_key(session, work_items_source_key)
+        if work_items_source is None:
+            raise ProcessingException(f"Could not find work items source with key {work_items_source_key}")
+        work_items_source_id = work_items_source.id
+
+        now = datetime.utcnow()
+        events_to_claim = select([
+            work_item_events.c.id
+        ]).where(
+            and_(
+                work_item_events.c.work_items_source_id == work_items_source_id,
+                claimable_work_item_events(now)
+            )
+        ).order_by(
+            work_item_events.c.received_at
+        ).limit(
+            max_events
+        ).with_for_update(
+            skip_locked=True
+        )
+        events = sorted(
+            session.connection().execute(
+                work_item_events.update().values(
+                    claim_token=claim_token,
+                    claimed_until=now + timedelta(seconds=claim_seconds)
+                ).where(
+                    work_item_events.c.id.in_(events_to_claim)
+                ).returning(
+                    *work_item_events.columns
+                )
+            ).fetchall(),
+            key=lambda event: event.received_at
+        )
+
+    claimed = and_(
+        work_item_events.c.work_items_source_id == work_items_source_id,
+        work_item_events.c.claim_token == claim_token
+    )
+    try:
+        with db.orm_session() as session:
+            work_items_source = WorkItemsSource.find_by_key(session, work_items_source_key)
+            work_item_list = []
+            failed = []
+            for event in events:
+                try:
+                    work_item_data = map_event(work_items_source, event)
+                except ProcessingException as exc:
+                    logger.error(f"flush_work_item_events: dropping event for {event.source_id}: {str(exc)}")
+                    failed.append(event.source_id)
+                    continue
+                if work_item_data is not None:
+                    work_item_list.append(work_item_data)
+
+            sync_result = sync_work_items(work_items_source.key, work_item_list, join_this=session) or []
+            result = dict(
+                organization_key=work_items_source.organization_key,
+                work_items_source_key=work_items_source.key,
+                work_items=sync_result,
+                failed=failed
+            )
+            name = work_items_source.name
+    except Exception:
+        release_failed_work_item_events(claimed)
+        raise
+
+    with db.orm_session() as session:
+        session.connection().execute(
+            work_item_events.delete().where(claimed)
+        )
+
+    # read after the delete has committed, so that events buffered while we were syncing are counted.
+    with db.orm_session() as session:
+        remaining = session.connection().execute(
+            select([func.count(work_item_events.c.id)]).where(
+                and_(
+                    work_item_events.c.work_items_source_id == work_items_source_id,
+                    claimable_work_item_events(datetime.utcnow())
+                )
+            )
+        ).scalar()
+
+    logger.info(f"flush_work_item_events: {name} {len(events)} events flushed, "
+                f"{len(failed)} dropped, {remaining} pending")
+    return dict(
+        **result,
+        remaining=remaining
+    )
+
+
+def release_failed_work_item_events(claimed):
+    # Back off the events of a failed flush by extending their claim, and give up on the
+    # events that have failed too many times.
+    max_attempts = int(config.get('work_item_events_max_attempts', 5))
+    retry_seconds = int(config.get('work_item_events_retry_secs', 30))
+    with db.orm_session() as session:
+        dropped = session.connection().execute(
+            work_item_events.delete().where(
+                and_(
+                    claimed,
+                    work_item_events.c.attempts >= max_attempts - 1
+                )
+            ).returning(
+                work_item_events.c.source_id
+            )
+        ).fetchall()
+        if len(dropped) > 0:
+            logger.error(f"flush_work_item_events: dropping events for {[row.source_id for row in dropped]} "
+                         f"after {max_attempts} failed attempts")
+
+        session.connection().execute(
+            work_item_events.update().values(
+                attempts=work_item_events.c.attempts + 1,
+                claimed_until=datetime.utcnow() + func.make_interval(
+                    0, 0, 0, 0, 0, 0, retry_seconds * func.power(2, work_item_events.c.attempts)
+                )
+            ).where(
+                claimed
+            )
+        )
+
+
+def get_work_items_sources_with_stale_events(flush_after_seconds=None, join_this=None):
+    """
+    Find the work items sources whose oldest unclaimed event is more than flush_after_seconds old.
+
+    These are buffers whose flush was lost, or whose failed flush has backed off and is due to be retried.
+
+    :return: the organization_key and work_items_source_key of each source
+    """
+    if flush_after_seconds is None:
+        flush_after_seconds = int(config.get('work_item_events_flush_after_secs', 60))
+
+    now = datetime.utcnow()
+    with db.orm_session(join_this) as session:
+        return [
+            dict(
+                organization_key=row.organization_key,
+                work_items_source_key=row.key
+            )
+            for row in session.connection().execute(
+                select([
+                    work_items_sources.c.organization_key,
+                    work_items_sources.c.key
+                ]).select_from(
+                    work_items_sources.join(
+                        work_item_events, work_item_events.c.work_items_source_id == work_items_sources.c.id
+                    )
+                ).where(
+                    claimable_work_item_events(now)
+                ).group_by(
+                    work_items_sources.c.organization_key,
+                    work_items_sources.c.key
+                ).having(
+                    func.min(work_item_events.c.received_at) <= now - timedelta(seconds=flush_after_seconds)
+                )
+            ).fetchall()
+        ]
+
+
 def sync_work_items_sources(connector, work_items_sources_list, join_this=None):
     if len(work_items_sources_list) > 0:
         with db.orm_session(join_this) as session:
@@ -734,6 +1313,14 @@ def import_project(
                     work_items_source.parameters = import_days_param
 
                 work_items_source.organization_key = organization_key
+                # keep the organization_key denormalized on the work items in sync
+                session.connection().execute(
+                    work_items.update().values(
+                        organization_key=organization_key
+                    ).where(
+                        work_items.c.work_items_source_id == work_items_source.id
+                    )
+                )
                 if work_items_source.account_key is None:
                     work_items_source.account_key = account_key
 
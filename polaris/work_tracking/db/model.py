@@ -9,14 +9,18 @@
 # Author: Krishna Kumar
 
 
+import hashlib
+import json
 import logging
-from datetime import datetime
+import random
+import uuid
+from datetime import datetime, date, timedelta
 
 logger = logging.getLogger('polaris.work_tracking.db.model')
 
 from sqlalchemy import \
     Index, Column, BigInteger, Integer, String, Text, DateTime, \
-    Boolean, MetaData, ForeignKey, and_, UniqueConstraint, cast, text
+    Boolean, MetaData, ForeignKey, Table, and_, UniqueConstraint, cast, text, event, true
 
 from polaris.utils.config import get_config_provider
 from polaris.utils.collections import dict_merge
@@ -100,6 +104,16 @@ class WorkItemsSource(Base):
 
     # Sync Status: the last point at which work items from this source were synced with the source system.
     last_synced = Column(DateTime, nullable=True)
+    # Sync watermark: the latest source_last_updated timestamp of the work items synced from this source
+    # and the source_id of the work item it belongs to. These are maintained by sync_work_items.
+    latest_work_item_updated_at = Column(DateTime, nullable=True)
+    latest_updated_work_item_source_id = Column(String, nullable=True)
+    # Sync schedule: the sync agent queues a sync for the source once next_sync_at is due. The interval between
+    # syncs adapts to how often the source changes, and sync_leased_until is set while a sync is in flight so that
+    # the source is not queued again until that sync finishes or the lease expires.
+    next_sync_at = Column(DateTime, nullable=True)
+    sync_interval_seconds = Column(Integer, nullable=True)
+    sync_leased_until = Column(DateTime, nullable=True)
 
     # Source data
     # The unique id of this work_items_source in the source system.
@@ -174,6 +188,85 @@ class WorkItemsSource(Base):
                 desc=True
             )
 
+    """
+        Streams the work items for the given work items source in batches, in descending id order.
+
+        This reads through a server side cursor and only projects the columns that remapping
+        work items needs, so it is much lighter than paging through WorkItem instances.
+
+        :param work_items_source_key: Key of the work items source
+        :param columns: Names of any additional work_items columns to project
+        :param batch_size: Size of the batch
+        :param id_range: An optional (highest, lowest) pair of work item ids to limit the stream to, inclusive
+        :param join_this: Session to join
+        :return: A generator of lists of rows with id, source_display_id, api_payload and the additional columns
+    """
+    @classmethod
+    def stream_work_items_batches(cls, work_items_source_key, columns=None, batch_size=1000, id_range=None,
+                                  join_this=None):
+        work_items = WorkItem.__table__
+        projection = [work_items.c.id, work_items.c.source_display_id, work_items.c.api_payload]
+        for column in columns or []:
+            if column in work_items.c and work_items.c[column] not in projection:
+                projection.append(work_items.c[column])
+
+        with db.orm_session(join_this) as session:
+            work_items_source = cls.find_by_key(session, work_items_source_key)
+            in_range = true()
+            if id_range is not None:
+                highest, lowest = id_range
+                in_range = work_items.c.id.between(lowest, highest)
+
+            result = session.connection().execution_options(stream_results=True).execute(
+                select(projection).where(
+                    and_(
+                        work_items.c.work_items_source_id == work_items_source.id,
+                        in_range
+                    )
+                ).order_by(
+                    work_items.c.id.desc()
+                )
+            )
+            try:
+                while True:
+                    rows = result.fetchmany(batch_size)
+                    if len(rows) == 0:
+                        break
+                    yield rows
+            finally:
+                result.close()
+
+    @classmethod
+    def work_item_id_ranges(cls, work_items_source_key, batch_size=1000, join_this=None):
+        """
+        Partitions the ids of the work items of the source into ranges of batch_size work items.
+
+        :return: a list of (highest, lowest) id pairs, in descending id order
+        """
+        work_items = WorkItem.__table__
+        with db.orm_session(join_this) as session:
+            work_items_source = cls.find_by_key(session, work_items_source_key)
+            numbered = select([
+                work_items.c.id,
+                ((func.row_number().over(order_by=work_items.c.id.desc()) - 1) / batch_size).label('batch')
+            ]).where(
+                work_items.c.work_items_source_id == work_items_source.id
+            ).alias()
+
+            return [
+                (row.highest, row.lowest)
+                for row in session.connection().execute(
+                    select([
+                        func.max(numbered.c.id).label('highest'),
+                        func.min(numbered.c.id).label('lowest')
+                    ]).group_by(
+                        numbered.c.batch
+                    ).order_by(
+                        numbered.c.batch
+                    )
+                ).fetchall()
+            ]
+
     @classmethod
     def populate_required_values(self, work_item_source):
         required_values_with_defaults = dict(
@@ -196,29 +289,13 @@ class WorkItemsSource(Base):
 
     @property
     def latest_work_item_update_timestamp(self):
-        return object_session(self).scalar(
-            select([func.max(work_items.c.source_last_updated)]).where(
-                work_items.c.work_items_source_id == self.id
-            )
-        )
+        # The sync watermark is maintained on the source itself (and backfilled for existing sources
+        # by the migration that added it), so this works for detached and cached instances too.
+        return self.latest_work_item_updated_at
 
     @property
     def most_recently_updated_work_item_source_id(self):
-        return object_session(self).scalar(
-            select(
-                [work_items.c.source_id]
-            ).where(
-                and_(
-                    work_items.c.source_last_updated ==
-                    select(
-                        [func.max(work_items.c.source_last_updated)]
-                    ).where(
-                        work_items.c.work_items_source_id == self.id
-                    ).alias(),
-                    work_items.c.work_items_source_id == self.id
-                )
-            )
-        )
+        return self.latest_updated_work_item_source_id
 
     def get_summary_info(self):
         return dict(
@@ -238,11 +315,44 @@ class WorkItemsSource(Base):
         )
 
     def should_sync(self, sync_interval=int(config.get('work_items_sources_min_secs_between_syncs', 30))):
-        return self.last_synced is None or (datetime.utcnow() - self.last_synced).total_seconds() > sync_interval
+        now = datetime.utcnow()
+        if self.sync_leased_until is not None and self.sync_leased_until > now:
+            return False
+        if self.next_sync_at is not None:
+            return self.next_sync_at <= now
+        return self.last_synced is None or (now - self.last_synced).total_seconds() > sync_interval
 
     def set_synced(self):
         self.last_synced = datetime.utcnow()
 
+    def schedule_next_sync(self, changes):
+        # Sources that had changes since the last sync are synced twice as often next time, and sources
+        # with no changes back off to half as often, within the min and max intervals. The jitter
+        # keeps sources that were scheduled together from all coming due at the same time.
+        min_interval = int(config.get('work_items_sources_min_secs_between_syncs', 30))
+        max_interval = int(config.get('work_items_sources_max_secs_between_syncs', 3600))
+        jitter = float(config.get('work_items_sources_sync_jitter', 0.1))
+
+        interval = self.sync_interval_seconds or min_interval
+        interval = interval / 2 if changes > 0 else interval * 2
+        self.sync_interval_seconds = int(min(max(interval, min_interval), max_interval))
+        self.next_sync_at = datetime.utcnow() + timedelta(
+            seconds=self.sync_interval_seconds * random.uniform(1 - jitter, 1 + jitter)
+        )
+        self.sync_leased_until = None
+
+    def schedule_sync_retry(self):
+        # A failed sync backs off like a sync that found no changes, so a source that keeps failing is
+        # retried at most once every max interval, and the lease is released so the retry can be queued.
+        self.schedule_next_sync(changes=0)
+
+    def take_sync_lease(self):
+        # Leases the source to a sync that was not claimed by the sync agent, such as a manual import,
+        # so that the agent does not queue another sync for the source while this one is in flight.
+        self.sync_leased_until = datetime.utcnow() + timedelta(
+            seconds=int(config.get('work_items_sources_sync_lease_secs', 1800))
+        )
+
     def update(self, work_items_source_data):
         updatable_fields = [
             'parameters',
@@ -293,6 +403,7 @@ class WorkItemsSource(Base):
 
 work_items_sources = WorkItemsSource.__table__
 UniqueConstraint(work_items_sources.c.connector_key, work_items_sources.c.source_id)
+Index('ix_work_items_sources_next_sync_at', work_items_sources.c.next_sync_at)
 
 
 class WorkItem(Base):
@@ -346,9 +457,17 @@ class WorkItem(Base):
     work_items_source_id = Column(Integer, ForeignKey('work_items_sources.id'))
     work_items_source = relationship('WorkItemsSource', back_populates='work_items')
 
+    # Denormalized from the work items source. Parents are resolved across all the work items sources
+    # in an organization, and this lets us do that lookup without joining through work_items_sources.
+    organization_key = Column(UUID(as_uuid=True), nullable=True)
+
     # Work Item Source Payload from API
     api_payload = Column(JSONB, nullable=True, default={}, server_default='{}')
 
+    # Hash of the content attributes of the work item. Used to detect unchanged items on sync
+    # without comparing the attributes (and the api payload in particular) one by one.
+    content_hash = Column(String, nullable=True)
+
     @classmethod
     def find_by_id(cls, session, id):
         return session.query(cls).filter(
@@ -399,6 +518,9 @@ class WorkItem(Base):
                 setattr(self, attribute, work_item_data.get(attribute))
                 updated = True
 
+        self.content_hash = work_item_content_hash(
+            {attribute: getattr(self, attribute) for attribute in work_item_content_attributes}
+        )
         self.last_sync = datetime.utcnow()
         self.source_last_updated = work_item_data.get('source_last_updated')
         return updated
@@ -407,8 +529,111 @@ class WorkItem(Base):
 work_items = WorkItem.__table__
 Index('ix_work_items_work_item_source_id_source_display_id', work_items.c.work_items_source_id,
       work_items.c.source_display_id)
+Index('ix_work_items_work_item_source_id_source_id_content_hash', work_items.c.work_items_source_id,
+      work_items.c.source_id, work_items.c.content_hash)
+Index('ix_work_items_organization_key_source_display_id', work_items.c.organization_key,
+      work_items.c.source_display_id)
+Index('ix_work_items_organization_key_parent_source_display_id', work_items.c.organization_key,
+      work_items.c.parent_source_display_id)
 UniqueConstraint(work_items.c.work_items_source_id, work_items.c.source_id)
 
+# These are the attributes of a work item whose changes are material to the rest of the app.
+# A sync that changes any of them is propagated downstream as an update.
+work_item_content_attributes = [
+    'name', 'description', 'is_bug', 'work_item_type', 'is_epic', 'tags', 'url', 'source_state',
+    'source_display_id', 'api_payload', 'work_items_source_id', 'commit_identifiers',
+    'parent_source_display_id', 'priority', 'releases', 'story_points', 'sprints', 'flagged', 'changelog'
+]
+
+
+def normalize_content_value(value):
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    return value
+
+
+def work_item_content_hash(work_item_data):
+    """
+    Compute the content hash of a work item from its content attributes.
+
+    work_item_data can be either a mapped work item dict or a row loaded from work_items. Attributes
+    missing from a mapped dict take the column default, so the hash of an item matches the hash of
+    the row it is stored as.
+    """
+    content = []
+    for attribute in work_item_content_attributes:
+        if attribute in work_item_data:
+            value = work_item_data[attribute]
+        else:
+            default = work_items.c[attribute].default
+            value = default.arg if default is not None and default.is_scalar else None
+        content.append(normalize_content_value(value))
+
+    return hashlib.sha256(
+        json.dumps(content, sort_keys=True, separators=(',', ':'), default=str).encode('utf-8')
+    ).hexdigest()
+
+
+class WorkItemEvent(Base):
+    __tablename__ = 'work_item_events'
+
+    # Buffers webhook events for work items so that bursts of events for the same work items source
+    # can be coalesced and synced together. There is at most one pending event per work item: a later
+    # event for the same work item replaces the earlier one.
+    id = Column(BigInteger, primary_key=True)
+    work_items_source_id = Column(Integer, ForeignKey('work_items_sources.id', ondelete='CASCADE'), nullable=False)
+    # source_id of the work item the event is for.
+    source_id = Column(String, nullable=False)
+    event_type = Column(String, nullable=False)
+    # the source system payload for the work item
+    payload = Column(JSONB, nullable=False)
+    received_at = Column(DateTime, nullable=False)
+    # A flush claims the events it syncs by stamping them with its token in a short transaction of its own,
+    # so webhooks that replace an event never wait on a flush. A replaced event loses its claim and stays pending.
+    claim_token = Column(UUID(as_uuid=True), nullable=True)
+    # the claim lapses at this time, so the events of a flush that died or failed are picked up again.
+    claimed_until = Column(DateTime, nullable=True)
+    # the number of flushes that failed to sync this event.
+    attempts = Column(Integer, nullable=False, default=0, server_default='0')
+
+
+work_item_events = WorkItemEvent.__table__
+UniqueConstraint(work_item_events.c.work_items_source_id, work_item_events.c.source_id)
+
+
+# Unlogged staging table for sync_work_items. This has the same columns as work_items, without the id and
+# constraints, and is shared by concurrent syncs: rows are keyed by a batch id that is unique to each sync and
+# are deleted at the end of the sync in the same transaction. Using this instead of a temp table per sync avoids
+# the catalog churn of creating and dropping tables under high webhook volumes.
+work_items_staging = Table(
+    'work_items_staging', Base.metadata,
+    Column('batch_id', UUID(as_uuid=True), nullable=False),
+    *[
+        Column(
+            column.name,
+            column.type,
+            nullable=True,
+            default=column.default.arg if column.default is not None else None
+        )
+        for column in work_items.columns if column.name != 'id'
+    ],
+    Column('is_new', Boolean),
+    Column('has_changes', Boolean),
+    UniqueConstraint('batch_id', 'source_id'),
+    prefixes=['UNLOGGED']
+)
+
+
+@event.listens_for(WorkItem, 'before_insert')
+def set_work_item_organization_key(mapper, connection, target):
+    # work items created through the orm pick up the organization_key from their work items source.
+    if target.organization_key is None and target.work_items_source is not None:
+        target.organization_key = target.work_items_source.organization_key
+
 
 def recreate_all(engine):
     Base.metadata.drop_all(engine)
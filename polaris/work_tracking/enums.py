@@ -30,3 +30,19 @@ class CustomTagMappingType(Enum):
     custom_field_populated = 'custom-field-populated'
 
     custom_field_value = 'custom-field-value'
+
+
+class SyncIngestMode(Enum):
+    # stage incoming work items using a multi-row insert ... values statement
+    insert = 'insert'
+
+    # stage incoming work items by streaming them into the staging table using COPY FROM STDIN
+    copy = 'copy'
+
+
+class SyncStagingMode(Enum):
+    # stage incoming work items in a temp table created for each sync
+    temp_table = 'temp_table'
+
+    # stage incoming work items in the shared unlogged work_items_staging table, keyed by a batch id per sync
+    staging_table = 'staging_table'
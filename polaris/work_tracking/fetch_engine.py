@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+
+# Copyright: © Exathink, LLC (2011-2026) All Rights Reserved
+
+# Unauthorized use or copying of this file and its contents, via any medium
+# is strictly prohibited. The work product in this file is proprietary and
+# confidential.
+
+# Author: Krishna Kumar
+
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from polaris.utils.config import get_config_provider
+
+logger = logging.getLogger('polaris.work_tracking.fetch_engine')
+config = get_config_provider()
+
+# marks the end of the pages for a source on the sync queue.
+end_of_pages = object()
+
+
+class AsyncPaginator:
+    """
+    Adapts the blocking page generator returned by a provider's fetch_work_items_to_sync
+    into an async iterator. Each page is fetched on the engine's thread pool while holding the
+    concurrency limit for the host the provider talks to, so the event loop is free to fetch pages
+    for other sources in the meantime.
+    """
+
+    def __init__(self, pages, host_limit, executor=None):
+        self.pages = pages
+        self.host_limit = host_limit
+        self.executor = executor
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        async with self.host_limit:
+            page = await asyncio.get_running_loop().run_in_executor(self.executor, next, self.pages, end_of_pages)
+        if page is end_of_pages:
+            raise StopAsyncIteration
+        return page
+
+
+class FetchEngine:
+    """
+    Drives imports for many work items sources concurrently.
+
+    One fetch task per source pages through the source's api and puts the pages on a bounded queue.
+    A single sync task drains the queue and writes each page to the database, so pages of a given
+    source are always synced in the order in which they were fetched. When the queue is full the
+    fetch tasks wait, so a slow database applies backpressure to the api calls.
+
+    Hosts are identified by connector key, since all the sources on a connector share the same api
+    host and credentials, and therefore the same rate limits.
+
+    The concurrency is across sources: the page generator of a source is advanced one page at a time,
+    so the pages of a single source are only fetched concurrently when the provider fans out its own
+    requests, as JiraProject does with startAt offsets for its initial import. The engine backs the
+    import_work_items_concurrently cli command; ImportWorkItems messages still sync a single source
+    each through commands.sync_work_items.
+    """
+
+    def __init__(self, max_requests_per_host=None, queue_size=None, max_threads=None):
+        self.max_requests_per_host = max_requests_per_host or int(
+            config.get('fetch_engine_max_requests_per_host', 4)
+        )
+        self.queue_size = queue_size or int(config.get('fetch_engine_queue_size', 16))
+        self.max_threads = max_threads or int(config.get('fetch_engine_max_threads', 16))
+        self.host_limits = dict()
+
+    def get_host_limit(self, host):
+        limit = self.host_limits.get(host)
+        if limit is None:
+            limit = asyncio.Semaphore(self.max_requests_per_host)
+            self.host_limits[host] = limit
+        return limit
+
+    async def fetch(self, source_key, host, pages, queue, executor, results):
+        try:
+            async for page in AsyncPaginator(pages, self.get_host_limit(host), executor):
+                if results[source_key]['error'] is not None:
+                    # the sync stage failed on an earlier page, so there is no point fetching the rest.
+                    return
+                await queue.put((source_key, page))
+        except Exception as exc:
+            logger.error(f'Failed to fetch work items for source {source_key}: {str(exc)}')
+            results[source_key]['error'] = str(exc)
+        else:
+            await queue.put((source_key, end_of_pages))
+
+    async def sync(self, queue, sync_page, finish_source, executor, results):
+        loop = asyncio.get_running_loop()
+        while True:
+            source_key, page = await queue.get()
+            try:
+                if source_key is None:
+                    return
+                if results[source_key]['error'] is not None:
+                    # a page for this source has already failed, so we discard the rest of its pages.
+                    continue
+                if page is end_of_pages:
+                    results[source_key]['finished'] = await loop.run_in_executor(executor, finish_source, source_key)
+                else:
+                    synced = await loop.run_in_executor(executor, sync_page, source_key, page)
+                    results[source_key]['synced'] = results[source_key]['synced'] + len(synced or [])
+            except Exception as exc:
+                logger.error(f'Failed to sync work items for source {source_key}: {str(exc)}')
+                results[source_key]['error'] = str(exc)
+            finally:
+                queue.task_done()
+
+    async def run_async(self, sources, sync_page, finish_source):
+        results = {source_key: dict(synced=0, finished=None, error=None) for source_key, _, _ in sources}
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        with ThreadPoolExecutor(max_workers=self.max_threads) as executor:
+            syncer = asyncio.ensure_future(self.sync(queue, sync_page, finish_source, executor, results))
+            await asyncio.gather(
+                *[
+                    self.fetch(source_key, host, pages, queue, executor, results)
+                    for source_key, host, pages in sources
+                ]
+            )
+            await queue.put((None, None))
+            await syncer
+
+        return results
+
+    def run(self, sources, sync_page, finish_source):
+        """
+        Fetch and sync the pages for each source concurrently.
+
+        :param sources: a list of (source_key, host, pages) tuples where pages is the blocking page generator
+        :param sync_page: called as sync_page(source_key, page) on a worker thread for each page, returns the synced items
+        :param finish_source: called as finish_source(source_key) once all the pages for a source are synced.
+        :return: a dict mapping each source key to the number of items synced, the result of finish_source and the
+        error that stopped the source, if any.
+        """
+        loop = asyncio.new_event_loop()
+        try:
+            return loop.run_until_complete(self.run_async(sources, sync_page, finish_source))
+        finally:
+            loop.close()
@@ -12,10 +12,9 @@ from datetime import datetime
 
 from polaris.common import db
 from polaris.utils.exceptions import ProcessingException
-from polaris.work_tracking import connector_factory
+from polaris.work_tracking import connector_factory, work_items_source_factory
 from polaris.work_tracking.db import api
 from polaris.work_tracking.db.model import WorkItemsSource
-from polaris.work_tracking.integrations.atlassian.jira_work_items_source import JiraProject
 from polaris.common.enums import WorkItemsSourceImportState
 
 
@@ -42,14 +41,19 @@ def handle_issue_moved_event(jira_connector_key, jira_event):
                 # Issue should exist in Polaris, so either move it to active target work items source or set is_moved to True
                 try:
                     source_work_items_source_key = source_work_items_source.key
+                    api.discard_work_item_events(source_work_items_source_key, [str(issue['id'])], join_this=session)
                     target_work_items_source_key = target_work_items_source.key if target_work_items_source else None
                     organization_key = source_work_items_source.organization_key
                     if target_work_items_source and target_work_items_source.import_state == WorkItemsSourceImportState.auto_update.value:
-                        target_jira_project_source = JiraProject(target_work_items_source)
+                        target_jira_project_source = work_items_source_factory.get_cached_provider_impl(
+                            None, target_work_items_source.key, join_this=session
+                        )
                         moved_work_item_data = target_jira_project_source.map_issue_to_work_item_data(issue)
                         organization_key = target_work_items_source.organization_key
                     else:
-                        source_jira_project_source = JiraProject(source_work_items_source)
+                        source_jira_project_source = work_items_source_factory.get_cached_provider_impl(
+                            None, source_work_items_source.key, join_this=session
+                        )
                         moved_work_item_data = source_jira_project_source.map_issue_to_work_item_data(issue)
                     moved_work_item = api.move_work_item(source_work_items_source_key,
                                                          target_work_items_source_key,
@@ -65,7 +69,9 @@ def handle_issue_moved_event(jira_connector_key, jira_event):
             else:
                 # the issue does not exist in Polaris
                 if target_work_items_source and target_work_items_source.import_state == WorkItemsSourceImportState.auto_update.value:
-                    target_jira_project_source = JiraProject(target_work_items_source)
+                    target_jira_project_source = work_items_source_factory.get_cached_provider_impl(
+                        None, target_work_items_source.key, join_this=session
+                    )
                     new_work_item_data = target_jira_project_source.map_issue_to_work_item_data(issue)
                     new_work_item = api.sync_work_item(target_work_items_source.key, new_work_item_data,
                                                        join_this=session)[0]
@@ -91,7 +97,9 @@ def handle_issue_events_for_same_source_project(jira_connector_key, jira_event_t
                 # This ensures that even though the connector is active, it wont import issues etc until
                 # the work_items_source is associated with a project and an initial import is done.
                 try:
-                    jira_project_source = JiraProject(work_items_source)
+                    jira_project_source = work_items_source_factory.get_cached_provider_impl(
+                        None, work_items_source.key, join_this=session
+                    )
                     work_item_data = jira_project_source.map_issue_to_work_item_data(issue)
                     if work_item_data:
                         work_item = {}
@@ -104,6 +112,9 @@ def handle_issue_events_for_same_source_project(jira_connector_key, jira_event_t
                             )
 
                         elif jira_event_type == 'issue_deleted':
+                            # drop any buffered events for the issue, so a later flush does not resurrect it.
+                            api.discard_work_item_events(work_items_source.key, [work_item_data['source_id']],
+                                                         join_this=session)
                             work_item_data['deleted_at'] = datetime.utcnow()
                             work_item = api.delete_work_item(work_items_source.key, work_item_data, join_this=session)
                             return dict(
@@ -127,6 +138,55 @@ def handle_issue_events(jira_connector_key, jira_event_type, jira_event):
         raise ProcessingException(f"Could not find issue field on jira issue event {jira_event}. ")
 
 
+def buffer_issue_event(jira_connector_key, jira_event_type, jira_event):
+    # Buffers an issue_created or issue_updated event so that it can be synced along with the other
+    # pending events for the same project. Returns the keys of the work items source and
+    # whether a flush needs to be scheduled for it.
+    issue = jira_event.get('issue')
+    if issue:
+        project_id = issue['fields']['project']['id']
+        with db.orm_session() as session:
+            work_items_source = WorkItemsSource.find_by_connector_key_and_source_id(
+                session,
+                connector_key=jira_connector_key,
+                source_id=project_id
+            )
+            if work_items_source and work_items_source.import_state == WorkItemsSourceImportState.auto_update.value:
+                first_pending = api.buffer_work_item_event(
+                    work_items_source.key,
+                    str(issue['id']),
+                    jira_event_type,
+                    issue,
+                    join_this=session
+                )
+                return dict(
+                    organization_key=work_items_source.organization_key,
+                    work_items_source_key=work_items_source.key,
+                    flush=first_pending
+                )
+    else:
+        raise ProcessingException(f"Could not find issue field on jira issue event {jira_event}. ")
+
+
+def flush_issue_events(work_items_source_key, max_events=None):
+    jira_projects = {}
+
+    def map_issue_event(work_items_source, event):
+        # look up the provider once per flush rather than once per event.
+        if work_items_source.id not in jira_projects:
+            jira_projects[work_items_source.id] = work_items_source_factory.get_cached_provider_impl(
+                None, work_items_source.key
+            )
+        try:
+            return jira_projects[work_items_source.id].map_issue_to_work_item_data(event.payload)
+        except Exception as exc:
+            raise ProcessingException(
+                f"Exception {exc} caught mapping buffered issue event for work items source "
+                f"{work_items_source_key}: issue {event.source_id}")
+
+    return api.flush_work_item_events(work_items_source_key, map_issue_event, max_events=max_events)
+
+
 def handle_project_events(jira_connector_key, jira_event_type, jira_event):
     project = jira_event.get('project')
     if project is not None and jira_event_type in ['project_created', 'project_updated']:
@@ -9,10 +9,17 @@
 # Author: Krishna Kumar
 
 import logging
-from datetime import datetime, timedelta
+import re
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache, partial
+from itertools import islice
 import jmespath
+from jmespath.exceptions import JMESPathError
 
-from polaris.utils.collections import find
+from polaris.utils.config import get_config_provider
 
 import polaris.work_tracking.connector_factory
 from polaris.common.enums import JiraWorkItemType, JiraWorkItemSourceType
@@ -20,6 +27,43 @@ from polaris.utils.exceptions import ProcessingException
 from polaris.work_tracking.enums import CustomTagMappingType
 
 logger = logging.getLogger('polaris.work_tracking.jira')
+config = get_config_provider()
+
+# The issue fields that map_issue_to_work_item_data reads directly.
+jira_standard_fields = [
+    'summary',
+    'description',
+    'issuetype',
+    'status',
+    'priority',
+    'labels',
+    'components',
+    'fixVersions',
+    'parent',
+    'created',
+    'updated'
+]
+
+# The custom fields that map_issue_to_work_item_data looks up by name in the
+# custom field metadata of the work items source.
+jira_mapped_custom_fields = [
+    'Story Points',
+    'Story Point Estimate',
+    'Sprint',
+    'Flagged',
+    'Epic Link'
+]
+
+jira_all_fields = '*all,-comment'
+
+# The server timezone offset for each Jira connector, as a tuple (offset, time it was resolved).
+server_timezone_offsets = dict()
+
+jmespath_fields_reference = re.compile(r'\bfields\s*\.\s*(?:"((?:[^"\\]|\\.)*)"|([A-Za-z_][A-Za-z0-9_]*))')
+jmespath_fields_token = re.compile(r'\bfields\b')
+
+# Jira issue keys are the project key followed by the issue number, e.g. PP-51
+jira_issue_key = re.compile(r'^[A-Za-z][A-Za-z0-9_]*-[0-9]+$')
 
 
 class JiraWorkItemsSource:
@@ -42,12 +86,12 @@ class JiraProject(JiraWorkItemsSource):
         self.sync_import_days = int(self.work_items_source.parameters.get('sync_import_days', 1))
         self.parent_path_selectors = self.work_items_source.parameters.get('parent_path_selectors')
         self.custom_tag_mapping = self.work_items_source.parameters.get('custom_tag_mapping')
+        # Sources that need to be remapped from their stored api payloads using mappings
+        # that are not known at sync time can opt in to fetching and storing every field.
+        self.store_full_payload = self.work_items_source.parameters.get('store_full_payload', False)
 
-        self.last_updated = work_items_source.latest_work_item_update_timestamp
-        self.last_updated_issue_source_id = work_items_source.most_recently_updated_work_item_source_id
-
-        self.jira_connector = polaris.work_tracking.connector_factory.get_connector(
-            connector_key=self.work_items_source.connector_key
+        self.jira_connector = polaris.work_tracking.connector_factory.get_cached_connector(
+            self.work_items_source.connector_key
         )
         # map standard JIRA issue types to JiraWorkItemType enum values.
         self.custom_type_map = self.work_items_source.parameters.get('custom_type_map', {})
@@ -59,6 +103,78 @@ class JiraProject(JiraWorkItemsSource):
             'sub-task': JiraWorkItemType.sub_task.value,
             'subtask': JiraWorkItemType.sub_task.value
         }
+        self.index_custom_fields()
+        self.fields_projection = self.get_fields_projection()
+        # parent_path_selectors and custom_tag_mapping are applied to every issue we map,
+        # so we compile them once here.
+        self.parent_path_programs = self.compile_parent_path_selectors()
+        self.custom_tag_rules = self.compile_custom_tag_rules()
+
+    @staticmethod
+    def fields_referenced_by_selector(selector):
+        # Returns the issue fields referenced by a jmespath selector as fields.<name>, or
+        # None if the selector uses fields in a way we cannot resolve statically (fields.*, fields[..] etc.)
+        references = jmespath_fields_reference.findall(selector)
+        if len(references) != len(jmespath_fields_token.findall(selector)):
+            return None
+        return [quoted or identifier for quoted, identifier in references]
+
+    def index_custom_fields(self):
+        # Enterprise Jira instances can have well over a thousand custom fields, and we look fields up
+        # by name several times for every issue we map, so we index the metadata once up front.
+        # custom_field_keys maps the lower cased field name to the keys of all the fields with that name,
+        # custom_field_metadata maps the exact field name to the metadata of the first field with that name.
+        self.custom_field_keys = {}
+        self.custom_field_metadata = {}
+        for metadata in self.work_items_source.custom_fields or []:
+            name = metadata.get('name')
+            if name is not None:
+                self.custom_field_keys.setdefault(name.lower(), []).append(metadata.get('key'))
+                self.custom_field_metadata.setdefault(name, metadata)
+
+    def get_fields_projection(self):
+        if self.store_full_payload:
+            return jira_all_fields
+
+        fields = set(jira_standard_fields)
+
+        for custom_field in jira_mapped_custom_fields:
+            fields.update(
+                field_key for field_key in self.custom_field_keys.get(custom_field.lower(), []) if field_key is not None
+            )
+
+        selectors = list(self.parent_path_selectors or [])
+        for mapping in self.custom_tag_mapping or []:
+            for mapping_key in ['path_selector_mapping', 'path_selector_value_mapping']:
+                if 'selector' in (mapping.get(mapping_key) or {}):
+                    selectors.append(mapping[mapping_key]['selector'])
+
+            custom_field_mapping = mapping.get('custom_field_mapping') or {}
+            field = self.custom_field_metadata.get(custom_field_mapping.get('field_name'))
+            if field is not None and 'id' in field:
+                fields.add(field['id'])
+
+        for selector in selectors:
+            referenced_fields = JiraProject.fields_referenced_by_selector(selector)
+            if referenced_fields is None:
+                logger.info(
+                    f"Selector {selector} for work items source {self.work_items_source.key} "
+                    f"does not resolve to a fixed set of fields. All fields will be fetched."
+                )
+                return jira_all_fields
+            fields.update(referenced_fields)
+
+        return ','.join(sorted(fields))
+
+    # The sync watermark is only needed when polling for work items to sync, so we
+    # don't load it when the provider is constructed.
+    @property
+    def last_updated(self):
+        return self.work_items_source.latest_work_item_update_timestamp
+
+    @property
+    def last_updated_issue_source_id(self):
+        return self.work_items_source.most_recently_updated_work_item_source_id
 
     def map_work_item_type(self, issue_type_to_map):
         issue_type = issue_type_to_map.lower()
@@ -69,12 +185,14 @@ class JiraProject(JiraWorkItemsSource):
         return issue_type.lower() not in self.work_item_type_map
 
     @staticmethod
+    @lru_cache(maxsize=8192)
     def jira_time_to_utc_time_string(jira_time_string):
+        # Issues share many timestamps across their changelog histories, so
+        # we memoize the conversions.
         try:
-            return datetime.strftime(
-                datetime.fromtimestamp(JiraProject.parse_jira_time_string(jira_time_string).timestamp()),
-                "%Y-%m-%dT%H:%M:%S.%f%z"
-            )
+            return JiraProject.parse_jira_time_string(jira_time_string).astimezone(
+                timezone.utc
+            ).replace(tzinfo=None).isoformat(timespec='microseconds')
         except ValueError as exc:
             logger.warning(f"Jira timestamp {jira_time_string} "
                            f"could not be parsed to UTC returning the original string instead.")
@@ -82,6 +200,26 @@ class JiraProject(JiraWorkItemsSource):
 
     @staticmethod
     def parse_jira_time_string(jira_time_string):
+        # Jira timestamps are always of the form 2023-11-08T16:55:00.575-0600,
+        # so we slice out the fields directly and only fall back to strptime
+        # for anything that does not match this layout.
+        if (
+                len(jira_time_string) == 28 and
+                jira_time_string[10] == 'T' and
+                jira_time_string[19] == '.' and
+                jira_time_string[23] in '+-'
+        ):
+            offset = timedelta(hours=int(jira_time_string[24:26]), minutes=int(jira_time_string[26:28]))
+            return datetime(
+                int(jira_time_string[0:4]),
+                int(jira_time_string[5:7]),
+                int(jira_time_string[8:10]),
+                int(jira_time_string[11:13]),
+                int(jira_time_string[14:16]),
+                int(jira_time_string[17:19]),
+                int(jira_time_string[20:23]) * 1000,
+                tzinfo=timezone(-offset if jira_time_string[23] == '-' else offset)
+            )
         return datetime.strptime(jira_time_string, "%Y-%m-%dT%H:%M:%S.%f%z")
 
     @staticmethod
@@ -89,16 +227,13 @@ class JiraProject(JiraWorkItemsSource):
         return timestamp.strftime("%Y-%m-%d %H:%M")
 
     def get_custom_parent_key(self, issue):
-        for parent_path in self.parent_path_selectors:
-            parent_key = jmespath.search(parent_path, issue)
+        for parent_path in self.parent_path_programs:
+            parent_key = parent_path(issue)
             if parent_key is not None:
                 return parent_key
 
     def find_in_custom_fields(self, fields, field_name):
-        custom_field_metadata = filter(lambda field: field['name'].lower() == field_name.lower(),
-                                       self.work_items_source.custom_fields)
-        for metadata in custom_field_metadata:
-            custom_field_key = metadata.get('key')
+        for custom_field_key in self.custom_field_keys.get(field_name.lower(), []):
             if custom_field_key in fields:
                 return fields.get(custom_field_key)
 
@@ -216,108 +351,145 @@ class JiraProject(JiraWorkItemsSource):
             return parent_link.get('key')
 
         # See if we can get it from the epic link custom field - Jira classic projects.
-        parent_link = find(self.work_items_source.custom_fields, lambda field: field['name'] == 'Epic Link')
+        parent_link = self.custom_field_metadata.get('Epic Link')
         if parent_link:
             parent_link_custom_field = parent_link.get('key')
             if parent_link_custom_field in fields:
                 return fields.get(parent_link_custom_field)
 
-    def process_tags(self, issue, fields, issue_type):
-        def apply_custom_tags(issue, tags):
-            def map_path_selector_tag(issue, mapping, tags):
-                path_selector_mapping = mapping.get('path_selector_mapping')
-                if path_selector_mapping is not None:
-                    if 'selector' in path_selector_mapping and jmespath.search(path_selector_mapping['selector'],
-                                                                               issue) is not None:
-                        tags.add(f"custom_tag:{path_selector_mapping.get('tag')}")
-
-            def map_boolean_path_selector_tag(issue, mapping_type, mapping, tags):
-                path_selector_mapping = mapping.get('path_selector_value_mapping')
-                if path_selector_mapping is not None:
-                    if 'selector' in path_selector_mapping:
-                        path_selector_value = jmespath.search(path_selector_mapping['selector'],
-                                                              issue)
-                        if mapping_type == CustomTagMappingType.path_selector_true.value and path_selector_value:
-                            tags.add(f"custom_tag:{path_selector_mapping.get('tag')}")
-
-                        if mapping_type == CustomTagMappingType.path_selector_false.value and not path_selector_value:
-                            tags.add(f"custom_tag:{path_selector_mapping.get('tag')}")
-
-            def map_path_selector_value_tag(issue, mapping_type, mapping, tags):
-                path_selector_mapping = mapping.get('path_selector_mapping')
-                if path_selector_mapping is not None:
-                    if 'selector' in path_selector_mapping:
-                        path_selector_value = jmespath.search(path_selector_mapping['selector'],
-                                                              issue)
-                        if mapping_type == CustomTagMappingType.path_selector_value_equals.value:
-                            if path_selector_value == path_selector_mapping['value']:
-                                tags.add(f"custom_tag:{path_selector_mapping.get('tag')}")
-
-                        if mapping_type == CustomTagMappingType.path_selector_value_in.value:
-                            if path_selector_value in path_selector_mapping['values']:
-                                tags.add(f"custom_tag:{path_selector_mapping.get('tag')}")
-
-            def map_custom_field_populated_tag(issue, mapping, tags):
-                custom_field_mapping = mapping.get('custom_field_mapping')
-                if custom_field_mapping is not None:
-                    if 'field_name' in custom_field_mapping:
-                        field = find(self.work_items_source.custom_fields,
-                                     lambda field: field['name'] == custom_field_mapping['field_name'])
-                        if field is not None and 'id' in field:
-                            value = issue['fields'].get(field['id'])
-                            if value is not None:
-                                tags.add(f"custom_tag:{custom_field_mapping.get('tag')}")
-
-            def map_custom_field_value_tag(issue, mapping, tags):
-                custom_field_mapping = mapping.get('custom_field_mapping')
-                if custom_field_mapping is not None:
-                    if 'field_name' in custom_field_mapping:
-                        field_name = custom_field_mapping['field_name']
-                        field = find(self.work_items_source.custom_fields,
-                                     lambda field: field['name'] == field_name)
-                        if field is not None and 'id' in field:
-                            value = issue['fields'].get(field['id'])
-                            if value is not None:
-                                if isinstance(value, dict):
-                                    if 'value' in value:
-                                        tags.add(
-                                            f"custom_tag:{field_name.replace(' ', '_')}_{value['value'].replace(' ', '_')}")
-                                    elif 'name' in value:
-                                        tags.add(
-                                            f"custom_tag:{field_name.replace(' ', '_')}_{value['name'].replace(' ', '_')}")
-                                    else:
-                                        logger.warning(
-                                            f"Could not extract a value for tag for custom field {field_name}")
-
-            if self.custom_tag_mapping is not None:
-                for mapping in self.custom_tag_mapping:
-                    mapping_type = mapping.get('mapping_type')
-                    # Path selector based mappings
-                    if mapping_type == CustomTagMappingType.path_selector.value:
-                        map_path_selector_tag(issue, mapping, tags)
-                    elif mapping_type in [
-                        CustomTagMappingType.path_selector_value_equals.value,
-                        CustomTagMappingType.path_selector_value_in.value
-                    ]:
-                        map_path_selector_value_tag(issue, mapping_type, mapping, tags)
-
-                    elif mapping_type in [
-                        CustomTagMappingType.path_selector_true.value,
-                        CustomTagMappingType.path_selector_false.value
-                    ]:
-                        map_boolean_path_selector_tag(issue, mapping_type, mapping, tags)
-
-                    # Custom field based mappings.
-                    elif mapping_type == CustomTagMappingType.custom_field_populated.value:
-                        map_custom_field_populated_tag(issue, mapping, tags)
-
-                    elif mapping_type == CustomTagMappingType.custom_field_value.value:
-                        map_custom_field_value_tag(issue, mapping, tags)
-
-                    else:
-                        logger.warning(
-                            f"Unknown custom tag mapping type {mapping.get('mapping_type')} found when mapping custom tags for Jira work items source")
+    @staticmethod
+    def compile_selector(selector):
+        # Returns a function that evaluates the selector against an issue.
+        try:
+            return jmespath.compile(selector).search
+        except JMESPathError:
+            # Invalid selectors keep failing when each issue is mapped, as they did before
+            # we compiled them, rather than when the provider is constructed.
+            return partial(jmespath.search, selector)
+
+    def compile_parent_path_selectors(self):
+        if self.parent_path_selectors is not None:
+            return [JiraProject.compile_selector(parent_path) for parent_path in self.parent_path_selectors]
+
+    def compile_custom_tag_rules(self):
+        # Compiles the custom_tag_mapping parameter into a list of rules, each of
+        # which is a function that adds its custom tag to tags if the issue matches it.
+        def path_selector_tag_rule(mapping):
+            path_selector_mapping = mapping.get('path_selector_mapping')
+            if path_selector_mapping is not None and 'selector' in path_selector_mapping:
+                selector = JiraProject.compile_selector(path_selector_mapping['selector'])
+                tag = f"custom_tag:{path_selector_mapping.get('tag')}"
+
+                def rule(issue, tags):
+                    if selector(issue) is not None:
+                        tags.add(tag)
+
+                return rule
+
+        def boolean_path_selector_tag_rule(mapping_type, mapping):
+            path_selector_mapping = mapping.get('path_selector_value_mapping')
+            if path_selector_mapping is not None and 'selector' in path_selector_mapping:
+                selector = JiraProject.compile_selector(path_selector_mapping['selector'])
+                tag = f"custom_tag:{path_selector_mapping.get('tag')}"
+                expected = mapping_type == CustomTagMappingType.path_selector_true.value
+
+                def rule(issue, tags):
+                    if bool(selector(issue)) == expected:
+                        tags.add(tag)
+
+                return rule
+
+        def path_selector_value_tag_rule(mapping_type, mapping):
+            path_selector_mapping = mapping.get('path_selector_mapping')
+            if path_selector_mapping is not None and 'selector' in path_selector_mapping:
+                selector = JiraProject.compile_selector(path_selector_mapping['selector'])
+                tag = f"custom_tag:{path_selector_mapping.get('tag')}"
+
+                if mapping_type == CustomTagMappingType.path_selector_value_equals.value:
+                    def rule(issue, tags):
+                        if selector(issue) == path_selector_mapping['value']:
+                            tags.add(tag)
+                else:
+                    def rule(issue, tags):
+                        if selector(issue) in path_selector_mapping['values']:
+                            tags.add(tag)
+
+                return rule
+
+        def custom_field_populated_tag_rule(mapping):
+            custom_field_mapping = mapping.get('custom_field_mapping')
+            if custom_field_mapping is not None and 'field_name' in custom_field_mapping:
+                field = self.custom_field_metadata.get(custom_field_mapping['field_name'])
+                if field is not None and 'id' in field:
+                    field_id = field['id']
+                    tag = f"custom_tag:{custom_field_mapping.get('tag')}"
+
+                    def rule(issue, tags):
+                        if issue['fields'].get(field_id) is not None:
+                            tags.add(tag)
+
+                    return rule
+
+        def custom_field_value_tag_rule(mapping):
+            custom_field_mapping = mapping.get('custom_field_mapping')
+            if custom_field_mapping is not None and 'field_name' in custom_field_mapping:
+                field_name = custom_field_mapping['field_name']
+                field = self.custom_field_metadata.get(field_name)
+                if field is not None and 'id' in field:
+                    field_id = field['id']
+                    tag_prefix = f"custom_tag:{field_name.replace(' ', '_')}"
+
+                    def rule(issue, tags):
+                        value = issue['fields'].get(field_id)
+                        if value is not None:
+                            if isinstance(value, dict):
+                                if 'value' in value:
+                                    tags.add(f"{tag_prefix}_{value['value'].replace(' ', '_')}")
+                                elif 'name' in value:
+                                    tags.add(f"{tag_prefix}_{value['name'].replace(' ', '_')}")
+                                else:
+                                    logger.warning(
+                                        f"Could not extract a value for tag for custom field {field_name}")
+
+                    return rule
+
+        rules = []
+        if self.custom_tag_mapping is not None:
+            for mapping in self.custom_tag_mapping:
+                mapping_type = mapping.get('mapping_type')
+                # Path selector based mappings
+                if mapping_type == CustomTagMappingType.path_selector.value:
+                    rule = path_selector_tag_rule(mapping)
+                elif mapping_type in [
+                    CustomTagMappingType.path_selector_value_equals.value,
+                    CustomTagMappingType.path_selector_value_in.value
+                ]:
+                    rule = path_selector_value_tag_rule(mapping_type, mapping)
+
+                elif mapping_type in [
+                    CustomTagMappingType.path_selector_true.value,
+                    CustomTagMappingType.path_selector_false.value
+                ]:
+                    rule = boolean_path_selector_tag_rule(mapping_type, mapping)
+
+                # Custom field based mappings.
+                elif mapping_type == CustomTagMappingType.custom_field_populated.value:
+                    rule = custom_field_populated_tag_rule(mapping)
+
+                elif mapping_type == CustomTagMappingType.custom_field_value.value:
+                    rule = custom_field_value_tag_rule(mapping)
 
+                else:
+                    rule = None
+                    logger.warning(
+                        f"Unknown custom tag mapping type {mapping.get('mapping_type')} found when mapping custom tags for Jira work items source")
+
+                if rule is not None:
+                    rules.append(rule)
+
+        return rules
+
+    def process_tags(self, issue, fields, issue_type):
         tags = set(fields.get('labels', []))
         if self.is_custom_type(issue_type):
             tags.add(f'custom_type:{issue_type}')
@@ -326,7 +498,8 @@ class JiraProject(JiraWorkItemsSource):
             tags.add(f"component:{component['name']}")
 
         # apply any custom tag mappers
-        apply_custom_tags(issue, tags)
+        for rule in self.custom_tag_rules:
+            rule(issue, tags)
 
         return list(tags)
 
@@ -352,6 +525,180 @@ class JiraProject(JiraWorkItemsSource):
 
                     return last_updated.utcoffset()
 
+    def get_cached_server_timezone_offset(self):
+        # Resolving the offset costs an extra api call, so we cache it per connector
+        # and only refresh it periodically to pick up daylight savings changes.
+        ttl = int(config.get('jira_server_timezone_offset_ttl_seconds', 3600))
+        cached = server_timezone_offsets.get(self.jira_connector.key)
+        if cached is not None and time.monotonic() - cached[1] < ttl:
+            return cached[0]
+
+        offset = self.get_server_timezone_offset()
+        if offset is not None:
+            server_timezone_offsets[self.jira_connector.key] = (offset, time.monotonic())
+        return offset
+
+    def get_sync_watermark(self):
+        # The watermark is the latest update timestamp of the work items we have synced, converted
+        # to the timezone Jira interprets JQL dates in, less a small overlap to allow for clock skew
+        # and for issues whose update committed in Jira after the last sync read past their update time.
+        # It is only advanced once a poll sync has synced all of its pages.
+        if self.last_updated is not None and str(config.get('jira_incremental_sync', 'true')).lower() == 'true':
+            offset = self.get_cached_server_timezone_offset()
+            if offset is not None:
+                overlap = timedelta(minutes=int(config.get('jira_incremental_sync_overlap_minutes', 10)))
+                return self.last_updated + offset - overlap
+
+    @staticmethod
+    def retry_after_seconds(response, attempt):
+        # Jira Cloud signals rate limiting with a 429 and a Retry-After header giving
+        # the number of seconds to wait. If the header is missing we back off exponentially.
+        try:
+            return max(float(response.headers.get('Retry-After')), 0)
+        except (TypeError, ValueError):
+            return min(2 ** attempt, 60)
+
+    def search(self, query_params):
+        max_retries = int(config.get('jira_rate_limit_max_retries', 5))
+        attempt = 0
+        while True:
+            response = self.jira_connector.get(
+                '/search',
+                headers={"Accept": "application/json"},
+                params=query_params
+            )
+            if response.status_code != 429 or attempt >= max_retries:
+                return response
+
+            attempt = attempt + 1
+            delay = JiraProject.retry_after_seconds(response, attempt)
+            logger.warning(
+                f"Jira rate limit reached for project {self.project_id} at startAt={query_params.get('startAt', 0)}. "
+                f"Retrying in {delay} seconds (attempt {attempt} of {max_retries})"
+            )
+            time.sleep(delay)
+
+    def prefetch_search_pages(self, query_params, body):
+        # Yields the issues on each page of a /search result in startAt order.
+        # Once the first page tells us the total, the remaining pages are fetched on a bounded
+        # thread pool that runs up to jira_search_prefetch_pages ahead of the page the caller
+        # is currently mapping and syncing.
+        issues = body.get('issues', [])
+        total = int(body.get('total') or 0)
+        if len(issues) == 0:
+            return
+
+        yield issues
+
+        # Jira may cap maxResults below what we asked for, so we page by what it actually returned.
+        page_size = len(issues)
+        offsets = iter(range(page_size, total, page_size))
+        prefetch_pages = max(int(config.get('jira_search_prefetch_pages', 4)), 1)
+
+        def fetch_page(start_at):
+            return self.search(dict(query_params, startAt=start_at))
+
+        with ThreadPoolExecutor(max_workers=prefetch_pages) as executor:
+            pending = deque(
+                executor.submit(fetch_page, start_at) for start_at in islice(offsets, prefetch_pages)
+            )
+            try:
+                while len(pending) > 0:
+                    response = pending.popleft().result()
+                    if response.status_code != 200:
+                        # We must not let the sync finish with a truncated result, since it would advance the
+                        # watermark past the issues on the pages we could not fetch.
+                        raise ProcessingException(
+                            f"Could not fetch page of work items for project {self.project_id}. "
+                            f"Response {response.status_code} {response.text}"
+                        )
+                    body = response.json()
+                    issues = body.get('issues', []) if body is not None else []
+                    if len(issues) == 0:
+                        break
+
+                    start_at = next(offsets, None)
+                    if start_at is not None:
+                        pending.append(executor.submit(fetch_page, start_at))
+
+                    yield issues
+            finally:
+                for future in pending:
+                    future.cancel()
+
+    def map_issues(self, issues):
+        work_items = []
+        for issue in issues:
+            try:
+                work_item_data = self.map_issue_to_work_item_data(issue)
+                if work_item_data:
+                    work_items.append(work_item_data)
+            except ProcessingException as e:
+                logger.error(f"Failed to map issue data {e}")
+        return work_items
+
+    @staticmethod
+    def issue_update_minute(issue, server_timezone_offset):
+        # The update time of the issue in the server timezone, truncated to the minute precision of JQL dates.
+        updated = issue.get('fields', {}).get('updated')
+        if updated is not None:
+            try:
+                return (
+                    JiraProject.parse_jira_time_string(updated).astimezone(timezone.utc).replace(tzinfo=None) +
+                    server_timezone_offset
+                ).replace(second=0, microsecond=0)
+            except ValueError:
+                return None
+
+    def fetch_issues_updated_since(self, jql_base, watermark):
+        # Pages through the issues updated since the watermark in update order, keyed on the update time of the
+        # last issue of each page rather than on startAt offsets: an issue that is updated while we are paging moves
+        # to the end of the results and shifts the offsets of the issues after it, so paging by offset can skip issues.
+        # JQL dates only have minute precision, so each page re-reads the issues updated in the minute of the
+        # last issue of the previous page, and we skip the ones we have already seen.
+        # We only fall back to startAt offsets within a minute that has more than a page of updates.
+        server_timezone_offset = self.get_cached_server_timezone_offset()
+        cursor = watermark.replace(second=0, microsecond=0)
+        seen = set()
+        start_at = 0
+        while True:
+            query_params = dict(
+                fields=self.fields_projection,
+                jql=f'{jql_base} AND updated >= "{JiraProject.jira_time_string(cursor)}" ORDER BY updated ASC, key ASC',
+                expand='changelog',
+                maxResults=100,
+                startAt=start_at
+            )
+            response = self.search(query_params)
+            if response.status_code != 200:
+                # We must not let the sync finish with a truncated result, since it would advance the
+                # watermark past the issues we could not fetch.
+                raise ProcessingException(
+                    f"Could not fetch page of work items for project {self.project_id}. "
+                    f"Response {response.status_code} {response.text}"
+                )
+            body = response.json()
+            issues = body.get('issues', []) if body is not None else []
+            if len(issues) == 0:
+                break
+
+            yield self.map_issues([issue for issue in issues if issue['id'] not in seen])
+
+            if start_at + len(issues) >= int(body.get('total') or 0):
+                break
+
+            last_update = JiraProject.issue_update_minute(issues[-1], server_timezone_offset)
+            if last_update is not None and last_update > cursor:
+                cursor = last_update
+                seen = {
+                    issue['id'] for issue in issues
+                    if JiraProject.issue_update_minute(issue, server_timezone_offset) == cursor
+                }
+                start_at = 0
+            else:
+                seen.update(issue['id'] for issue in issues)
+                start_at = start_at + len(issues)
+
     def fetch_work_items_to_sync(self):
         logger.info(f"Sync work items for Jira Connector {self.jira_connector.key}")
         jql_base = f"project = {self.project_id} "
@@ -359,47 +706,27 @@ class JiraProject(JiraWorkItemsSource):
         if self.work_items_source.last_synced is None or self.last_updated is None:
             jql = f'{jql_base} AND updated >= "-{self.initial_import_days}d"'
         else:
-            jql = f'{jql_base} AND updated >= "-{self.sync_import_days}d"'
+            watermark = self.get_sync_watermark()
+            if watermark is not None:
+                yield from self.fetch_issues_updated_since(jql_base, watermark)
+                yield []
+                return
+            else:
+                jql = f'{jql_base} AND updated >= "-{self.sync_import_days}d"'
 
         query_params = dict(
-            fields="*all,-comment",
+            fields=self.fields_projection,
             jql=jql,
             expand='changelog',
             maxResults=100
         )
 
-        response = self.jira_connector.get(
-            '/search',
-            headers={"Accept": "application/json"},
-            params=query_params
-        )
+        response = self.search(query_params)
         if response.status_code == 200:
-            offset = 0
             body = response.json()
             if body is not None:
-                total = int(body.get('total') or 0)
-                while offset < total and response.status_code == 200:
-                    issues = body.get('issues', [])
-                    if len(issues) == 0:
-                        break
-                    work_items = []
-                    for issue in issues:
-                        try:
-                            work_item_data = self.map_issue_to_work_item_data(issue)
-                            if work_item_data:
-                                work_items.append(work_item_data)
-                        except ProcessingException as e:
-                            logger.error(f"Failed to map issue data {e}")
-
-                    yield work_items
-                    offset = offset + len(issues)
-                    query_params['startAt'] = offset
-                    response = self.jira_connector.get(
-                        '/search',
-                        headers={"Accept": "application/json"},
-                        params=query_params
-                    )
-                    body = response.json()
+                for issues in self.prefetch_search_pages(query_params, body):
+                    yield self.map_issues(issues)
             else:
                 logger.error(f'Response body was empty: Request {response.request}')
 
@@ -415,7 +742,7 @@ class JiraProject(JiraWorkItemsSource):
         jql = f'{jql_base} AND (parent={epic_source_id} OR \"Epic Link\" = {epic_source_id}) AND updated >= "-{self.initial_import_days}d"'
 
         query_params = dict(
-            fields="*all,-comment",
+            fields=self.fields_projection,
             jql=jql,
             maxResults=100
         )
@@ -455,38 +782,107 @@ class JiraProject(JiraWorkItemsSource):
 
         yield []
 
+    def fetch_issue(self, source_id):
+        # Fetches a single issue by key from the issue endpoint, which is much cheaper than a JQL search.
+        # Returns None if the issue does not exist or is not in this project.
+        if not jira_issue_key.match(source_id or ''):
+            logger.warning(f"Ignoring malformed issue key {source_id}")
+            return None
+        response = self.jira_connector.get(
+            f'/issue/{source_id}',
+            headers={"Accept": "application/json"},
+            params=dict(fields=f'{self.fields_projection},project')
+        )
+        if response.status_code == 404:
+            logger.info(f"Work item with key {source_id} was not found")
+            return None
+        if not response.ok:
+            logger.error(
+                f"Could not fetch work item with key {source_id}. Response: {response.status_code} {response.text}")
+            return None
+
+        issue = response.json()
+        if issue is None:
+            logger.error("Null response json body returned for issue fetch.")
+            return None
+
+        project = issue.get('fields', {}).get('project') or {}
+        if str(self.project_id) not in [str(project.get('id')), str(project.get('key'))]:
+            logger.info(f"Work item with key {source_id} is not in project {self.project_id}")
+            return None
+
+        return issue
+
     def fetch_work_item(self, source_id):
         try:
             logger.info(f"Fetching work item with source_id {source_id}")
-            jql_base = f"project = {self.project_id} "
-            get_issue_query = dict(
-                fields="*all, -comment",
-                jql=f'{jql_base} AND key={source_id}'
-            )
-            response = self.jira_connector.get(
-                '/search',
-                headers={"Accept": "application/json"},
-                params=get_issue_query
-            )
-            work_item_data = []
-            if response.ok:
-                body = response.json()
-                if body is not None:
-                    issues = body.get('issues', [])
-                    if len(issues) > 0:
-                        work_item_data = self.map_issue_to_work_item_data(issues[0])
-
-                    else:
-                        logger.error(
-                            f"Could not fetch work item with key: {source_id}: No issues were returned. Response was {body}")
-                else:
-                    logger.error("Null response json body returned for JQL query.")
-            else:
-                logger.error(
-                    f"Could not fetch work item with key {source_id}. Response: {response.status_code} {response.text}")
-
-            return work_item_data
+            issue = self.fetch_issue(source_id)
+            return self.map_issue_to_work_item_data(issue) if issue is not None else []
         except Exception as exc:
             logger.error(f"Fetch work item {source_id} failed for jira project {self.work_items_source.name}")
             raise ProcessingException(
                 f'Unexpected error when fetching work item {source_id} from jira project: {self.work_items_source.name}')
+
+    def search_work_items_by_key(self, keys):
+        # Returns the mapped work items for the keys found by a single key in (...) search, or None if the search failed.
+        quoted_keys = ','.join(f'"{key}"' for key in keys)
+        query_params = dict(
+            fields=self.fields_projection,
+            jql=f'project = {self.project_id} AND key in ({quoted_keys})',
+            # Jira rejects the whole query if any of the keys do not exist, unless we ask it to only warn.
+            validateQuery='warn',
+            maxResults=len(keys)
+        )
+        try:
+            response = self.search(query_params)
+            if response.status_code != 200:
+                logger.error(f"Could not fetch work items by key. Response: {response.status_code} {response.text}")
+                return None
+            body = response.json()
+            if body is None:
+                logger.error("Null response json body returned for JQL query.")
+                return None
+            work_items_data = []
+            for issues in self.prefetch_search_pages(query_params, body):
+                work_items_data.extend(
+                    self.map_issue_to_work_item_data(issue) for issue in issues
+                )
+            return work_items_data
+        except Exception as exc:
+            logger.error(f"Fetch work items by key failed for jira project {self.work_items_source.name}: {str(exc)}")
+            return None
+
+    def fetch_work_items_by_source_ids(self, source_ids, page_size=100):
+        # Fetches the work items with the given keys. A single key is fetched directly, otherwise
+        # the keys are fetched using key in (...) searches of up to page_size keys each. If a search fails,
+        # its keys are fetched one at a time, so that one bad key does not fail the rest of the batch.
+        # Keys that are malformed, do not exist or are not in this project are simply missing from the result.
+        keys = [source_id for source_id in source_ids if jira_issue_key.match(source_id or '')]
+        if len(keys) < len(source_ids):
+            logger.warning(f"Ignoring malformed issue keys {[key for key in source_ids if key not in keys]}")
+
+        work_items_data = []
+        if len(keys) > 1:
+            logger.info(f"Fetching {len(keys)} work items by key for project {self.project_id}")
+            for start in range(0, len(keys), page_size):
+                batch = keys[start:start + page_size]
+                found = self.search_work_items_by_key(batch)
+                if found is not None:
+                    work_items_data.extend(found)
+                else:
+                    work_items_data.extend(self.fetch_work_items_one_at_a_time(batch))
+        else:
+            work_items_data.extend(self.fetch_work_items_one_at_a_time(keys))
+
+        return work_items_data
+
+    def fetch_work_items_one_at_a_time(self, keys):
+        work_items_data = []
+        for key in keys:
+            try:
+                work_item_data = self.fetch_work_item(key)
+                if work_item_data:
+                    work_items_data.append(work_item_data)
+            except ProcessingException as exc:
+                logger.error(f"Could not fetch work item {key}: {str(exc)}")
+        return work_items_data
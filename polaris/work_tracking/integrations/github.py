@@ -76,13 +76,17 @@ class GithubRepositoryIssues(GithubIssuesWorkItemsSource):
 
     def __init__(self, token_provider, work_items_source):
         self.work_items_source = work_items_source
-        self.last_updated = work_items_source.latest_work_item_update_timestamp
 
         self.github_connector = connector_factory.get_connector(
             connector_key=self.work_items_source.connector_key
         )
         self.github = self.github_connector.get_github_client()
 
+    @property
+    def last_updated(self):
+        # read from the work items source so that a cached provider sees the current sync watermark.
+        return self.work_items_source.latest_work_item_update_timestamp
+
     def map_issue_to_work_item(self, issue):
         bug_tags = ['bug', *self.work_items_source.parameters.get('bug_tags', [])]
 
@@ -10,7 +10,6 @@
 
 import copy
 import logging
-import requests
 from enum import Enum
 from datetime import datetime, timedelta
 from polaris.utils.collections import find
@@ -19,12 +18,17 @@ from polaris.common.enums import WorkTrackingIntegrationType, GitlabWorkItemType
 from polaris.integrations.gitlab import GitlabConnector
 from polaris.utils.exceptions import ProcessingException
 from polaris.work_tracking import connector_factory
+from polaris.work_tracking.integrations.http_sessions import get_http_session
+from polaris.work_tracking.integrations.source_data import fetched_at_key, fetched_at_stamp, is_source_data_stale
 from polaris.utils.config import get_config_provider
 
 config_provider = get_config_provider()
 
 logger = logging.getLogger('polaris.work_tracking.gitlab')
 
+# The key under which we save the issue labels that we found are not board list labels in source_data
+checked_labels_key = 'checked_labels'
+
 
 class GitlabWorkTrackingConnector(GitlabConnector):
 
@@ -32,6 +36,7 @@ class GitlabWorkTrackingConnector(GitlabConnector):
         super().__init__(connector)
         self.webhook_secret = connector.webhook_secret
         self.webhook_events = ['issue_events']
+        self.http = get_http_session(connector.key)
 
     def map_project_to_work_items_sources_data(self, project):
         return dict(
@@ -51,7 +56,7 @@ class GitlabWorkTrackingConnector(GitlabConnector):
     def fetch_gitlab_projects(self):
         fetch_projects_url = f'{self.base_url}/projects'
         while fetch_projects_url is not None:
-            response = requests.get(
+            response = self.http.get(
                 fetch_projects_url,
                 params=dict(membership=True),
                 headers={"Authorization": f"Bearer {self.personal_access_token}"},
@@ -101,7 +106,7 @@ class GitlabWorkTrackingConnector(GitlabConnector):
         for event in self.webhook_events:
             post_data[f'{event}'] = True
 
-        response = requests.post(
+        response = self.http.post(
             add_hook_url,
             headers={"Authorization": f"Bearer {self.personal_access_token}"},
             data=post_data
@@ -121,7 +126,7 @@ class GitlabWorkTrackingConnector(GitlabConnector):
 
     def delete_project_webhook(self, project_source_id, inactive_hook_id):
         delete_hook_url = f"{self.base_url}/projects/{project_source_id}/hooks/{inactive_hook_id}"
-        response = requests.delete(
+        response = self.http.delete(
             delete_hook_url,
             headers={"Authorization": f"Bearer {self.personal_access_token}"}
         )
@@ -153,7 +158,6 @@ class GitlabProject(GitlabIssuesWorkItemsSource):
 
     def __init__(self, token_provider, work_items_source, connector=None):
         self.work_items_source = work_items_source
-        self.last_updated = work_items_source.latest_work_item_update_timestamp
         self.source_states = work_items_source.source_states
         self.basic_source_states = ['opened', 'closed']
         self.gitlab_connector = connector if connector else connector_factory.get_connector(
@@ -162,6 +166,11 @@ class GitlabProject(GitlabIssuesWorkItemsSource):
         self.source_project_id = work_items_source.source_id
         self.personal_access_token = self.gitlab_connector.personal_access_token
 
+    @property
+    def last_updated(self):
+        # read from the work items source so that a cached provider sees the current sync watermark.
+        return self.work_items_source.latest_work_item_update_timestamp
+
     def resolve_work_item_type_for_issue(self, labels):
         lower_case_labels = [label.lower() for label in labels]
         for label in lower_case_labels:
@@ -175,17 +184,21 @@ class GitlabProject(GitlabIssuesWorkItemsSource):
                 return GitlabWorkItemType.task.value
         return GitlabWorkItemType.issue.value
 
-    def map_issue_to_work_item(self, issue):
-        labels = issue['labels']
+    @staticmethod
+    def issue_labels(issue):
+        # Labels come as plain names from the api and as label objects in webhook payloads.
         derived_labels = []
-
-        for label in labels:
+        for label in issue.get('labels') or []:
             if type(label) == str:
                 derived_labels.append(label)
             if type(label) == dict:
                 new_label = label.get('title')
                 if new_label:
                     derived_labels.append(new_label)
+        return derived_labels
+
+    def map_issue_to_work_item(self, issue):
+        derived_labels = self.issue_labels(issue)
 
         # Resolve source state from labels / state value
         source_state = issue['state']
@@ -223,7 +236,7 @@ class GitlabProject(GitlabIssuesWorkItemsSource):
             query_params['updated_after'] = self.last_updated.isoformat()
         fetch_issues_url = f'{self.gitlab_connector.base_url}/projects/{self.source_project_id}/issues'
         while fetch_issues_url is not None:
-            response = requests.get(
+            response = self.gitlab_connector.http.get(
                 fetch_issues_url,
                 params=query_params,
                 headers={"Authorization": f"Bearer {self.personal_access_token}"},
@@ -250,7 +263,7 @@ class GitlabProject(GitlabIssuesWorkItemsSource):
         query_params = dict(limit=100)
         fetch_boards_url = f'{self.gitlab_connector.base_url}/projects/{self.source_project_id}/boards'
         while fetch_boards_url is not None:
-            response = requests.get(
+            response = self.gitlab_connector.http.get(
                 fetch_boards_url,
                 params=query_params,
                 headers={"Authorization": f"Bearer {self.personal_access_token}"},
@@ -268,7 +281,7 @@ class GitlabProject(GitlabIssuesWorkItemsSource):
 
     def before_work_item_sync(self):
         project_boards = [data for data in self.fetch_project_boards()][0]
-        source_data = dict(boards=project_boards)
+        source_data = {'boards': project_boards, fetched_at_key: fetched_at_stamp()}
 
         intermediate_source_states = []
         for board in project_boards:
@@ -280,3 +293,25 @@ class GitlabProject(GitlabIssuesWorkItemsSource):
             source_data=source_data,
             source_states=self.source_states
         )
+
+    def unchecked_labels(self, labels):
+        # Labels that are neither board list labels nor labels we have already checked against the boards.
+        # One of these could be the label of a board list that was added after we fetched the boards.
+        checked_labels = (self.work_items_source.source_data or {}).get(checked_labels_key, [])
+        return [
+            label for label in labels
+            if label not in (self.source_states or []) and label not in checked_labels
+        ]
+
+    def refresh_source_data_if_stale(self, force=False, labels=None):
+        # Refetch the project boards only if the copy saved in source_data is stale, or if labels has a label
+        # that we have not seen on the boards yet. Labels that turn out not to be board list labels are saved
+        # in source_data, so that they do not trigger another refetch until the boards go stale.
+        # Returns the updated work items source data, or None if the saved copy is still fresh.
+        unchecked_labels = self.unchecked_labels(labels or [])
+        if force or len(unchecked_labels) > 0 or is_source_data_stale(self.work_items_source.source_data):
+            work_items_source_data = self.before_work_item_sync()
+            work_items_source_data['source_data'][checked_labels_key] = sorted(
+                set(label for label in unchecked_labels if label not in work_items_source_data['source_states'])
+            )
+            return work_items_source_data
@@ -12,9 +12,8 @@ import json
 
 from polaris.work_tracking import publish
 from polaris.common import db
-from polaris.work_tracking import connector_factory
+from polaris.work_tracking import work_items_source_factory
 from polaris.work_tracking.db import api
-from polaris.work_tracking.integrations.gitlab import GitlabProject
 from polaris.work_tracking.db.model import WorkItemsSource
 
 
@@ -28,34 +27,39 @@ def handle_issue_event(connector_key, payload, channel=None):
             source_id=project_source_id
         )
         if work_items_source:
-            connector = connector_factory.get_connector(
-                connector_key=work_items_source.connector_key,
-                join_this=session
+            gitlab_project = work_items_source_factory.get_cached_provider_impl(
+                None, work_items_source.key, work_items_source, join_this=session
             )
-            if connector:
-                gitlab_project = GitlabProject(token_provider=None, work_items_source=work_items_source, connector=connector)
-                issue_object = event.get('object_attributes')
-                work_items_source_data = gitlab_project.before_work_item_sync()
+            issue_object = event.get('object_attributes')
+            # an issue with a label we have not seen on the boards may have been moved to a new board list.
+            work_items_source_data = gitlab_project.refresh_source_data_if_stale(
+                labels=gitlab_project.issue_labels(issue_object)
+            )
+            if work_items_source_data is not None:
                 work_items_source.update(work_items_source_data)
                 session.flush()
+                # the provider is rebuilt from the refreshed source data
+                gitlab_project = work_items_source_factory.get_cached_provider_impl(
+                    None, work_items_source.key, work_items_source, join_this=session
+                )
 
-                issue_data = gitlab_project.map_issue_to_work_item(issue_object)
+            issue_data = gitlab_project.map_issue_to_work_item(issue_object)
 
-                synced_issues = api.sync_work_items(work_items_source.key, [issue_data], join_this=session)
-                if len(synced_issues) > 0:
-                    if synced_issues[0]['is_new']:
-                        publish.work_item_created_event(
-                            organization_key=work_items_source.organization_key,
-                            work_items_source_key=work_items_source.key,
-                            new_work_items=synced_issues
-                        )
-                    else:
-                        publish.work_item_updated_event(
-                            organization_key=work_items_source.organization_key,
-                            work_items_source_key=work_items_source.key,
-                            updated_work_items=synced_issues
-                        )
-                return synced_issues
+            synced_issues = api.sync_work_items(work_items_source.key, [issue_data], join_this=session)
+            if len(synced_issues) > 0:
+                if synced_issues[0]['is_new']:
+                    publish.work_item_created_event(
+                        organization_key=work_items_source.organization_key,
+                        work_items_source_key=work_items_source.key,
+                        new_work_items=synced_issues
+                    )
+                else:
+                    publish.work_item_updated_event(
+                        organization_key=work_items_source.organization_key,
+                        work_items_source_key=work_items_source.key,
+                        updated_work_items=synced_issues
+                    )
+            return synced_issues
 
 
 def handle_gitlab_event(connector_key, event_type, payload, channel=None):
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+
+# Copyright: © Exathink, LLC (2011-2026) All Rights Reserved
+
+# Unauthorized use or copying of this file and its contents, via any medium
+# is strictly prohibited. The work product in this file is proprietary and
+# confidential.
+
+# Author: Krishna Kumar
+
+from threading import Lock
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from polaris.utils.config import get_config_provider
+
+config = get_config_provider()
+
+# Pooled http sessions for connectors that talk to their APIs directly using requests, keyed by connector key.
+http_sessions = dict()
+http_sessions_lock = Lock()
+
+
+class ConnectorHttpSession(requests.Session):
+    """
+    A requests session that keeps connections to the connector's api host alive across calls,
+    applies a default timeout to every request, and retries idempotent requests that fail
+    with 429 or 5xx responses, honoring any Retry-After header the server sends.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.timeout = (
+            float(config.get('connector_http_connect_timeout_seconds', 10)),
+            float(config.get('connector_http_read_timeout_seconds', 60))
+        )
+        retry = Retry(
+            total=int(config.get('connector_http_max_retries', 5)),
+            backoff_factor=float(config.get('connector_http_backoff_factor', 0.5)),
+            status_forcelist=[429, 500, 502, 503, 504],
+            respect_retry_after_header=True,
+            # we return the last response when the retries are exhausted, since callers check response.ok
+            raise_on_status=False
+        )
+        pool_size = int(config.get('connector_http_pool_size', 10))
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        self.mount('https://', adapter)
+        self.mount('http://', adapter)
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        return super().request(method, url, **kwargs)
+
+
+def get_http_session(connector_key):
+    with http_sessions_lock:
+        session = http_sessions.get(str(connector_key))
+        if session is None:
+            session = ConnectorHttpSession()
+            http_sessions[str(connector_key)] = session
+        return session
@@ -10,12 +10,12 @@
 
 from enum import Enum
 from datetime import datetime, timedelta
-import requests
 import logging
 
 from polaris.utils.exceptions import ProcessingException
 from polaris.common.enums import PivotalTrackerWorkItemType, WorkTrackingIntegrationType
 from polaris.work_tracking import connector_factory
+from polaris.work_tracking.integrations.http_sessions import get_http_session
 
 logger = logging.getLogger('polaris.work_tracking.pivotal_tracker')
 
@@ -29,6 +29,7 @@ class PivotalApiClient:
         self.connector = connector
         self.access_token = connector.api_key
         self.base_url = f'{connector.base_url}/services/v5'
+        self.http = get_http_session(connector.key)
 
 
 class PivotalTrackerConnector(PivotalApiClient):
@@ -43,7 +44,7 @@ class PivotalTrackerConnector(PivotalApiClient):
         return True
 
     def test(self):
-        response = requests.get(
+        response = self.http.get(
             f'{self.base_url}/projects',
             headers={"X-TrackerToken": self.access_token},
         )
@@ -61,7 +62,7 @@ class PivotalTrackerConnector(PivotalApiClient):
                 raise ProcessingException(f'Pivotal Connector Test Failed: {response.text} ({response.status_code})')
 
     def fetch_projects(self):
-        response = requests.get(
+        response = self.http.get(
             f'{self.base_url}/projects',
             headers={"X-TrackerToken": self.access_token},
         )
@@ -110,13 +111,17 @@ class PivotalTrackerProject(PivotalTrackerWorkItemsSource):
 
         self.work_items_source = work_items_source
         self.project_id = work_items_source.source_id
-        self.last_updated = work_items_source.latest_work_item_update_timestamp
         self.pivotal_connector = connector_factory.get_connector(
             connector_key=self.work_items_source.connector_key
         )
         self.access_token = self.pivotal_connector.access_token
         self.base_url = f'{self.pivotal_connector.base_url}'
 
+    @property
+    def last_updated(self):
+        # read from the work items source so that a cached provider sees the current sync watermark.
+        return self.work_items_source.latest_work_item_update_timestamp
+
     def fetch_work_items_to_sync(self):
         query_params = dict(limit=100)
         if self.work_items_source.last_synced is None or self.last_updated is None:
@@ -128,7 +133,7 @@ class PivotalTrackerProject(PivotalTrackerWorkItemsSource):
         if self.last_updated:
             query_params['updated_after'] = self.last_updated.isoformat()
 
-        response = requests.get(
+        response = self.pivotal_connector.http.get(
             f'{self.base_url}/projects/{self.project_id}/stories',
             headers={"X-TrackerToken": self.access_token},
             params=query_params
@@ -167,7 +172,7 @@ class PivotalTrackerProject(PivotalTrackerWorkItemsSource):
 
                 offset = offset + len(work_items)
                 query_params['offset'] = offset
-                response = requests.get(
+                response = self.pivotal_connector.http.get(
                     f'{self.base_url}/projects/{self.project_id}/stories',
                     headers={"X-TrackerToken": self.access_token},
                     params=query_params
@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+
+# Copyright: © Exathink, LLC (2011-2026) All Rights Reserved
+
+# Unauthorized use or copying of this file and its contents, via any medium
+# is strictly prohibited. The work product in this file is proprietary and
+# confidential.
+
+# Author: Krishna Kumar
+
+from datetime import datetime, timedelta
+
+from polaris.utils.config import get_config_provider
+
+config = get_config_provider()
+
+# The key under which we stamp the time board metadata was fetched in work_items_source.source_data
+fetched_at_key = 'fetched_at'
+
+
+def fetched_at_stamp():
+    return datetime.utcnow().isoformat()
+
+
+def is_source_data_stale(source_data):
+    """
+    Board metadata (lists, labels etc.) saved in source_data is considered stale if it has never been fetched,
+    or was fetched more than board_metadata_ttl_seconds ago.
+    """
+    fetched_at = source_data.get(fetched_at_key) if source_data is not None else None
+    if fetched_at is None:
+        return True
+    try:
+        fetched_at = datetime.fromisoformat(fetched_at)
+    except (TypeError, ValueError):
+        return True
+    ttl = timedelta(seconds=int(config.get('board_metadata_ttl_seconds', 3600)))
+    return fetched_at + ttl < datetime.utcnow()
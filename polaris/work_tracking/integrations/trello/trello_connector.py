@@ -11,7 +11,6 @@
 
 import pytz
 import logging
-import requests
 from enum import Enum
 from datetime import datetime
 
@@ -19,6 +18,8 @@ from polaris.integrations.trello import TrelloConnector
 from polaris.utils.config import get_config_provider
 from polaris.utils.exceptions import ProcessingException
 from polaris.work_tracking import connector_factory
+from polaris.work_tracking.integrations.http_sessions import get_http_session
+from polaris.work_tracking.integrations.source_data import fetched_at_key, fetched_at_stamp, is_source_data_stale
 from polaris.common.enums import WorkTrackingIntegrationType
 from polaris.utils.collections import find
 from polaris.common.enums import TrelloWorkItemType
@@ -32,6 +33,7 @@ class TrelloWorkTrackingConnector(TrelloConnector):
 
     def __init__(self, connector):
         super().__init__(connector)
+        self.http = get_http_session(connector.key)
 
     def map_project_to_work_items_sources_data(self, project):
         return dict(
@@ -49,7 +51,7 @@ class TrelloWorkTrackingConnector(TrelloConnector):
     def fetch_trello_boards(self):
         fetch_boards_url = f'{self.base_url}/members/me/boards'
         while fetch_boards_url is not None:
-            response = requests.get(
+            response = self.http.get(
                 fetch_boards_url,
                 headers={
                     'Authorization': f'OAuth oauth_consumer_key="{self.api_key}", oauth_token="{self.access_token}"'}
@@ -93,7 +95,7 @@ class TrelloWorkTrackingConnector(TrelloConnector):
             idModel=project_source_id
         )
 
-        response = requests.post(
+        response = self.http.post(
             add_hook_url,
             headers={"Accept": "application/json"},
             params=params
@@ -117,7 +119,7 @@ class TrelloWorkTrackingConnector(TrelloConnector):
             key=self.api_key,
             token=self.access_token
         )
-        response = requests.delete(
+        response = self.http.delete(
             delete_hook_url,
             headers={"Accept": "application/json"},
             params=params
@@ -144,7 +146,6 @@ class TrelloBoard(TrelloCardsWorkItemsSource):
 
     def __init__(self, token_provider, work_items_source, connector=None):
         self.work_items_source = work_items_source
-        self.last_updated = work_items_source.latest_work_item_update_timestamp
         self.board_lists = work_items_source.source_data.get(
             'board_lists') if work_items_source.source_data.get('board_lists') is not None else []
         self.board_labels = work_items_source.source_data.get(
@@ -157,6 +158,11 @@ class TrelloBoard(TrelloCardsWorkItemsSource):
         self.api_key = self.trello_connector.api_key
         self.access_token = self.trello_connector.access_token
 
+    @property
+    def last_updated(self):
+        # read from the work items source so that a cached provider sees the current sync watermark.
+        return self.work_items_source.latest_work_item_update_timestamp
+
     def resolve_work_item_type_for_card(self, labels):
         lower_case_labels = [label.lower() for label in labels]
         for label in lower_case_labels:
@@ -207,7 +213,7 @@ class TrelloBoard(TrelloCardsWorkItemsSource):
 
     def fetch_card(self, card_id):
         fetch_card_url = f'{self.trello_connector.base_url}/cards/{card_id}'
-        response = requests.get(
+        response = self.trello_connector.http.get(
             fetch_card_url,
             headers={
                 'Authorization': f'OAuth oauth_consumer_key="{self.api_key}", oauth_token="{self.access_token}"'}
@@ -223,7 +229,7 @@ class TrelloBoard(TrelloCardsWorkItemsSource):
         query_params = dict(limit=100)
         fetch_cards_url = f'{self.trello_connector.base_url}/boards/{self.source_project_id}/cards'
         while fetch_cards_url is not None:
-            response = requests.get(
+            response = self.trello_connector.http.get(
                 fetch_cards_url,
                 params=query_params,
                 headers={
@@ -251,7 +257,7 @@ class TrelloBoard(TrelloCardsWorkItemsSource):
     def fetch_board_lists(self):
         fetch_lists_url = f'{self.trello_connector.base_url}/boards/{self.source_project_id}/lists'
         while fetch_lists_url is not None:
-            response = requests.get(
+            response = self.trello_connector.http.get(
                 fetch_lists_url,
                 headers={
                     'Authorization': f'OAuth oauth_consumer_key="{self.api_key}", oauth_token="{self.access_token}"'}
@@ -270,7 +276,7 @@ class TrelloBoard(TrelloCardsWorkItemsSource):
     def fetch_board_labels(self):
         fetch_labels_url = f'{self.trello_connector.base_url}/boards/{self.source_project_id}/labels'
         while fetch_labels_url is not None:
-            response = requests.get(
+            response = self.trello_connector.http.get(
                 fetch_labels_url,
                 headers={
                     'Authorization': f'OAuth oauth_consumer_key="{self.api_key}", oauth_token="{self.access_token}"'}
@@ -291,7 +297,11 @@ class TrelloBoard(TrelloCardsWorkItemsSource):
         self.board_lists = [data for data in self.fetch_board_lists()][0]
         # Fetch board labels for type of card
         self.board_labels = [data for data in self.fetch_board_labels()][0]
-        source_data = dict(board_lists=self.board_lists, board_labels=self.board_labels)
+        source_data = {
+            'board_lists': self.board_lists,
+            'board_labels': self.board_labels,
+            fetched_at_key: fetched_at_stamp()
+        }
         source_states = []
         for board_list in self.board_lists:
             source_states.append(board_list['name'])
@@ -300,3 +310,15 @@ class TrelloBoard(TrelloCardsWorkItemsSource):
             source_data=source_data,
             source_states=self.source_states
         )
+
+    def has_board_metadata_for_card(self, card):
+        return find(self.board_lists, lambda board_list: board_list['id'] == card['idList']) is not None and all(
+            find(self.board_labels, lambda board_label: board_label['id'] == label_id) is not None
+            for label_id in card.get('idLabels') or []
+        )
+
+    def refresh_source_data_if_stale(self, force=False):
+        # Refetch the board lists and labels only if the copy saved in source_data is stale.
+        # Returns the updated work items source data, or None if the saved copy is still fresh.
+        if force or is_source_data_stale(self.work_items_source.source_data):
+            return self.before_work_item_sync()
@@ -17,6 +17,14 @@ from polaris.work_tracking.db import api
 from polaris.work_tracking.integrations.trello import TrelloBoard
 from polaris.work_tracking.db.model import WorkItemsSource
 
+board_metadata_events = [
+    'createLabel',
+    'updateLabel',
+    'deleteLabel',
+    'createList',
+    'updateList'
+]
+
 
 def handle_card_event(connector_key, payload, type, channel=None):
     event = json.loads(payload)
@@ -35,11 +43,10 @@ def handle_card_event(connector_key, payload, type, channel=None):
             if connector:
                 trello_board = TrelloBoard(token_provider=None, work_items_source=work_items_source,
                                            connector=connector)
-                work_items_source_data = trello_board.before_work_item_sync()
-                work_items_source.update(work_items_source_data)
-                session.flush()
-                if type in ['createLabel', 'updateLabel', 'deleteLabel']:
-                    # In case it is only a label event, we have already updated the labels list in work_items_source
+                if type in board_metadata_events:
+                    # In case it is only a label or list event, we just need to refresh the
+                    # board lists and labels saved in work_items_source
+                    work_items_source.update(trello_board.before_work_item_sync())
                     return []
                 else:
                     # Fetch the card details using API.
@@ -48,6 +55,15 @@ def handle_card_event(connector_key, payload, type, channel=None):
                     # and in case of label add or remove events we do not get the complete list
                     card_object = [card for card in trello_board.fetch_card(event['action']['data']['card']['id'])][0]
 
+                    # The saved board lists and labels are reused until they go stale, unless the card refers
+                    # to a list or label we have not seen yet.
+                    work_items_source_data = trello_board.refresh_source_data_if_stale(
+                        force=not trello_board.has_board_metadata_for_card(card_object)
+                    )
+                    if work_items_source_data is not None:
+                        work_items_source.update(work_items_source_data)
+                        session.flush()
+
                     issue_data = trello_board.map_card_to_work_item(card_object)
 
                     synced_issues = api.sync_work_items(work_items_source.key, [issue_data], join_this=session)
@@ -75,7 +91,9 @@ def handle_trello_event(connector_key, event_type, payload, channel=None):
         'removeLabelFromCard',
         'updateLabel',
         'deleteLabel',
-        'createLabel'
+        'createLabel',
+        'createList',
+        'updateList'
     ]
     if event_type in events_handled:
         return handle_card_event(connector_key, payload, event_type, channel)
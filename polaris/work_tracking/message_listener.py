@@ -19,7 +19,7 @@ from polaris.messaging.messages import ImportWorkItems, ImportWorkItem, WorkItem
 
 from polaris.work_tracking.messages import AtlassianConnectWorkItemEvent, RefreshConnectorProjects, \
     ResolveWorkItemsForEpic, GitlabProjectEvent, TrelloBoardEvent, ParentPathSelectorsChanged, CustomTagMappingChanged,\
-    ReprocessWorkItems
+    ReprocessWorkItems, FlushWorkItemEvents, ImportMissingParentWorkItems
 
 from polaris.messaging.topics import WorkItemsTopic, ConnectorsTopic, TopicSubscriber
 from polaris.messaging.utils import raise_message_processing_error
@@ -27,7 +27,7 @@ from polaris.utils.config import get_config_provider
 from polaris.utils.exceptions import ProcessingException
 from polaris.utils.logging import config_logging
 from polaris.utils.token_provider import get_token_provider
-from polaris.work_tracking import commands
+from polaris.work_tracking import commands, connector_factory, work_items_source_factory
 from polaris.work_tracking.integrations.atlassian import jira_message_handler
 from polaris.work_tracking.integrations.gitlab import gitlab_message_handler
 from polaris.work_tracking.integrations.trello import trello_message_handler
@@ -35,6 +35,7 @@ from polaris.work_tracking.integrations.trello import trello_message_handler
 from polaris.common.enums import ConnectorType, ConnectorProductType
 
 logger = logging.getLogger('polaris.work_tracking.message_listener')
+config = get_config_provider()
 
 
 # -------------------------------------------------
@@ -70,7 +71,9 @@ class WorkItemsTopicSubscriber(TopicSubscriber):
                 # Commands
                 ImportWorkItem,
                 ImportWorkItems,
-                ReprocessWorkItems
+                ReprocessWorkItems,
+                FlushWorkItemEvents,
+                ImportMissingParentWorkItems
             ],
             publisher=publisher,
             exclusive=False
@@ -93,30 +96,33 @@ class WorkItemsTopicSubscriber(TopicSubscriber):
 
         elif ImportWorkItem.message_type == message.message_type:
             work_items = self.process_import_work_item(message)
+            created = [work_item for work_item in work_items if work_item.get('is_new')]
+            updated = [work_item for work_item in work_items if not work_item.get('is_new')]
+            # A single import can fan out to many items when parent child relationships get resolved,
+            # so we publish these in batches rather than one message per item.
+            max_items_per_message = int(config.get('work_items_max_items_per_message', 500))
             created_messages = []
+            for start in range(0, len(created), max_items_per_message):
+                created_message = WorkItemsCreated(send=dict(
+                    organization_key=message['organization_key'],
+                    work_items_source_key=message['work_items_source_key'],
+                    new_work_items=created[start:start + max_items_per_message]
+                ))
+                self.publish(WorkItemsTopic, created_message, channel=channel)
+                created_messages.append(created_message)
+
             updated_messages = []
-            for work_item in work_items:
-                if work_item.get('is_new'):
-                    created_message = WorkItemsCreated(send=dict(
-                        organization_key=message['organization_key'],
-                        work_items_source_key=message['work_items_source_key'],
-                        new_work_items=[work_item]
-                    ))
-                    self.publish(WorkItemsTopic, created_message, channel=channel)
-                    created_messages.append(created_message)
-                else:
-                    updated_message = WorkItemsUpdated(send=dict(
-                        organization_key=message['organization_key'],
-                        work_items_source_key=message['work_items_source_key'],
-                        updated_work_items=[work_item]
-                    ))
-                    self.publish(WorkItemsTopic, updated_message, channel=channel)
-                    updated_messages.append(updated_message)
+            for start in range(0, len(updated), max_items_per_message):
+                updated_message = WorkItemsUpdated(send=dict(
+                    organization_key=message['organization_key'],
+                    work_items_source_key=message['work_items_source_key'],
+                    updated_work_items=updated[start:start + max_items_per_message]
+                ))
+                self.publish(WorkItemsTopic, updated_message, channel=channel)
+                updated_messages.append(updated_message)
 
             return created_messages, updated_messages
 
-
-
         elif ImportWorkItems.message_type == message.message_type:
             total = 0
             messages = []
@@ -171,6 +177,12 @@ class WorkItemsTopicSubscriber(TopicSubscriber):
         elif ReprocessWorkItems.message_type == message.message_type:
             return self.process_reprocess_work_items(message)
 
+        elif FlushWorkItemEvents.message_type == message.message_type:
+            return self.process_flush_work_item_events(message)
+
+        elif ImportMissingParentWorkItems.message_type == message.message_type:
+            return self.process_import_missing_parent_work_items(message)
+
     def process_import_work_item(self, message):
         work_items_source_key = message['work_items_source_key']
         logger.info(f"Processing  {message.message_type}: "
@@ -214,38 +226,31 @@ class WorkItemsTopicSubscriber(TopicSubscriber):
             jira_event_type = 'issue_moved'
 
         try:
-            if jira_event_type in ['issue_created', 'issue_updated']:
+            if jira_event_type in ['issue_created', 'issue_updated'] and self.coalesce_jira_issue_events():
+                # The event is buffered, and synced along with the other events for the project
+                # that arrive before the flush command is processed.
+                result = jira_message_handler.buffer_issue_event(jira_connector_key, jira_event_type, jira_event)
+                if result is not None and result['flush']:
+                    flush_message = FlushWorkItemEvents(send=dict(
+                        organization_key=result['organization_key'],
+                        work_items_source_key=result['work_items_source_key']
+                    ))
+                    self.publish(WorkItemsTopic, flush_message)
+                    return [flush_message]
+                return []
+
+            elif jira_event_type in ['issue_created', 'issue_updated']:
                 result = jira_message_handler.handle_issue_events(jira_connector_key, jira_event_type,
                                                                      jira_event)
                 created = []
                 updated = []
 
                 if result is not None and len(result['work_items']) > 0:
-                    organization_key = result['organization_key']
-                    work_items_source_key = result['work_items_source_key']
-
-                    for work_item in result['work_items']:
-                        if work_item.get('is_new'):
-                            created.append(work_item)
-                        elif work_item.get('is_updated'):
-                            updated.append(work_item)
-
-                    if len(created) > 0:
-                        created_message = WorkItemsCreated(send=dict(
-                            organization_key=organization_key,
-                            work_items_source_key=work_items_source_key,
-                            new_work_items=created
-                        ))
-                        self.publish(WorkItemsTopic, created_message)
-
-                    if len(updated) > 0:
-                        updated_message = WorkItemsUpdated(send=dict(
-                            organization_key=organization_key,
-                            work_items_source_key=work_items_source_key,
-                            updated_work_items=updated
-                        ))
-                        self.publish(WorkItemsTopic, updated_message)
-
+                    created, updated = self.publish_work_items_changes(
+                        result['organization_key'],
+                        result['work_items_source_key'],
+                        result['work_items']
+                    )
 
                 return [*created, *updated]
 
@@ -324,6 +329,62 @@ class WorkItemsTopicSubscriber(TopicSubscriber):
         except Exception as exc:
             raise_message_processing_error(message, 'Failed to handle atlassian_connect_message', str(exc))
 
+    @staticmethod
+    def coalesce_jira_issue_events():
+        return str(config.get('coalesce_jira_issue_events', False)).lower() == 'true'
+
+    def publish_work_items_changes(self, organization_key, work_items_source_key, work_items):
+        created = []
+        updated = []
+        for work_item in work_items:
+            if work_item.get('is_new'):
+                created.append(work_item)
+            elif work_item.get('is_updated'):
+                updated.append(work_item)
+
+        if len(created) > 0:
+            created_message = WorkItemsCreated(send=dict(
+                organization_key=organization_key,
+                work_items_source_key=work_items_source_key,
+                new_work_items=created
+            ))
+            self.publish(WorkItemsTopic, created_message)
+
+        if len(updated) > 0:
+            updated_message = WorkItemsUpdated(send=dict(
+                organization_key=organization_key,
+                work_items_source_key=work_items_source_key,
+                updated_work_items=updated
+            ))
+            self.publish(WorkItemsTopic, updated_message)
+
+        return created, updated
+
+    def process_flush_work_item_events(self, message):
+        organization_key = message['organization_key']
+        work_items_source_key = message['work_items_source_key']
+        logger.info(f"Processing  {message.message_type}: for work_items_source {work_items_source_key}")
+        try:
+            result = jira_message_handler.flush_issue_events(
+                work_items_source_key,
+                max_events=int(config.get('coalesce_jira_issue_events_max_batch_size', 200))
+            )
+            created, updated = self.publish_work_items_changes(
+                organization_key,
+                work_items_source_key,
+                result['work_items']
+            )
+            if result['remaining'] > 0:
+                # events that did not fit in this batch.
+                self.publish(WorkItemsTopic, FlushWorkItemEvents(send=dict(
+                    organization_key=organization_key,
+                    work_items_source_key=work_items_source_key
+                )))
+
+            return [*created, *updated]
+        except Exception as exc:
+            raise_message_processing_error(message, 'Failed to flush work item events', str(exc))
+
     def process_gitlab_project_event(self, message):
         connector_key = message['connector_key']
         event_type = message['event_type']
@@ -358,51 +419,65 @@ class WorkItemsTopicSubscriber(TopicSubscriber):
         except Exception as exc:
             raise_message_processing_error(message, 'Failed to process trello board event', str(exc))
 
-    def process_work_items_created(self, message):
-        response_messages = []
+    def publish_import_missing_parents(self, organization_key, work_items_source_key, work_items):
+        # Parents that are known to be missing from the source are not requested again until the negative cache
+        # entry expires. The rest are imported in batches, one message per batch.
         parents_to_import = set()
-        for work_item in message['new_work_items']:
+        for work_item in work_items:
             if work_item.get('parent_source_display_id') is not None and work_item.get('parent_key') is None:
-                parents_to_import.add(work_item.get('parent_source_display_id'))
+                if not commands.is_missing_work_item(work_items_source_key, work_item.get('parent_source_display_id')):
+                    parents_to_import.add(work_item.get('parent_source_display_id'))
 
-        for work_item_id in parents_to_import:
-            response_message = ImportWorkItem(
+        parents_to_import = sorted(parents_to_import)
+        batch_size = int(config.get('import_missing_parents_batch_size', 100))
+        response_messages = []
+        for start in range(0, len(parents_to_import), batch_size):
+            response_message = ImportMissingParentWorkItems(
                 send=dict(
-                    organization_key=message['organization_key'],
-                    work_items_source_key=message['work_items_source_key'],
-                    source_id=work_item_id
+                    organization_key=organization_key,
+                    work_items_source_key=work_items_source_key,
+                    source_ids=parents_to_import[start:start + batch_size]
                 )
             )
             self.publish(WorkItemsTopic, response_message)
             response_messages.append(response_message)
         return response_messages
 
-    def process_work_items_updated(self, message):
-        response_messages = []
+    def process_work_items_created(self, message):
+        return self.publish_import_missing_parents(
+            message['organization_key'],
+            message['work_items_source_key'],
+            message['new_work_items']
+        )
 
-        parents_to_import = set()
-        for work_item in message['updated_work_items']:
-            if work_item.get('parent_source_display_id') is not None and work_item.get('parent_key') is None:
-                parents_to_import.add(work_item.get('parent_source_display_id'))
+    def process_work_items_updated(self, message):
+        return self.publish_import_missing_parents(
+            message['organization_key'],
+            message['work_items_source_key'],
+            message['updated_work_items']
+        )
 
-        for work_item_id in parents_to_import:
-            response_message = ImportWorkItem(
-                send=dict(
-                    organization_key=message['organization_key'],
-                    work_items_source_key=message['work_items_source_key'],
-                    source_id=work_item_id
-                )
+    def process_import_missing_parent_work_items(self, message):
+        organization_key = message['organization_key']
+        work_items_source_key = message['work_items_source_key']
+        logger.info(f"Processing  {message.message_type}: "
+                    f" Work Items Source Key : {work_items_source_key}")
+        try:
+            work_items = commands.import_missing_work_items(
+                self.consumer_context.token_provider,
+                work_items_source_key,
+                message['source_ids']
             )
-            self.publish(WorkItemsTopic, response_message)
-            response_messages.append(response_message)
-        return response_messages
-
-
+            created, updated = self.publish_work_items_changes(organization_key, work_items_source_key, work_items)
+            return [*created, *updated]
+        except Exception as exc:
+            raise_message_processing_error(message, 'Failed to import missing parent work items', str(exc))
 
     def process_parent_path_selectors_changed(self, message):
         organization_key = message['organization_key']
         work_items_source_key = message['work_items_source_key']
         logger.info(f"Processing  {message.message_type}: for organization {organization_key} and work_items_source {work_items_source_key}")
+        work_items_source_factory.invalidate_provider(work_items_source_key)
         try:
             return self.reprocess_work_items(organization_key, work_items_source_key, ['parent_source_display_id'])
         except Exception as exc:
@@ -412,6 +487,7 @@ class WorkItemsTopicSubscriber(TopicSubscriber):
         organization_key = message['organization_key']
         work_items_source_key = message['work_items_source_key']
         logger.info(f"Processing  {message.message_type}: for organization {organization_key} and work_items_source {work_items_source_key}")
+        work_items_source_factory.invalidate_provider(work_items_source_key)
 
         try:
             return self.reprocess_work_items(organization_key, work_items_source_key,['tags'])
@@ -488,6 +564,10 @@ class ConnectorsTopicSubscriber(TopicSubscriber):
             return created_messages, updated_messages
 
         elif ConnectorEvent.message_type == message.message_type:
+            # The connector may have been updated, and the cached providers hold on to their connectors.
+            connector_factory.invalidate_connector(message['connector_key'])
+            work_items_source_factory.invalidate_all_providers()
+
             created_messages = []
             updated_messages = []
             for created, updated in self.process_connector_event(message):
@@ -509,6 +589,7 @@ class ConnectorsTopicSubscriber(TopicSubscriber):
         if len(updated) > 0:
             logger.info(f"{len(updated)} work items sources updated")
             for work_items_source in updated:
+                work_items_source_factory.invalidate_provider(work_items_source['key'])
                 updated_message = WorkItemsSourceUpdated(
                     send=dict(
                         work_items_source=work_items_source
@@ -16,6 +16,8 @@ from .gitlab_project_event import GitlabProjectEvent
 from .trello_board_event import TrelloBoardEvent
 from .work_items_source_parameters_changed import ParentPathSelectorsChanged, CustomTagMappingChanged
 from .reprocess_work_items import ReprocessWorkItems
+from .flush_work_item_events import FlushWorkItemEvents
+from .import_missing_parent_work_items import ImportMissingParentWorkItems
 
 # Add this to the global message factory so that the messages can be deserialized on receipt.
 register_messages([
@@ -26,6 +28,8 @@ register_messages([
     TrelloBoardEvent,
     ParentPathSelectorsChanged,
     CustomTagMappingChanged,
-    ReprocessWorkItems
+    ReprocessWorkItems,
+    FlushWorkItemEvents,
+    ImportMissingParentWorkItems
 ])
 
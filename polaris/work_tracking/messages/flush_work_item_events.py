@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+
+# Copyright: © Exathink, LLC (2011-2026) All Rights Reserved
+
+# Unauthorized use or copying of this file and its contents, via any medium
+# is strictly prohibited. The work product in this file is proprietary and
+# confidential.
+
+# Author: Krishna Kumar
+
+from marshmallow import fields
+
+from polaris.messaging.messages import Command
+
+
+class FlushWorkItemEvents(Command):
+    message_type = 'commands.flush_work_item_events'
+
+    organization_key = fields.String(required=True)
+    work_items_source_key = fields.String(required=True)
@@ -17,6 +17,7 @@ from polaris.work_tracking.db import api
 from polaris.messaging.topics import WorkItemsTopic
 from polaris.messaging.utils import publish, init_topics_to_publish, shutdown
 from polaris.messaging.messages import ImportWorkItems
+from polaris.work_tracking.messages import FlushWorkItemEvents
 from logging import getLogger
 
 logger = getLogger('polaris.work_tracking.sync_agent')
@@ -25,12 +26,20 @@ logger = getLogger('polaris.work_tracking.sync_agent')
 class WorkTrackingAgent(Agent):
 
     def run(self):
-        self.loop(self.sync_work_item_sources)
+        self.loop(self.poll)
+
+    def poll(self):
+        self.sync_work_item_sources()
+        if not self.exit_signal_received:
+            self.flush_stale_work_item_events()
+        return True
 
     def sync_work_item_sources(self):
         logger.info("Checking for work items sources to sync")
         found = False
-        for source in api.get_work_items_sources_to_sync():
+        # Only sources that are due and do not have a sync in flight are returned, and
+        # each of them is leased to this import until it finishes and schedules its next sync.
+        for source in api.claim_work_items_sources_to_sync():
             found = True
             publish(
                 WorkItemsTopic,
@@ -44,6 +53,20 @@ class WorkTrackingAgent(Agent):
             logger.info("No sources found to sync...")
         return True
 
+    def flush_stale_work_item_events(self):
+        # Buffered webhook events are normally flushed by the flush command published when they are buffered.
+        # This picks up the buffers whose flush was lost or failed.
+        for source in api.get_work_items_sources_with_stale_events():
+            logger.info(f"Scheduling a flush of stale work item events for {source['work_items_source_key']}")
+            publish(
+                WorkItemsTopic,
+                FlushWorkItemEvents(send=source)
+            )
+            if self.exit_signal_received:
+                shutdown()
+                break
+        return True
+
 
 def start(name=None, poll_interval=None, one_shot=False):
     agent = WorkTrackingAgent(
@@ -8,7 +8,13 @@
 
 # Author: Krishna Kumar
 
+import copy
+import json
+
+from sqlalchemy import inspect
+
 from polaris.common.enums import WorkTrackingIntegrationType
+from polaris.utils.config import get_config_provider
 from polaris.utils.exceptions import ProcessingException
 from polaris.work_tracking.integrations.atlassian.jira_work_items_source import JiraWorkItemsSource
 from polaris.work_tracking.integrations.github import GithubIssuesWorkItemsSource
@@ -17,29 +23,114 @@ from polaris.work_tracking.integrations.gitlab import GitlabIssuesWorkItemsSourc
 from polaris.work_tracking.integrations.trello import TrelloCardsWorkItemsSource
 from polaris.common import db
 from polaris.work_tracking.db.model import WorkItemsSource
+from polaris.work_tracking.cache import ExpiringCache, any_version
+
+config = get_config_provider()
+
+provider_cache = ExpiringCache(
+    'work_items_source_providers',
+    ttl=int(config.get('work_items_source_provider_cache_ttl_seconds', 300)),
+    max_size=int(config.get('work_items_source_provider_cache_max_size', 1000))
+)
+
+
+def create_provider_impl(token_provider, work_items_source):
+    if work_items_source.integration_type == WorkTrackingIntegrationType.github.value:
+        return GithubIssuesWorkItemsSource.create(token_provider, work_items_source)
+    elif work_items_source.integration_type == WorkTrackingIntegrationType.pivotal.value:
+        return PivotalTrackerWorkItemsSource.create(token_provider, work_items_source)
+    elif work_items_source.integration_type == WorkTrackingIntegrationType.jira.value:
+        return JiraWorkItemsSource.create(token_provider, work_items_source)
+    elif work_items_source.integration_type == WorkTrackingIntegrationType.gitlab.value:
+        return GitlabIssuesWorkItemsSource.create(token_provider, work_items_source)
+    elif work_items_source.integration_type == WorkTrackingIntegrationType.trello.value:
+        return TrelloCardsWorkItemsSource.create(token_provider, work_items_source)
+    else:
+        raise ProcessingException(
+            f'Could not determine work_items_source_implementation for work_items_source_key {work_items_source.key}'
+        )
 
 
 def get_provider_impl(token_provider, work_items_source_key, join_this=None):
     with db.orm_session(join_this) as session:
         work_items_source = WorkItemsSource.find_by_key(session, work_items_source_key)
         if work_items_source:
-            if work_items_source.integration_type == WorkTrackingIntegrationType.github.value:
-                work_items_source_impl = GithubIssuesWorkItemsSource.create(token_provider, work_items_source)
-            elif work_items_source.integration_type == WorkTrackingIntegrationType.pivotal.value:
-                work_items_source_impl = PivotalTrackerWorkItemsSource.create(token_provider, work_items_source)
-            elif work_items_source.integration_type == WorkTrackingIntegrationType.jira.value:
-                work_items_source_impl = JiraWorkItemsSource.create(token_provider, work_items_source)
-            elif work_items_source.integration_type == WorkTrackingIntegrationType.gitlab.value:
-                work_items_source_impl = GitlabIssuesWorkItemsSource.create(token_provider, work_items_source)
-            elif work_items_source.integration_type == WorkTrackingIntegrationType.trello.value:
-                work_items_source_impl = TrelloCardsWorkItemsSource.create(token_provider, work_items_source)
-            else:
-                raise ProcessingException(
-                    f'Could not determine work_items_source_implementation for work_items_source_key {work_items_source.key}'
-                )
-            return work_items_source_impl
+            return create_provider_impl(token_provider, work_items_source)
 
         else:
             raise ProcessingException(
                 f'Could not find work_items_source with key {work_items_source_key}'
             )
+
+
+def work_items_source_snapshot(work_items_source):
+    # A transient copy of the column values of a work items source. Cached providers hold on to this
+    # rather than the ORM instance, which would be detached from its session once the lookup returns,
+    # but it still has the properties and methods of a work items source.
+    return WorkItemsSource(**{
+        attribute.key: copy.deepcopy(getattr(work_items_source, attribute.key))
+        for attribute in inspect(WorkItemsSource).column_attrs
+    })
+
+
+def provider_version(work_items_source):
+    # Everything a provider is built from, so a change to any of it in
+    # any process is picked up on the next lookup that passes in the current work items source.
+    return json.dumps(
+        dict(
+            parameters=work_items_source.parameters,
+            custom_fields=work_items_source.custom_fields,
+            source_id=work_items_source.source_id,
+            source_data=work_items_source.source_data,
+            source_states=work_items_source.source_states,
+            connector_key=work_items_source.connector_key,
+            integration_type=work_items_source.integration_type,
+            work_items_source_type=work_items_source.work_items_source_type
+        ),
+        sort_keys=True,
+        default=str
+    )
+
+
+def get_cached_provider_impl(token_provider, work_items_source_key, work_items_source=None, join_this=None):
+    """
+    Returns the provider for a work items source, reusing it across calls until the entry expires or it is
+    invalidated by a work items source or connector event.
+
+    A lookup by key alone does not touch the database when the provider is cached. Callers that have already
+    loaded the work items source can pass it in: the provider is then rebuilt if the state it is built from
+    has changed, and its copy of the work items source is refreshed from it, so that sync state such as the
+    import state and the sync watermark is current.
+    """
+    cache_key = str(work_items_source_key)
+    version = provider_version(work_items_source) if work_items_source is not None else any_version
+    provider = provider_cache.peek(cache_key, version=version)
+    if provider is None:
+        if work_items_source is None:
+            with db.orm_session(join_this) as session:
+                work_items_source = WorkItemsSource.find_by_key(session, work_items_source_key)
+                if work_items_source is None:
+                    raise ProcessingException(
+                        f'Could not find work_items_source with key {work_items_source_key}'
+                    )
+                provider = create_provider_impl(token_provider, work_items_source_snapshot(work_items_source))
+                version = provider_version(work_items_source)
+        else:
+            provider = create_provider_impl(token_provider, work_items_source_snapshot(work_items_source))
+        provider_cache.put(cache_key, provider, version=version)
+    elif work_items_source is not None:
+        refresh_work_items_source(provider, work_items_source)
+
+    return provider
+
+
+def refresh_work_items_source(provider, work_items_source):
+    provider.work_items_source = work_items_source_snapshot(work_items_source)
+
+
+def invalidate_provider(work_items_source_key):
+    provider_cache.invalidate(str(work_items_source_key))
+
+
+def invalidate_all_providers():
+    provider_cache.invalidate_all()
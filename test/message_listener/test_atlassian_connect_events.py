@@ -20,8 +20,10 @@ from polaris.messaging.messages import WorkItemsCreated, WorkItemsUpdated, WorkI
 from polaris.messaging.test_utils import fake_send, mock_publisher, mock_channel
 from polaris.messaging.topics import WorkItemsTopic
 from polaris.utils.token_provider import get_token_provider
+from polaris.work_tracking.db import api
+from polaris.work_tracking.integrations.atlassian.jira_work_items_source import JiraProject
 from polaris.work_tracking.message_listener import WorkItemsTopicSubscriber
-from polaris.work_tracking.messages import AtlassianConnectWorkItemEvent
+from polaris.work_tracking.messages import AtlassianConnectWorkItemEvent, FlushWorkItemEvents
 
 mock_consumer = MagicMock(MessageConsumer)
 mock_consumer.token_provider = get_token_provider()
@@ -857,3 +859,291 @@ class TestAtlassianConnectEvent:
         message = subscriber.dispatch(mock_channel, jira_issue_updated_message)
         assert message
         publisher.assert_topic_called_with_message(WorkItemsTopic, WorkItemMoved)
+
+
+class TestCoalescedAtlassianConnectEvents:
+
+    @pytest.fixture()
+    def setup(self, jira_work_item_source_fixture, cleanup):
+        work_items_source, jira_project_id, connector_key = jira_work_item_source_fixture
+        with patch(
+                'polaris.work_tracking.message_listener.WorkItemsTopicSubscriber.coalesce_jira_issue_events',
+                return_value=True
+        ):
+            yield Fixture(
+                work_items_source=work_items_source,
+                project_id=jira_project_id,
+                connector_key=connector_key
+            )
+
+    @staticmethod
+    def issue_event_message(connector_key, event_type, issue):
+        return fake_send(
+            AtlassianConnectWorkItemEvent(send=dict(
+                atlassian_connector_key=connector_key,
+                atlassian_event_type=event_type,
+                atlassian_event=json.dumps(dict(
+                    timestamp=jira_test_time_stamp(),
+                    event=event_type,
+                    issue=issue
+                ))
+            ))
+        )
+
+    def it_buffers_issue_events_and_publishes_a_flush_command_for_the_first_one(self, setup):
+        fixture = setup
+
+        publisher = mock_publisher()
+        subscriber = WorkItemsTopicSubscriber(mock_channel(), publisher=publisher)
+        subscriber.consumer_context = mock_consumer
+
+        for issue_id in ["10001", "10002", "10003"]:
+            subscriber.dispatch(
+                mock_channel,
+                self.issue_event_message(
+                    fixture.connector_key,
+                    'issue_created',
+                    create_issue(fixture.project_id, f"PRJ-{issue_id}", issue_id)
+                )
+            )
+
+        publisher.assert_topic_called_with_message(WorkItemsTopic, FlushWorkItemEvents, call_count=1)
+        assert db.connection().execute(
+            f"select count(id) from work_tracking.work_item_events "
+            f"where work_items_source_id={fixture.work_items_source.id}"
+        ).scalar() == 3
+        assert db.connection().execute(
+            f"select count(id) from work_tracking.work_items "
+            f"where work_items_source_id={fixture.work_items_source.id}"
+        ).scalar() == 0
+
+    def it_keeps_only_the_latest_event_for_an_issue(self, setup):
+        fixture = setup
+
+        publisher = mock_publisher()
+        subscriber = WorkItemsTopicSubscriber(mock_channel(), publisher=publisher)
+        subscriber.consumer_context = mock_consumer
+
+        issue = create_issue(fixture.project_id, "PRJ-10001", "10001")
+        subscriber.dispatch(mock_channel, self.issue_event_message(fixture.connector_key, 'issue_created', issue))
+        issue['fields']['summary'] = 'Updated summary'
+        subscriber.dispatch(mock_channel, self.issue_event_message(fixture.connector_key, 'issue_updated', issue))
+
+        assert db.connection().execute(
+            f"select count(id) from work_tracking.work_item_events "
+            f"where work_items_source_id={fixture.work_items_source.id}"
+        ).scalar() == 1
+        assert db.connection().execute(
+            f"select payload->'fields'->>'summary' from work_tracking.work_item_events "
+            f"where work_items_source_id={fixture.work_items_source.id}"
+        ).scalar() == 'Updated summary'
+
+    def it_syncs_all_the_buffered_events_on_flush(self, setup):
+        fixture = setup
+
+        publisher = mock_publisher()
+        subscriber = WorkItemsTopicSubscriber(mock_channel(), publisher=publisher)
+        subscriber.consumer_context = mock_consumer
+
+        flush_message = None
+        for issue_id in ["10001", "10002", "10003"]:
+            messages = subscriber.dispatch(
+                mock_channel,
+                self.issue_event_message(
+                    fixture.connector_key,
+                    'issue_created',
+                    create_issue(fixture.project_id, f"PRJ-{issue_id}", issue_id)
+                )
+            )
+            if len(messages) > 0:
+                flush_message = messages[0]
+
+        publisher = mock_publisher()
+        subscriber = WorkItemsTopicSubscriber(mock_channel(), publisher=publisher)
+        subscriber.consumer_context = mock_consumer
+
+        work_items = subscriber.dispatch(mock_channel, fake_send(flush_message))
+
+        assert len(work_items) == 3
+        publisher.assert_topic_called_with_message(WorkItemsTopic, WorkItemsCreated)
+        assert db.connection().execute(
+            f"select count(id) from work_tracking.work_items "
+            f"where work_items_source_id={fixture.work_items_source.id}"
+        ).scalar() == 3
+        assert db.connection().execute(
+            f"select count(id) from work_tracking.work_item_events "
+            f"where work_items_source_id={fixture.work_items_source.id}"
+        ).scalar() == 0
+
+    def it_drops_the_events_that_fail_to_map_and_syncs_the_rest(self, setup):
+        fixture = setup
+
+        publisher = mock_publisher()
+        subscriber = WorkItemsTopicSubscriber(mock_channel(), publisher=publisher)
+        subscriber.consumer_context = mock_consumer
+
+        flush_message = None
+        for issue_id in ["10001", "10002", "10003"]:
+            messages = subscriber.dispatch(
+                mock_channel,
+                self.issue_event_message(
+                    fixture.connector_key,
+                    'issue_created',
+                    create_issue(fixture.project_id, f"PRJ-{issue_id}", issue_id)
+                )
+            )
+            if len(messages) > 0:
+                flush_message = messages[0]
+
+        map_issue_to_work_item_data = JiraProject.map_issue_to_work_item_data
+
+        def map_or_fail(project, issue):
+            if issue['id'] == "10002":
+                raise Exception('Malformed issue')
+            return map_issue_to_work_item_data(project, issue)
+
+        with patch.object(JiraProject, 'map_issue_to_work_item_data', autospec=True, side_effect=map_or_fail):
+            work_items = subscriber.dispatch(mock_channel, fake_send(flush_message))
+
+        assert len(work_items) == 2
+        assert db.connection().execute(
+            f"select count(id) from work_tracking.work_items "
+            f"where work_items_source_id={fixture.work_items_source.id}"
+        ).scalar() == 2
+        assert db.connection().execute(
+            f"select count(id) from work_tracking.work_item_events "
+            f"where work_items_source_id={fixture.work_items_source.id}"
+        ).scalar() == 0
+
+    def it_publishes_another_flush_command_when_the_oldest_pending_event_is_stale(self, setup):
+        fixture = setup
+
+        publisher = mock_publisher()
+        subscriber = WorkItemsTopicSubscriber(mock_channel(), publisher=publisher)
+        subscriber.consumer_context = mock_consumer
+
+        subscriber.dispatch(
+            mock_channel,
+            self.issue_event_message(
+                fixture.connector_key, 'issue_created', create_issue(fixture.project_id, "PRJ-10001", "10001")
+            )
+        )
+        # the flush for the first event was lost.
+        db.connection().execute(
+            f"update work_tracking.work_item_events set received_at = received_at - interval '1 hour' "
+            f"where work_items_source_id={fixture.work_items_source.id}"
+        )
+        subscriber.dispatch(
+            mock_channel,
+            self.issue_event_message(
+                fixture.connector_key, 'issue_created', create_issue(fixture.project_id, "PRJ-10002", "10002")
+            )
+        )
+
+        publisher.assert_topic_called_with_message(WorkItemsTopic, FlushWorkItemEvents, call_count=2)
+
+    def it_finds_the_work_items_sources_with_stale_events(self, setup):
+        fixture = setup
+
+        publisher = mock_publisher()
+        subscriber = WorkItemsTopicSubscriber(mock_channel(), publisher=publisher)
+        subscriber.consumer_context = mock_consumer
+
+        subscriber.dispatch(
+            mock_channel,
+            self.issue_event_message(
+                fixture.connector_key, 'issue_created', create_issue(fixture.project_id, "PRJ-10001", "10001")
+            )
+        )
+        assert api.get_work_items_sources_with_stale_events(flush_after_seconds=60) == []
+
+        db.connection().execute(
+            f"update work_tracking.work_item_events set received_at = received_at - interval '1 hour' "
+            f"where work_items_source_id={fixture.work_items_source.id}"
+        )
+        stale = api.get_work_items_sources_with_stale_events(flush_after_seconds=60)
+
+        assert [source['work_items_source_key'] for source in stale] == [fixture.work_items_source.key]
+
+    def it_publishes_a_flush_command_for_an_event_that_replaces_a_claimed_event(self, setup):
+        fixture = setup
+
+        publisher = mock_publisher()
+        subscriber = WorkItemsTopicSubscriber(mock_channel(), publisher=publisher)
+        subscriber.consumer_context = mock_consumer
+
+        issue = create_issue(fixture.project_id, "PRJ-10001", "10001")
+        subscriber.dispatch(mock_channel, self.issue_event_message(fixture.connector_key, 'issue_created', issue))
+        # a flush has claimed the event and is syncing it.
+        db.connection().execute(
+            f"update work_tracking.work_item_events "
+            f"set claim_token='{uuid.uuid4()}', claimed_until = now() at time zone 'utc' + interval '5 minutes' "
+            f"where work_items_source_id={fixture.work_items_source.id}"
+        )
+        issue['fields']['summary'] = 'Updated summary'
+        subscriber.dispatch(mock_channel, self.issue_event_message(fixture.connector_key, 'issue_updated', issue))
+
+        publisher.assert_topic_called_with_message(WorkItemsTopic, FlushWorkItemEvents, call_count=2)
+        assert db.connection().execute(
+            f"select count(id) from work_tracking.work_item_events "
+            f"where work_items_source_id={fixture.work_items_source.id} and claim_token is null"
+        ).scalar() == 1
+
+    def it_backs_off_the_events_of_a_failed_flush(self, setup):
+        fixture = setup
+
+        publisher = mock_publisher()
+        subscriber = WorkItemsTopicSubscriber(mock_channel(), publisher=publisher)
+        subscriber.consumer_context = mock_consumer
+
+        subscriber.dispatch(
+            mock_channel,
+            self.issue_event_message(
+                fixture.connector_key, 'issue_created', create_issue(fixture.project_id, "PRJ-10001", "10001")
+            )
+        )
+
+        with patch('polaris.work_tracking.db.api.sync_work_items', side_effect=Exception('sync failed')):
+            with pytest.raises(Exception):
+                api.flush_work_item_events(
+                    fixture.work_items_source.key,
+                    lambda work_items_source, event: None
+                )
+
+        attempts, backed_off = db.connection().execute(
+            f"select attempts, claimed_until > now() at time zone 'utc' from work_tracking.work_item_events "
+            f"where work_items_source_id={fixture.work_items_source.id}"
+        ).fetchone()
+        assert attempts == 1
+        assert backed_off
+        assert api.get_work_items_sources_with_stale_events(flush_after_seconds=0) == []
+
+    def it_drops_the_events_of_a_flush_that_failed_too_many_times(self, setup):
+        fixture = setup
+
+        publisher = mock_publisher()
+        subscriber = WorkItemsTopicSubscriber(mock_channel(), publisher=publisher)
+        subscriber.consumer_context = mock_consumer
+
+        subscriber.dispatch(
+            mock_channel,
+            self.issue_event_message(
+                fixture.connector_key, 'issue_created', create_issue(fixture.project_id, "PRJ-10001", "10001")
+            )
+        )
+        db.connection().execute(
+            f"update work_tracking.work_item_events set attempts = 4 "
+            f"where work_items_source_id={fixture.work_items_source.id}"
+        )
+
+        with patch('polaris.work_tracking.db.api.sync_work_items', side_effect=Exception('sync failed')):
+            with pytest.raises(Exception):
+                api.flush_work_item_events(
+                    fixture.work_items_source.key,
+                    lambda work_items_source, event: None
+                )
+
+        assert db.connection().execute(
+            f"select count(id) from work_tracking.work_item_events "
+            f"where work_items_source_id={fixture.work_items_source.id}"
+        ).scalar() == 0
@@ -18,6 +18,7 @@ from polaris.messaging.messages import \
 from polaris.messaging.test_utils import mock_publisher, mock_channel, assert_topic_and_message, fake_send
 from polaris.utils.token_provider import get_token_provider
 from polaris.work_tracking.message_listener import WorkItemsTopicSubscriber
+from polaris.work_tracking.db import api
 from polaris.messaging.topics import WorkItemsTopic
 from polaris.utils.exceptions import ProcessingException
 
@@ -130,3 +131,33 @@ class TestWorkItemsTopicSubscriber:
 
                 assert len(updated) == 1
                 publisher.assert_topic_called_with_message(WorkItemsTopic, WorkItemsUpdated)
+
+        def it_publishes_one_message_for_all_the_children_resolved_by_the_import(self, jira_work_item_source_fixture,
+                                                                               cleanup):
+            work_items_source, jira_project_id, connector_key = jira_work_item_source_fixture
+            epic, *children = new_work_items_jira()[0:4]
+            for child in children:
+                child['parent_source_display_id'] = epic['source_display_id']
+            # the children arrive before the epic
+            api.sync_work_items(work_items_source.key, children)
+
+            with patch(
+                    'polaris.work_tracking.integrations.atlassian.jira_work_items_source.JiraProject.fetch_work_item') as fetch_work_item:
+                fetch_work_item.return_value = epic
+
+                import_work_item_message = fake_send(
+                    ImportWorkItem(send=dict(
+                        organization_key=polaris_organization_key,
+                        work_items_source_key=work_items_source.key,
+                        source_id=epic['source_display_id']
+                    ))
+                )
+
+                publisher = mock_publisher()
+                subscriber = WorkItemsTopicSubscriber(mock_channel, publisher=publisher)
+                subscriber.consumer_context = mock_consumer
+
+                created, updated = subscriber.dispatch(mock_channel, import_work_item_message)
+                assert len(created) == 1
+                assert len(updated) == 1
+                assert len(updated[0]['updated_work_items']) == 3
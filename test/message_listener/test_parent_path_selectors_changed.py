@@ -258,6 +258,43 @@ class TestParentPathSelectorsChanged(WorkItemsSourceTest):
                 assert batches_with_changes == 1
                 assert batches_without_changes == 2
 
+            def it_reprocesses_work_items_in_batches_on_multiple_workers_and_returns_changes(self, setup):
+                fixture = setup
+                project = fixture.project
+                work_items_source = fixture.work_items_source
+                issue_template = fixture.issue_with_custom_parent
+                issue_key = issue_template['key']
+                work_item_summaries = [project.map_issue_to_work_item_data(issue_template) for issue_template in
+                                       fixture.issue_templates]
+                # create the initial set of work items
+                api.sync_work_items(work_items_source.key, work_item_summaries)
+
+                # Now add a parent path selector to the work item source
+                with db.orm_session() as session:
+                    session.add(work_items_source)
+                    work_items_source.parameters = dict(
+                        parent_path_selectors=[
+                            "(fields.issuelinks[?type.name=='Parent/Child'].outwardIssue.key)[0]"
+                        ]
+                    )
+
+                batches_with_changes = 0
+                batches_without_changes = 0
+                for items in commands.reprocess_work_items(work_items_source.key,
+                                                           attributes_to_check=['parent_source_display_id'],
+                                                           batch_size=1, workers=2):
+                    assert len(items) <= 1
+                    if len(items) > 0:
+                        # check that the item returned is the one with the custom parent
+                        assert items[0]['display_id'] == issue_key
+                        batches_with_changes = batches_with_changes + 1
+                    else:
+                        batches_without_changes = batches_without_changes + 1
+
+                # we want to test that there are three batches, one with a change and two without
+                assert batches_with_changes == 1
+                assert batches_without_changes == 2
+
         class TestMessagePublishing:
 
             def it_processes_the_message_from_end_to_end_for_a_single_work_item_with_a_change(self, setup):
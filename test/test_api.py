@@ -9,7 +9,7 @@
 # Author: Krishna Kumar
 
 from polaris.common import db
-from polaris.work_tracking.db import api
+from polaris.work_tracking.db import api, model
 from .fixtures.jira_fixtures import *
 from polaris.utils.collections import object_to_dict, Fixture
 
@@ -399,3 +399,92 @@ class TestMoveWorkItem:
                                         moved_work_item)[0]
             assert result
             assert result['is_new']
+
+
+class TestClaimWorkItemsSourcesToSync:
+
+    @pytest.fixture()
+    def setup(self, jira_work_item_source_fixture, cleanup):
+        work_items_source, _, _ = jira_work_item_source_fixture
+        with db.orm_session() as session:
+            project = model.Project(
+                key=uuid.uuid4(),
+                name='test',
+                account_key=account_key,
+                organization_key=organization_key
+            )
+            session.add(project)
+            session.flush()
+            session.connection().execute(
+                model.work_items_sources.update().values(
+                    project_id=project.id
+                ).where(
+                    model.work_items_sources.c.key == work_items_source.key
+                )
+            )
+
+        yield Fixture(
+            work_items_source=work_items_source
+        )
+
+        db.connection().execute("update work_tracking.work_items_sources set project_id=null")
+        db.connection().execute("delete from work_tracking.projects")
+
+    def it_leases_a_due_source(self, setup):
+        fixture = setup
+
+        claimed = api.claim_work_items_sources_to_sync()
+
+        assert [source['work_items_source_key'] for source in claimed] == [fixture.work_items_source.key]
+        assert db.connection().execute(
+            f"select sync_leased_until from work_tracking.work_items_sources "
+            f"where key='{fixture.work_items_source.key}'"
+        ).scalar() > datetime.utcnow()
+
+    def it_does_not_claim_a_leased_source_again(self, setup):
+        api.claim_work_items_sources_to_sync()
+
+        assert api.claim_work_items_sources_to_sync() == []
+
+    def it_claims_the_source_again_after_the_lease_expires(self, setup):
+        fixture = setup
+        api.claim_work_items_sources_to_sync()
+        db.connection().execute(
+            f"update work_tracking.work_items_sources set sync_leased_until=now() at time zone 'utc' - interval '1 minute' "
+            f"where key='{fixture.work_items_source.key}'"
+        )
+
+        claimed = api.claim_work_items_sources_to_sync()
+
+        assert [source['work_items_source_key'] for source in claimed] == [fixture.work_items_source.key]
+
+    def it_skips_sources_locked_by_a_concurrent_claim(self, setup):
+        fixture = setup
+        with db.create_session() as session:
+            # a concurrent claim holds the row lock on the source until its transaction commits
+            session.connection.execute(
+                f"select id from work_tracking.work_items_sources "
+                f"where key='{fixture.work_items_source.key}' for update"
+            )
+
+            assert api.claim_work_items_sources_to_sync() == []
+
+    def it_does_not_claim_a_source_before_its_next_sync_is_due(self, setup):
+        fixture = setup
+        db.connection().execute(
+            f"update work_tracking.work_items_sources set next_sync_at=now() at time zone 'utc' + interval '1 hour' "
+            f"where key='{fixture.work_items_source.key}'"
+        )
+
+        assert api.claim_work_items_sources_to_sync() == []
+
+    def it_renews_the_lease_of_a_sync_in_flight(self, setup):
+        fixture = setup
+        api.claim_work_items_sources_to_sync()
+        db.connection().execute(
+            f"update work_tracking.work_items_sources set sync_leased_until=now() at time zone 'utc' + interval '1 second' "
+            f"where key='{fixture.work_items_source.key}'"
+        )
+
+        assert api.renew_sync_lease(fixture.work_items_source.key) == 1
+        assert api.claim_work_items_sources_to_sync() == []
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+
+# Copyright: © Exathink, LLC (2011-2026) All Rights Reserved
+
+# Unauthorized use or copying of this file and its contents, via any medium
+# is strictly prohibited. The work product in this file is proprietary and
+# confidential.
+
+# Author: Krishna Kumar
+
+from unittest.mock import MagicMock
+
+from polaris.work_tracking.cache import ExpiringCache
+
+
+class TestExpiringCache:
+
+    def it_loads_on_a_miss_and_reuses_the_value_on_a_hit(self):
+        cache = ExpiringCache('test')
+        load = MagicMock(return_value='value')
+
+        assert cache.get('key', load) == 'value'
+        assert cache.get('key', load) == 'value'
+
+        assert load.call_count == 1
+        assert cache.stats['hits'] == 1
+        assert cache.stats['misses'] == 1
+        assert cache.stats['hit_rate'] == 0.5
+
+    def it_reloads_when_the_version_changes(self):
+        cache = ExpiringCache('test')
+        load = MagicMock(side_effect=['v1', 'v2'])
+
+        assert cache.get('key', load, version=1) == 'v1'
+        assert cache.get('key', load, version=2) == 'v2'
+
+        assert load.call_count == 2
+        assert cache.stats['evictions'] == 1
+
+    def it_reloads_when_the_entry_expires(self):
+        cache = ExpiringCache('test', ttl=0)
+        load = MagicMock(side_effect=['v1', 'v2'])
+
+        assert cache.get('key', load) == 'v1'
+        assert cache.get('key', load) == 'v2'
+
+    def it_reloads_after_an_entry_is_invalidated(self):
+        cache = ExpiringCache('test')
+        load = MagicMock(side_effect=['v1', 'v2'])
+
+        cache.get('key', load)
+        cache.invalidate('key')
+
+        assert cache.get('key', load) == 'v2'
+        assert cache.stats['invalidations'] == 1
+
+    def it_evicts_the_least_recently_used_entry_when_full(self):
+        cache = ExpiringCache('test', max_size=2)
+
+        cache.get('a', lambda: 'a')
+        cache.get('b', lambda: 'b')
+        cache.get('a', lambda: 'a')
+        cache.get('c', lambda: 'c')
+
+        assert list(cache.entries.keys()) == ['a', 'c']
+        assert cache.stats['evictions'] == 1
+
+    def it_does_not_cache_values_that_fail_to_load(self):
+        cache = ExpiringCache('test')
+        load = MagicMock(side_effect=[Exception('failed'), 'value'])
+
+        try:
+            cache.get('key', load)
+        except Exception:
+            pass
+
+        assert cache.get('key', load) == 'value'
+        assert cache.stats['size'] == 1
+
+    def it_peeks_without_loading_on_a_miss(self):
+        cache = ExpiringCache('test')
+
+        assert cache.peek('key') is None
+
+        cache.put('key', 'value')
+
+        assert cache.peek('key') == 'value'
+        assert cache.stats['misses'] == 1
+        assert cache.stats['hits'] == 1
+
+    def it_peeks_any_version_unless_one_is_given(self):
+        cache = ExpiringCache('test')
+        cache.put('key', 'value', version=1)
+
+        assert cache.peek('key') == 'value'
+        assert cache.peek('key', version=1) == 'value'
+        assert cache.peek('key', version=2) is None
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+
+# Copyright: © Exathink, LLC (2011-2026) All Rights Reserved
+
+# Unauthorized use or copying of this file and its contents, via any medium
+# is strictly prohibited. The work product in this file is proprietary and
+# confidential.
+
+# Author: Krishna Kumar
+
+from threading import Barrier, Lock
+
+from polaris.work_tracking.fetch_engine import FetchEngine
+
+
+def pages_of(source_key, count):
+    for page in range(count):
+        yield [dict(source_key=source_key, page=page)]
+
+
+class ConcurrencyTracker:
+    """
+    Records the peak number of pages being fetched at the same time across the sources it generates
+    pages for. The first page of each source waits at a barrier until the given number of fetches are in flight,
+    so the peak is reached deterministically rather than by timing.
+    """
+
+    def __init__(self, parties):
+        self.barrier = Barrier(parties, timeout=10)
+        self.lock = Lock()
+        self.active = 0
+        self.peak = 0
+
+    def pages(self, count):
+        for page in range(count):
+            with self.lock:
+                self.active = self.active + 1
+                self.peak = max(self.peak, self.active)
+            try:
+                if page == 0:
+                    self.barrier.wait()
+            finally:
+                with self.lock:
+                    self.active = self.active - 1
+            yield [page]
+
+
+class TestFetchEngine:
+
+    def it_syncs_the_pages_of_each_source_in_order(self):
+        synced = dict(a=[], b=[])
+        finished = []
+
+        def sync_page(source_key, page):
+            synced[source_key].append(page[0]['page'])
+            return page
+
+        results = FetchEngine(queue_size=2).run(
+            [('a', 'host', pages_of('a', 5)), ('b', 'host', pages_of('b', 3))],
+            sync_page,
+            lambda source_key: finished.append(source_key)
+        )
+
+        assert synced == dict(a=[0, 1, 2, 3, 4], b=[0, 1, 2])
+        assert sorted(finished) == ['a', 'b']
+        assert results['a']['synced'] == 5
+        assert results['b']['synced'] == 3
+
+    def it_fetches_sources_on_different_hosts_concurrently(self):
+        tracker = ConcurrencyTracker(parties=4)
+
+        results = FetchEngine(max_requests_per_host=1, max_threads=4).run(
+            [(key, key, tracker.pages(2)) for key in ['a', 'b', 'c', 'd']],
+            lambda source_key, page: page,
+            lambda source_key: None
+        )
+
+        # each first page waits at the barrier until all four sources are fetching at once.
+        assert all(result['error'] is None for result in results.values())
+        assert tracker.peak == 4
+
+    def it_limits_the_concurrent_requests_to_a_host(self):
+        tracker = ConcurrencyTracker(parties=2)
+
+        results = FetchEngine(max_requests_per_host=2, max_threads=8).run(
+            [(key, 'host', tracker.pages(2)) for key in ['a', 'b', 'c', 'd']],
+            lambda source_key, page: page,
+            lambda source_key: None
+        )
+
+        assert all(result['error'] is None for result in results.values())
+        assert tracker.peak == 2
+
+    def it_reports_a_failed_source_without_finishing_it(self):
+        finished = []
+
+        def failing_pages():
+            yield [1]
+            raise Exception('fetch failed')
+
+        results = FetchEngine().run(
+            [('a', 'host', failing_pages()), ('b', 'host', pages_of('b', 2))],
+            lambda source_key, page: page,
+            lambda source_key: finished.append(source_key)
+        )
+
+        assert results['a']['error'] == 'fetch failed'
+        assert results['a']['synced'] == 1
+        assert finished == ['b']
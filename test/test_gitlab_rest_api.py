@@ -9,6 +9,7 @@
 # Author: Pragya Goyal
 
 import pytest
+from unittest.mock import patch
 from polaris.utils.collections import Fixture
 from polaris.work_tracking.integrations.gitlab.gitlab_connector import *
 from polaris.common.enums import GitlabWorkItemType
@@ -223,3 +224,64 @@ class TestGitlabWorkItemSource:
 
         assert not mapped_data['is_bug']
         assert mapped_data['work_item_type'] == GitlabWorkItemType.issue.value
+
+    def it_does_not_refetch_project_boards_while_the_saved_boards_are_fresh(self, setup):
+        fixture = setup
+
+        project = fixture.gitlab_project
+        project.work_items_source.source_data = dict(boards=[], fetched_at=datetime.utcnow().isoformat())
+
+        with patch.object(GitlabProject, 'fetch_project_boards') as fetch_project_boards:
+            assert project.refresh_source_data_if_stale() is None
+            assert not fetch_project_boards.called
+
+    def it_refetches_project_boards_when_the_saved_boards_are_stale(self, setup):
+        fixture = setup
+
+        project = fixture.gitlab_project
+        project.work_items_source.source_data = dict(
+            boards=[],
+            fetched_at=(datetime.utcnow() - timedelta(days=1)).isoformat()
+        )
+
+        with patch.object(GitlabProject, 'fetch_project_boards') as fetch_project_boards:
+            fetch_project_boards.return_value = [[]]
+            work_items_source_data = project.refresh_source_data_if_stale()
+
+            assert fetch_project_boards.called
+            assert work_items_source_data['source_data']['fetched_at']
+
+    def it_refetches_project_boards_for_a_label_that_is_not_on_the_saved_boards(self, setup):
+        fixture = setup
+
+        project = fixture.gitlab_project
+        project.source_states = ['opened', 'closed', 'In Review']
+        project.work_items_source.source_data = dict(boards=[], fetched_at=datetime.utcnow().isoformat())
+
+        with patch.object(GitlabProject, 'fetch_project_boards') as fetch_project_boards:
+            assert project.refresh_source_data_if_stale(labels=['In Review']) is None
+            assert not fetch_project_boards.called
+
+            fetch_project_boards.return_value = [[dict(lists=[dict(label=dict(name='In QA'))])]]
+            work_items_source_data = project.refresh_source_data_if_stale(labels=['In QA', 'backend'])
+
+            assert fetch_project_boards.called
+            assert 'In QA' in work_items_source_data['source_states']
+            # labels that are not on the boards are remembered, so they do not trigger another refetch
+            assert work_items_source_data['source_data']['checked_labels'] == ['backend']
+
+    def it_does_not_refetch_project_boards_for_labels_that_were_already_checked(self, setup):
+        fixture = setup
+
+        project = fixture.gitlab_project
+        project.source_states = ['opened', 'closed']
+        project.work_items_source.source_data = dict(
+            boards=[],
+            fetched_at=datetime.utcnow().isoformat(),
+            checked_labels=['backend']
+        )
+
+        with patch.object(GitlabProject, 'fetch_project_boards') as fetch_project_boards:
+            assert project.refresh_source_data_if_stale(labels=['backend']) is None
+            assert not fetch_project_boards.called
+
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+
+# Copyright: © Exathink, LLC (2011-2026) All Rights Reserved
+
+# Unauthorized use or copying of this file and its contents, via any medium
+# is strictly prohibited. The work product in this file is proprietary and
+# confidential.
+
+# Author: Krishna Kumar
+
+import uuid
+from unittest.mock import patch
+
+from polaris.work_tracking.integrations.http_sessions import get_http_session
+
+
+class TestConnectorHttpSessions:
+
+    def it_returns_the_same_session_for_a_connector(self):
+        connector_key = uuid.uuid4()
+
+        assert get_http_session(connector_key) is get_http_session(str(connector_key))
+
+    def it_returns_different_sessions_for_different_connectors(self):
+        assert get_http_session(uuid.uuid4()) is not get_http_session(uuid.uuid4())
+
+    def it_retries_429_and_5xx_responses(self):
+        session = get_http_session(uuid.uuid4())
+        retries = session.get_adapter('https://api.trello.com').max_retries
+
+        assert 429 in retries.status_forcelist
+        assert 503 in retries.status_forcelist
+        assert retries.respect_retry_after_header
+
+    def it_applies_the_default_timeout(self):
+        session = get_http_session(uuid.uuid4())
+        with patch('requests.Session.request') as request:
+            session.get('https://api.trello.com/1/boards')
+
+        assert request.call_args[1]['timeout'] == session.timeout
+
+    def it_does_not_override_an_explicit_timeout(self):
+        session = get_http_session(uuid.uuid4())
+        with patch('requests.Session.request') as request:
+            session.get('https://api.trello.com/1/boards', timeout=1)
+
+        assert request.call_args[1]['timeout'] == 1
@@ -8,12 +8,19 @@
 
 # Author: Krishna Kumar
 import json
+import re
 import pkg_resources
+from copy import deepcopy
+from datetime import datetime, timedelta
+from unittest.mock import patch, MagicMock
 from polaris.utils.collections import Fixture
 from polaris.work_tracking.enums import CustomTagMappingType
 from .fixtures.jira_fixtures import *
-from polaris.work_tracking.integrations.atlassian.jira_work_items_source import JiraProject
+from polaris.work_tracking.integrations.atlassian.jira_work_items_source import JiraProject, server_timezone_offsets
+from polaris.work_tracking import work_items_source_factory
+from polaris.work_tracking.db.model import WorkItemsSource
 from polaris.common import db
+from polaris.utils.exceptions import ProcessingException
 
 # Serialized version of a jira message for issue. Use as mock for unit tests that work with issue objects.
 jira_api_issue_payload = {'id': '10343', 'self': 'https://urjuna.atlassian.net/rest/api/2/10343', 'key': 'PO-298',
@@ -1513,3 +1520,543 @@ class TestSprintsMapping:
             mapped_data = project.map_issue_to_work_item_data(fixture.jira_issue)
 
             assert mapped_data['sprints'] == ['Sprint 1', 'Sprint 2']
+
+
+class TestFetchWorkItemsToSync:
+
+    @staticmethod
+    def search_response(issues, total, status_code=200, headers=None):
+        response = MagicMock()
+        response.status_code = status_code
+        response.headers = headers or {}
+        response.json.return_value = dict(issues=issues, total=total)
+        return response
+
+    @staticmethod
+    def issue(index):
+        issue = deepcopy(jira_api_issue_payload)
+        issue['id'] = str(20000 + index)
+        issue['key'] = f'PO-{index}'
+        return issue
+
+    @pytest.fixture
+    def setup(self, jira_work_item_source_fixture, cleanup):
+        work_items_source, _, _ = jira_work_item_source_fixture
+
+        with db.orm_session() as session:
+            session.add(work_items_source)
+            jira_project = JiraProject(work_items_source)
+
+        issues = [self.issue(i) for i in range(10)]
+
+        def get(path, headers=None, params=None):
+            start_at = params.get('startAt', 0)
+            return self.search_response(issues[start_at:start_at + 2], len(issues))
+
+        yield Fixture(
+            jira_project=jira_project,
+            issues=issues,
+            get=get
+        )
+
+    def it_yields_all_pages_in_order(self, setup):
+        fixture = setup
+        project = fixture.jira_project
+
+        with patch.object(project.jira_connector, 'get', side_effect=fixture.get) as get:
+            pages = [page for page in project.fetch_work_items_to_sync()]
+
+        assert get.call_count == 5
+        # the final page is always empty
+        assert len(pages) == 6
+        assert pages[-1] == []
+        assert [
+                   work_item['source_display_id'] for page in pages for work_item in page
+               ] == [issue['key'] for issue in fixture.issues]
+
+    def it_retries_pages_that_were_rate_limited(self, setup):
+        fixture = setup
+        project = fixture.jira_project
+        rate_limited = set()
+
+        def get(path, headers=None, params=None):
+            start_at = params.get('startAt', 0)
+            if start_at == 4 and start_at not in rate_limited:
+                rate_limited.add(start_at)
+                return self.search_response([], 0, status_code=429, headers={'Retry-After': '0'})
+            return fixture.get(path, headers, params)
+
+        with patch.object(project.jira_connector, 'get', side_effect=get) as get:
+            pages = [page for page in project.fetch_work_items_to_sync()]
+
+        assert get.call_count == 6
+        assert [
+                   work_item['source_display_id'] for page in pages for work_item in page
+               ] == [issue['key'] for issue in fixture.issues]
+
+    def it_fails_the_sync_when_a_page_cannot_be_fetched(self, setup):
+        fixture = setup
+        project = fixture.jira_project
+
+        def get(path, headers=None, params=None):
+            if params.get('startAt', 0) == 4:
+                return self.search_response([], 0, status_code=500)
+            return fixture.get(path, headers, params)
+
+        synced = []
+        with patch.object(project.jira_connector, 'get', side_effect=get):
+            with pytest.raises(ProcessingException):
+                for page in project.fetch_work_items_to_sync():
+                    synced.extend(page)
+
+        # the pages before the failed page were synced, but the sync did not finish.
+        assert [work_item['source_display_id'] for work_item in synced] == ['PO-0', 'PO-1', 'PO-2', 'PO-3']
+
+    def it_queries_from_the_watermark_after_the_initial_import(self, setup):
+        fixture = setup
+        project = fixture.jira_project
+        project.work_items_source.last_synced = datetime.utcnow()
+        project.work_items_source.latest_work_item_updated_at = datetime(2023, 11, 8, 22, 55)
+        server_timezone_offsets.clear()
+
+        with patch.object(project, 'get_server_timezone_offset', return_value=timedelta(hours=-6)):
+            with patch.object(project.jira_connector, 'get', side_effect=fixture.get) as get:
+                pages = [page for page in project.fetch_work_items_to_sync()]
+
+        # 16:55 in the server timezone less the default 10 minute overlap
+        jql = get.call_args_list[0][1]['params']['jql']
+        assert 'updated >= "2023-11-08 16:45" ORDER BY updated ASC' in jql
+
+    def it_does_not_skip_issues_that_are_updated_while_paging_from_the_watermark(self, setup):
+        fixture = setup
+        project = fixture.jira_project
+        project.work_items_source.last_synced = datetime.utcnow()
+        project.work_items_source.latest_work_item_updated_at = datetime(2023, 11, 8, 16, 0)
+        server_timezone_offsets.clear()
+
+        issues = fixture.issues
+        for index, issue in enumerate(issues):
+            issue['fields']['updated'] = f'2023-11-08T16:{10 + index:02d}:30.000+0000'
+
+        def get(path, headers=None, params=None):
+            cursor = re.search(r'updated >= "([^"]+)"', params['jql']).group(1)
+            matching = sorted(
+                [
+                    issue for issue in issues
+                    if issue['fields']['updated'][0:16].replace('T', ' ') >= cursor
+                ],
+                key=lambda issue: issue['fields']['updated']
+            )
+            start_at = params.get('startAt', 0)
+            page = deepcopy(matching[start_at:start_at + 2])
+            if get.calls == 0:
+                # PO-1 is updated after the first page is read, which moves it to the end of the results.
+                issues[1]['fields']['updated'] = '2023-11-08T16:30:30.000+0000'
+            get.calls = get.calls + 1
+            return self.search_response(page, len(matching))
+
+        get.calls = 0
+
+        with patch.object(project, 'get_server_timezone_offset', return_value=timedelta(0)):
+            with patch.object(project.jira_connector, 'get', side_effect=get):
+                pages = [page for page in project.fetch_work_items_to_sync()]
+
+        synced = [work_item['source_display_id'] for page in pages for work_item in page]
+        assert set(synced) == {issue['key'] for issue in issues}
+        assert synced[-1] == 'PO-1'
+
+    def it_falls_back_to_the_sync_window_when_the_server_timezone_is_unknown(self, setup):
+        fixture = setup
+        project = fixture.jira_project
+        project.work_items_source.last_synced = datetime.utcnow()
+        project.work_items_source.latest_work_item_updated_at = datetime(2023, 11, 8, 22, 55)
+        server_timezone_offsets.clear()
+
+        with patch.object(project, 'get_server_timezone_offset', return_value=None):
+            with patch.object(project.jira_connector, 'get', side_effect=fixture.get) as get:
+                pages = [page for page in project.fetch_work_items_to_sync()]
+
+        jql = get.call_args_list[0][1]['params']['jql']
+        assert f'updated >= "-{project.sync_import_days}d"' in jql
+
+
+class TestFieldsProjection:
+
+    @pytest.fixture
+    def setup(self, jira_work_item_source_fixture, cleanup):
+        work_items_source, _, _ = jira_work_item_source_fixture
+
+        yield Fixture(
+            work_items_source=work_items_source
+        )
+
+    def it_projects_standard_and_mapped_custom_fields(self, setup):
+        fixture = setup
+
+        with db.orm_session() as session:
+            session.add(fixture.work_items_source)
+            project = JiraProject(fixture.work_items_source)
+
+        fields = project.fields_projection.split(',')
+        for field in ['summary', 'issuetype', 'status', 'parent', 'updated']:
+            assert field in fields
+        # Epic Link, Story Points, Story point estimate, Sprint, Flagged
+        for field in ['customfield_10014', 'customfield_10029', 'customfield_10016', 'customfield_10007',
+                      'customfield_10030']:
+            assert field in fields
+        assert '*all,-comment' not in project.fields_projection
+
+    def it_projects_fields_referenced_by_selectors_and_custom_tag_mappings(self, setup):
+        fixture = setup
+
+        with db.orm_session() as session:
+            session.add(fixture.work_items_source)
+            fixture.work_items_source.custom_fields = [
+                *fixture.work_items_source.custom_fields,
+                {"id": "customfield_10200", "key": "customfield_10200", "name": "Team"}
+            ]
+            fixture.work_items_source.parameters = dict(
+                parent_path_selectors=[
+                    "(fields.issuelinks[?type.name=='Parent/Child'].outwardIssue.key)[0]"
+                ],
+                custom_tag_mapping=[
+                    dict(
+                        mapping_type=CustomTagMappingType.path_selector_true.value,
+                        path_selector_value_mapping=dict(
+                            selector='fields."customfield_10100"',
+                            tag='audit'
+                        )
+                    ),
+                    dict(
+                        mapping_type=CustomTagMappingType.custom_field_value.value,
+                        custom_field_mapping=dict(
+                            field_name='Team'
+                        )
+                    )
+                ]
+            )
+            project = JiraProject(fixture.work_items_source)
+
+        fields = project.fields_projection.split(',')
+        for field in ['issuelinks', 'customfield_10100', 'customfield_10200']:
+            assert field in fields
+
+    def it_fetches_all_fields_when_a_selector_cannot_be_resolved(self, setup):
+        fixture = setup
+
+        with db.orm_session() as session:
+            session.add(fixture.work_items_source)
+            fixture.work_items_source.parameters = dict(
+                parent_path_selectors=["fields.* | [0].key"]
+            )
+            project = JiraProject(fixture.work_items_source)
+
+        assert project.fields_projection == '*all,-comment'
+
+    def it_fetches_all_fields_when_the_source_stores_the_full_payload(self, setup):
+        fixture = setup
+
+        with db.orm_session() as session:
+            session.add(fixture.work_items_source)
+            fixture.work_items_source.parameters = dict(
+                store_full_payload=True
+            )
+            project = JiraProject(fixture.work_items_source)
+
+        assert project.fields_projection == '*all,-comment'
+
+
+class TestCustomFieldIndex:
+
+    @pytest.fixture
+    def setup(self, jira_work_item_source_with_multiple_story_points_fixture, cleanup):
+        work_items_source, _, _ = jira_work_item_source_with_multiple_story_points_fixture
+
+        with db.orm_session() as session:
+            session.add(work_items_source)
+            project = JiraProject(work_items_source)
+
+        yield Fixture(
+            project=project,
+            work_items_source=work_items_source
+        )
+
+    def it_indexes_the_keys_of_all_fields_with_the_same_name(self, setup):
+        fixture = setup
+
+        story_points_keys = [
+            field['key'] for field in fixture.work_items_source.custom_fields
+            if field['name'].lower() == 'story points'
+        ]
+        assert len(story_points_keys) > 1
+        assert fixture.project.custom_field_keys['story points'] == story_points_keys
+
+    def it_indexes_the_metadata_of_the_first_field_with_an_exact_name(self, setup):
+        fixture = setup
+
+        assert fixture.project.custom_field_metadata['Epic Link']['key'] == 'customfield_10014'
+        assert 'epic link' not in fixture.project.custom_field_metadata
+
+
+class TestCompiledMappingRules:
+
+    @pytest.fixture
+    def setup(self, jira_work_item_source_fixture, cleanup):
+        work_items_source, _, _ = jira_work_item_source_fixture
+
+        yield Fixture(
+            work_items_source=work_items_source
+        )
+
+    def it_compiles_one_rule_per_known_custom_tag_mapping(self, setup):
+        fixture = setup
+
+        with db.orm_session() as session:
+            session.add(fixture.work_items_source)
+            fixture.work_items_source.parameters = dict(
+                custom_tag_mapping=[
+                    dict(
+                        mapping_type=CustomTagMappingType.path_selector.value,
+                        path_selector_mapping=dict(
+                            selector="fields.labels[?@=='audit']",
+                            tag='audit'
+                        )
+                    ),
+                    dict(
+                        mapping_type=CustomTagMappingType.custom_field_populated.value,
+                        custom_field_mapping=dict(
+                            field_name='Flagged',
+                            tag='flagged'
+                        )
+                    ),
+                    dict(
+                        mapping_type='unknown',
+                    )
+                ]
+            )
+            project = JiraProject(fixture.work_items_source)
+
+        assert len(project.custom_tag_rules) == 2
+
+    def it_raises_invalid_selectors_when_issues_are_mapped(self, setup):
+        fixture = setup
+
+        with db.orm_session() as session:
+            session.add(fixture.work_items_source)
+            fixture.work_items_source.parameters = dict(
+                parent_path_selectors=["fields.issuelinks[?"]
+            )
+            project = JiraProject(fixture.work_items_source)
+
+        with pytest.raises(Exception):
+            project.map_issue_to_work_item_data(jira_api_issue_payload)
+
+
+class TestJiraTimeConversion:
+
+    def it_converts_jira_timestamps_to_utc(self):
+        assert JiraProject.jira_time_to_utc_time_string('2023-11-08T16:55:00.575-0600') == '2023-11-08T22:55:00.575000'
+        assert JiraProject.jira_time_to_utc_time_string('2023-11-08T16:55:00.575+0530') == '2023-11-08T11:25:00.575000'
+        assert JiraProject.jira_time_to_utc_time_string('2023-12-31T23:30:00.000-0100') == '2024-01-01T00:30:00.000000'
+
+    def it_parses_jira_timestamps_the_same_way_as_strptime(self):
+        for jira_time_string in ['2023-11-08T16:55:00.575-0600', '2023-10-23T10:06:38.386+0000']:
+            assert JiraProject.parse_jira_time_string(jira_time_string) == datetime.strptime(
+                jira_time_string, "%Y-%m-%dT%H:%M:%S.%f%z"
+            )
+
+    def it_returns_the_original_string_when_it_cannot_be_parsed(self):
+        assert JiraProject.jira_time_to_utc_time_string('not a timestamp') == 'not a timestamp'
+
+
+class TestFetchWorkItemsByKey:
+
+    @pytest.fixture
+    def setup(self, jira_work_item_source_fixture, cleanup):
+        work_items_source, _, _ = jira_work_item_source_fixture
+
+        with db.orm_session() as session:
+            session.add(work_items_source)
+            jira_project = JiraProject(work_items_source)
+
+        yield Fixture(
+            jira_project=jira_project,
+            issues=[TestFetchWorkItemsToSync.issue(i) for i in range(3)]
+        )
+
+    def it_fetches_all_the_keys_with_a_single_search(self, setup):
+        fixture = setup
+        project = fixture.jira_project
+
+        with patch.object(project.jira_connector, 'get') as get:
+            get.return_value = TestFetchWorkItemsToSync.search_response(fixture.issues, len(fixture.issues))
+            work_items = project.fetch_work_items_by_source_ids(['PO-0', 'PO-1', 'PO-2', 'PO-404'])
+
+        assert get.call_count == 1
+        params = get.call_args[1]['params']
+        assert 'key in ("PO-0","PO-1","PO-2","PO-404")' in params['jql']
+        assert params['validateQuery'] == 'warn'
+        assert [work_item['source_display_id'] for work_item in work_items] == ['PO-0', 'PO-1', 'PO-2']
+
+    def it_chunks_the_keys_at_the_page_size(self, setup):
+        fixture = setup
+        project = fixture.jira_project
+
+        def get(path, headers=None, params=None):
+            keys = [key.strip('"') for key in params['jql'].split('key in (')[1].rstrip(')').split(',')]
+            issues = [issue for issue in fixture.issues if issue['key'] in keys]
+            return TestFetchWorkItemsToSync.search_response(issues, len(issues))
+
+        with patch.object(project.jira_connector, 'get', side_effect=get) as get:
+            work_items = project.fetch_work_items_by_source_ids(['PO-0', 'PO-1', 'PO-2'], page_size=2)
+
+        assert get.call_count == 2
+        assert [work_item['source_display_id'] for work_item in work_items] == ['PO-0', 'PO-1', 'PO-2']
+
+    def it_fetches_a_single_key_from_the_issue_endpoint(self, setup):
+        fixture = setup
+        project = fixture.jira_project
+        issue = fixture.issues[0]
+        issue['fields']['project'] = dict(id=str(project.project_id), key='PO')
+
+        with patch.object(project.jira_connector, 'get') as get:
+            get.return_value.status_code = 200
+            get.return_value.json.return_value = issue
+            work_items = project.fetch_work_items_by_source_ids(['PO-0'])
+
+        assert get.call_args[0][0] == '/issue/PO-0'
+        assert [work_item['source_display_id'] for work_item in work_items] == ['PO-0']
+
+    def it_does_not_return_issues_from_other_projects(self, setup):
+        fixture = setup
+        project = fixture.jira_project
+        issue = fixture.issues[0]
+        issue['fields']['project'] = dict(id='99999', key='OTHER')
+
+        with patch.object(project.jira_connector, 'get') as get:
+            get.return_value.status_code = 200
+            get.return_value.json.return_value = issue
+
+            assert project.fetch_work_item('PO-0') == []
+
+    def it_returns_nothing_when_the_issue_is_not_found(self, setup):
+        fixture = setup
+        project = fixture.jira_project
+
+        with patch.object(project.jira_connector, 'get') as get:
+            get.return_value.status_code = 404
+
+            assert project.fetch_work_item('PO-404') == []
+
+    def it_ignores_malformed_keys(self, setup):
+        fixture = setup
+        project = fixture.jira_project
+
+        with patch.object(project.jira_connector, 'get') as get:
+            get.return_value = TestFetchWorkItemsToSync.search_response(fixture.issues[:2], 2)
+            work_items = project.fetch_work_items_by_source_ids(['PO-0', 'PO-1', 'PO-1) OR (project is not EMPTY'])
+
+        assert get.call_count == 1
+        assert 'project is not EMPTY' not in get.call_args[1]['params']['jql']
+        assert [work_item['source_display_id'] for work_item in work_items] == ['PO-0', 'PO-1']
+
+    def it_fetches_the_keys_one_at_a_time_when_the_search_fails(self, setup):
+        fixture = setup
+        project = fixture.jira_project
+        for issue in fixture.issues:
+            issue['fields']['project'] = dict(id=str(project.project_id), key='PO')
+
+        def get(path, headers=None, params=None):
+            if path == '/search':
+                return TestFetchWorkItemsToSync.search_response([], 0, status_code=400)
+            key = path.split('/')[-1]
+            response = MagicMock()
+            found = [issue for issue in fixture.issues if issue['key'] == key]
+            response.status_code = 200 if found else 404
+            response.json.return_value = found[0] if found else None
+            return response
+
+        with patch.object(project.jira_connector, 'get', side_effect=get) as get:
+            work_items = project.fetch_work_items_by_source_ids(['PO-0', 'PO-1', 'PO-404'])
+
+        assert get.call_count == 4
+        assert [work_item['source_display_id'] for work_item in work_items] == ['PO-0', 'PO-1']
+
+
+class TestCachedJiraProject:
+
+    @pytest.fixture
+    def setup(self, jira_work_item_source_fixture, cleanup):
+        work_items_source, _, _ = jira_work_item_source_fixture
+        work_items_source_factory.invalidate_all_providers()
+
+        yield Fixture(
+            work_items_source=work_items_source
+        )
+
+        work_items_source_factory.invalidate_all_providers()
+
+    def it_reuses_the_provider_while_the_work_items_source_is_unchanged(self, setup):
+        fixture = setup
+
+        with db.orm_session() as session:
+            work_items_source = WorkItemsSource.find_by_key(session, fixture.work_items_source.key)
+            first = work_items_source_factory.get_cached_provider_impl(None, work_items_source.key, work_items_source)
+            second = work_items_source_factory.get_cached_provider_impl(None, work_items_source.key, work_items_source)
+
+        assert first is second
+
+    def it_does_not_load_the_work_items_source_on_a_cache_hit(self, setup):
+        fixture = setup
+
+        first = work_items_source_factory.get_cached_provider_impl(None, fixture.work_items_source.key)
+        with patch.object(WorkItemsSource, 'find_by_key') as find_by_key:
+            second = work_items_source_factory.get_cached_provider_impl(None, fixture.work_items_source.key)
+
+        assert first is second
+        assert not find_by_key.called
+
+    def it_does_not_hold_on_to_the_orm_instance(self, setup):
+        fixture = setup
+
+        with db.orm_session() as session:
+            work_items_source = WorkItemsSource.find_by_key(session, fixture.work_items_source.key)
+            project = work_items_source_factory.get_cached_provider_impl(None, work_items_source.key, work_items_source)
+
+        assert project.work_items_source is not work_items_source
+        assert project.work_items_source.key == fixture.work_items_source.key
+        # the copy is a work items source in its own right
+        assert project.work_items_source.latest_work_item_update_timestamp is None
+
+    def it_refreshes_the_sync_state_of_the_cached_provider(self, setup):
+        fixture = setup
+
+        with db.orm_session() as session:
+            work_items_source = WorkItemsSource.find_by_key(session, fixture.work_items_source.key)
+            first = work_items_source_factory.get_cached_provider_impl(None, work_items_source.key, work_items_source)
+            work_items_source.latest_work_item_updated_at = datetime(2023, 11, 8, 22, 55)
+            second = work_items_source_factory.get_cached_provider_impl(None, work_items_source.key, work_items_source)
+
+        assert first is second
+        assert second.last_updated == datetime(2023, 11, 8, 22, 55)
+
+    def it_rebuilds_the_provider_when_the_custom_fields_change(self, setup):
+        fixture = setup
+
+        with db.orm_session() as session:
+            work_items_source = WorkItemsSource.find_by_key(session, fixture.work_items_source.key)
+            first = work_items_source_factory.get_cached_provider_impl(None, work_items_source.key, work_items_source)
+            work_items_source.custom_fields = [dict(key='customfield_10014', name='Epic Link')]
+            second = work_items_source_factory.get_cached_provider_impl(None, work_items_source.key, work_items_source)
+
+        assert first is not second
+        assert 'epic link' in second.custom_field_keys
+
+    def it_rebuilds_the_provider_once_it_is_invalidated(self, setup):
+        fixture = setup
+
+        first = work_items_source_factory.get_cached_provider_impl(None, fixture.work_items_source.key)
+        work_items_source_factory.invalidate_provider(fixture.work_items_source.key)
+        second = work_items_source_factory.get_cached_provider_impl(None, fixture.work_items_source.key)
+
+        assert first is not second
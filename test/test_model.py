@@ -8,6 +8,8 @@
 
 # Author: Priya Mukundan
 
+from datetime import datetime, timedelta
+
 from polaris.common import db
 from polaris.work_tracking.db import model
 from .fixtures.jira_fixtures import *
@@ -237,4 +239,58 @@ class TestModel:
                                              'state': 'Done'}
                                             ]
         updated = work_item.update(work_item_data)
-        assert updated
\ No newline at end of file
+        assert updated
+
+
+class TestWorkItemsSourceSyncSchedule:
+
+    def it_syncs_more_often_when_there_are_changes(self):
+        work_items_source = model.WorkItemsSource(sync_interval_seconds=600)
+
+        work_items_source.schedule_next_sync(changes=5)
+
+        assert work_items_source.sync_interval_seconds == 300
+        assert 270 <= (work_items_source.next_sync_at - datetime.utcnow()).total_seconds() <= 330
+
+    def it_backs_off_when_there_are_no_changes(self):
+        work_items_source = model.WorkItemsSource(sync_interval_seconds=600)
+
+        work_items_source.schedule_next_sync(changes=0)
+
+        assert work_items_source.sync_interval_seconds == 1200
+
+    def it_keeps_the_interval_within_the_max_interval(self):
+        work_items_source = model.WorkItemsSource(sync_interval_seconds=3600)
+
+        work_items_source.schedule_next_sync(changes=0)
+
+        assert work_items_source.sync_interval_seconds == 3600
+
+    def it_releases_the_sync_lease(self):
+        work_items_source = model.WorkItemsSource(sync_leased_until=datetime.utcnow() + timedelta(minutes=30))
+
+        assert not work_items_source.should_sync()
+
+        work_items_source.schedule_next_sync(changes=0)
+
+        assert work_items_source.sync_leased_until is None
+        assert not work_items_source.should_sync()
+
+    def it_backs_off_and_releases_the_lease_after_a_failed_sync(self):
+        work_items_source = model.WorkItemsSource(
+            sync_interval_seconds=600,
+            sync_leased_until=datetime.utcnow() + timedelta(minutes=30)
+        )
+
+        work_items_source.schedule_sync_retry()
+
+        assert work_items_source.sync_interval_seconds == 1200
+        assert work_items_source.next_sync_at > datetime.utcnow()
+        assert work_items_source.sync_leased_until is None
+
+    def it_takes_the_sync_lease(self):
+        work_items_source = model.WorkItemsSource()
+
+        work_items_source.take_sync_lease()
+
+        assert work_items_source.sync_leased_until > datetime.utcnow()
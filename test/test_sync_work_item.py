@@ -78,3 +78,26 @@ class TestSyncWorkItem:
         empty_source = work_items_sources['empty']
         result = commands.sync_work_item(token_provider, empty_source.key, new_work_items[0]['source_display_id'])
         assert result == []
+
+
+class TestImportMissingWorkItems:
+
+    def it_remembers_the_work_items_that_were_not_found(self, jira_work_item_source_fixture, cleanup):
+        work_items_source, jira_project_id, connector_key = jira_work_item_source_fixture
+        commands.missing_work_items_cache.invalidate_all()
+        found = new_work_items_jira()[0]
+        with patch(
+                'polaris.work_tracking.integrations.atlassian.jira_work_items_source.JiraProject.fetch_work_items_by_source_ids') as fetch_work_items_by_source_ids:
+            fetch_work_items_by_source_ids.return_value = [found]
+
+            result = commands.import_missing_work_items(token_provider, work_items_source.key,
+                                                        [found['source_display_id'], 'PO-404'])
+
+            assert [work_item['display_id'] for work_item in result] == [found['source_display_id']]
+            assert commands.is_missing_work_item(work_items_source.key, 'PO-404')
+            assert not commands.is_missing_work_item(work_items_source.key, found['source_display_id'])
+
+            # the known missing work item is not fetched again
+            fetch_work_items_by_source_ids.reset_mock()
+            assert commands.import_missing_work_items(token_provider, work_items_source.key, ['PO-404']) == []
+            assert not fetch_work_items_by_source_ids.called
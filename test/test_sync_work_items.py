@@ -14,14 +14,18 @@ import json
 import pkg_resources
 import pytest
 import logging
+import time
+from datetime import datetime
 
 from polaris.work_tracking.integrations.atlassian.jira_work_items_source import JiraProject
 
 from polaris.utils.token_provider import get_token_provider
 from polaris.work_tracking import commands
 from polaris.work_tracking.db import api
-from polaris.work_tracking.db.model import WorkItem
+from polaris.work_tracking.db.model import WorkItem, WorkItemsSource
+from polaris.work_tracking.enums import SyncIngestMode, SyncStagingMode
 from polaris.utils.collections import find
+from polaris.utils.exceptions import ProcessingException
 
 token_provider = get_token_provider()
 
@@ -136,6 +140,169 @@ class TestSyncApi(WorkItemsSourceTest):
             assert all([result['is_new'] for result in sync_results])
             assert db.connection().execute('select count(id) from work_tracking.work_items').scalar() == 3
 
+        def it_does_not_advance_the_sync_watermark_of_the_work_items_source(self, setup):
+            fixture = setup
+            project = fixture.project
+            work_items_source = fixture.work_items_source
+            issue_templates = fixture.issue_templates
+
+            work_item_list = [
+                project.map_issue_to_work_item_data(issue_template)
+                for issue_template in issue_templates
+            ]
+            api.sync_work_items(work_items_source.key, work_item_list)
+
+            # only a complete poll sync moves the watermark
+            assert db.connection().execute(
+                f"select latest_work_item_updated_at from work_tracking.work_items_sources "
+                f"where key='{work_items_source.key}'"
+            ).scalar() is None
+
+        def it_advances_the_sync_watermark_after_a_poll_sync(self, setup):
+            fixture = setup
+            project = fixture.project
+            work_items_source = fixture.work_items_source
+            issue_templates = fixture.issue_templates
+
+            work_item_list = [
+                project.map_issue_to_work_item_data(issue_template)
+                for issue_template in issue_templates
+            ]
+            with patch(
+                    'polaris.work_tracking.integrations.atlassian.jira_work_items_source.JiraProject.fetch_work_items_to_sync'
+            ) as fetch_work_items_to_sync:
+                fetch_work_items_to_sync.return_value = [work_item_list[0:2], work_item_list[2:]]
+                for _ in commands.sync_work_items(token_provider, work_items_source.key):
+                    pass
+
+            watermark = db.connection().execute(
+                f"select latest_work_item_updated_at, latest_updated_work_item_source_id "
+                f"from work_tracking.work_items_sources where key='{work_items_source.key}'"
+            ).fetchone()
+            latest_update = db.connection().execute(
+                f"select source_last_updated, source_id from work_tracking.work_items "
+                f"where work_items_source_id={work_items_source.id} order by source_last_updated desc limit 1"
+            ).fetchone()
+            assert watermark.latest_work_item_updated_at == latest_update.source_last_updated
+            assert watermark.latest_updated_work_item_source_id == latest_update.source_id
+
+            # syncing an older version of an item does not move the watermark back
+            oldest = min(work_item_list, key=lambda work_item: work_item['source_last_updated'])
+            with patch(
+                    'polaris.work_tracking.integrations.atlassian.jira_work_items_source.JiraProject.fetch_work_items_to_sync'
+            ) as fetch_work_items_to_sync:
+                fetch_work_items_to_sync.return_value = [[oldest]]
+                for _ in commands.sync_work_items(token_provider, work_items_source.key):
+                    pass
+
+            assert db.connection().execute(
+                f"select latest_work_item_updated_at from work_tracking.work_items_sources "
+                f"where key='{work_items_source.key}'"
+            ).scalar() == latest_update.source_last_updated
+
+        def it_leases_the_work_items_source_while_the_sync_is_in_flight(self, setup):
+            fixture = setup
+            project = fixture.project
+            work_items_source = fixture.work_items_source
+
+            work_item_list = [
+                project.map_issue_to_work_item_data(issue_template)
+                for issue_template in fixture.issue_templates
+            ]
+            with patch(
+                    'polaris.work_tracking.integrations.atlassian.jira_work_items_source.JiraProject.fetch_work_items_to_sync'
+            ) as fetch_work_items_to_sync:
+                fetch_work_items_to_sync.return_value = [work_item_list]
+                sync = commands.sync_work_items(token_provider, work_items_source.key)
+                next(sync)
+                assert db.connection().execute(
+                    f"select sync_leased_until from work_tracking.work_items_sources "
+                    f"where key='{work_items_source.key}'"
+                ).scalar() > datetime.utcnow()
+
+                for _ in sync:
+                    pass
+
+            assert db.connection().execute(
+                f"select sync_leased_until from work_tracking.work_items_sources "
+                f"where key='{work_items_source.key}'"
+            ).scalar() is None
+
+        def it_releases_the_lease_and_backs_off_when_a_poll_sync_fails(self, setup):
+            fixture = setup
+            work_items_source = fixture.work_items_source
+
+            def fetch_pages():
+                raise ProcessingException('page fetch failed')
+                yield
+
+            with patch(
+                    'polaris.work_tracking.integrations.atlassian.jira_work_items_source.JiraProject.fetch_work_items_to_sync'
+            ) as fetch_work_items_to_sync:
+                fetch_work_items_to_sync.return_value = fetch_pages()
+                with pytest.raises(ProcessingException):
+                    for _ in commands.sync_work_items(token_provider, work_items_source.key):
+                        pass
+
+            schedule = db.connection().execute(
+                f"select sync_leased_until, next_sync_at from work_tracking.work_items_sources "
+                f"where key='{work_items_source.key}'"
+            ).fetchone()
+            assert schedule.sync_leased_until is None
+            assert schedule.next_sync_at > datetime.utcnow()
+
+        def it_reads_the_sync_watermark_of_a_detached_work_items_source(self, setup):
+            fixture = setup
+            project = fixture.project
+            work_items_source = fixture.work_items_source
+
+            work_item_list = [
+                project.map_issue_to_work_item_data(issue_template)
+                for issue_template in fixture.issue_templates
+            ]
+            with patch(
+                    'polaris.work_tracking.integrations.atlassian.jira_work_items_source.JiraProject.fetch_work_items_to_sync'
+            ) as fetch_work_items_to_sync:
+                fetch_work_items_to_sync.return_value = [work_item_list]
+                for _ in commands.sync_work_items(token_provider, work_items_source.key):
+                    pass
+
+            with db.orm_session() as session:
+                detached = WorkItemsSource.find_by_key(session, work_items_source.key)
+                session.expunge(detached)
+
+            latest = max(work_item_list, key=lambda work_item: work_item['source_last_updated'])
+            assert detached.latest_work_item_update_timestamp == latest['source_last_updated']
+            assert detached.most_recently_updated_work_item_source_id == latest['source_id']
+
+        def it_does_not_advance_the_sync_watermark_when_a_poll_sync_fails(self, setup):
+            fixture = setup
+            project = fixture.project
+            work_items_source = fixture.work_items_source
+            issue_templates = fixture.issue_templates
+
+            work_item_list = [
+                project.map_issue_to_work_item_data(issue_template)
+                for issue_template in issue_templates
+            ]
+
+            def fetch_pages():
+                yield work_item_list
+                raise ProcessingException('page fetch failed')
+
+            with patch(
+                    'polaris.work_tracking.integrations.atlassian.jira_work_items_source.JiraProject.fetch_work_items_to_sync'
+            ) as fetch_work_items_to_sync:
+                fetch_work_items_to_sync.return_value = fetch_pages()
+                with pytest.raises(ProcessingException):
+                    for _ in commands.sync_work_items(token_provider, work_items_source.key):
+                        pass
+
+            assert db.connection().execute(
+                f"select latest_work_item_updated_at from work_tracking.work_items_sources "
+                f"where key='{work_items_source.key}'"
+            ).scalar() is None
+
         def it_updates_existing_work_items(self, setup):
             fixture = setup
             project = fixture.project
@@ -208,6 +375,192 @@ class TestSyncApi(WorkItemsSourceTest):
             assert len([result for result in next_state if result['is_new']]) == 0
             assert len([result for result in next_state if result['is_updated']]) == 1
 
+        def it_stores_the_content_hash_of_synced_work_items(self, setup):
+            fixture = setup
+            project = fixture.project
+            work_items_source = fixture.work_items_source
+            issue_templates = fixture.issue_templates
+
+            work_item_list = [
+                project.map_issue_to_work_item_data(issue_template)
+                for issue_template in issue_templates
+            ]
+
+            api.sync_work_items(work_items_source.key, work_item_list)
+
+            assert db.connection().execute(
+                'select count(id) from work_tracking.work_items where content_hash is not null'
+            ).scalar() == 3
+
+        def it_does_not_mark_items_updated_when_only_sync_timestamps_change(self, setup):
+            fixture = setup
+            project = fixture.project
+            work_items_source = fixture.work_items_source
+            issue_templates = fixture.issue_templates
+
+            work_item_list = [
+                project.map_issue_to_work_item_data(issue_template)
+                for issue_template in issue_templates
+            ]
+
+            api.sync_work_items(work_items_source.key, work_item_list)
+            work_item_list[0]['source_last_updated'] = datetime.utcnow()
+
+            next_state = api.sync_work_items(work_items_source.key, work_item_list)
+
+            assert len(next_state) == 3
+            assert len([result for result in next_state if result['is_updated']]) == 0
+
+        def it_skips_writing_items_that_are_unchanged_since_the_last_sync(self, setup):
+            fixture = setup
+            project = fixture.project
+            work_items_source = fixture.work_items_source
+            issue_templates = fixture.issue_templates
+
+            work_item_list = [
+                project.map_issue_to_work_item_data(issue_template)
+                for issue_template in issue_templates
+            ]
+
+            api.sync_work_items(work_items_source.key, work_item_list)
+            last_sync = db.connection().execute(
+                f"select last_sync from work_tracking.work_items "
+                f"where source_id = '{work_item_list[1]['source_id']}'"
+            ).scalar()
+
+            work_item_list[0]['name'] = 'Updated name'
+            next_state = api.sync_work_items(work_items_source.key, work_item_list)
+
+            assert len(next_state) == 3
+            assert len([result for result in next_state if result['is_updated']]) == 1
+            assert len([result for result in next_state if result['is_new']]) == 0
+            # the unchanged items were not written
+            assert db.connection().execute(
+                f"select last_sync from work_tracking.work_items "
+                f"where source_id = '{work_item_list[1]['source_id']}'"
+            ).scalar() == last_sync
+
+        def it_syncs_unchanged_items_when_skip_unchanged_is_false(self, setup):
+            fixture = setup
+            project = fixture.project
+            work_items_source = fixture.work_items_source
+            issue_templates = fixture.issue_templates
+
+            work_item_list = [
+                project.map_issue_to_work_item_data(issue_template)
+                for issue_template in issue_templates
+            ]
+
+            api.sync_work_items(work_items_source.key, work_item_list)
+            last_sync = db.connection().execute(
+                f"select last_sync from work_tracking.work_items "
+                f"where source_id = '{work_item_list[1]['source_id']}'"
+            ).scalar()
+
+            next_state = api.sync_work_items(work_items_source.key, work_item_list, skip_unchanged=False)
+
+            assert len(next_state) == 3
+            assert len([result for result in next_state if result['is_updated']]) == 0
+            assert db.connection().execute(
+                f"select last_sync from work_tracking.work_items "
+                f"where source_id = '{work_item_list[1]['source_id']}'"
+            ).scalar() > last_sync
+
+        def it_only_updates_the_sync_state_of_unchanged_items(self, setup):
+            fixture = setup
+            project = fixture.project
+            work_items_source = fixture.work_items_source
+            issue_templates = fixture.issue_templates
+
+            work_item_list = [
+                project.map_issue_to_work_item_data(issue_template)
+                for issue_template in issue_templates
+            ]
+
+            api.sync_work_items(work_items_source.key, work_item_list)
+            # change a content column in place without changing the hash. A full upsert of the
+            # unchanged item would overwrite this.
+            db.connection().execute(
+                f"update work_tracking.work_items set description='untouched' "
+                f"where source_id = '{work_item_list[1]['source_id']}'"
+            )
+
+            next_state = api.sync_work_items(work_items_source.key, work_item_list, skip_unchanged=False)
+
+            assert len(next_state) == 3
+            assert db.connection().execute(
+                f"select description from work_tracking.work_items "
+                f"where source_id = '{work_item_list[1]['source_id']}'"
+            ).scalar() == 'untouched'
+
+        def it_resolves_the_parent_of_an_unchanged_item_whose_parent_was_not_resolved(self, setup):
+            fixture = setup
+            project = fixture.project
+            work_items_source = fixture.work_items_source
+
+            child_issue = project.map_issue_to_work_item_data(fixture.issue_with_custom_parent)
+            parent_issue = project.map_issue_to_work_item_data(fixture.issue_for_custom_parent)
+            child_issue['parent_source_display_id'] = parent_issue['source_display_id']
+
+            api.sync_work_items(work_items_source.key, [parent_issue, child_issue])
+            # the parent was imported without the child being linked to it.
+            db.connection().execute(
+                f"update work_tracking.work_items set parent_id=NULL "
+                f"where source_id = '{child_issue['source_id']}'"
+            )
+
+            api.sync_work_items(work_items_source.key, [child_issue])
+
+            assert db.connection().execute(
+                f"select parent_id from work_tracking.work_items "
+                f"where source_id = '{child_issue['source_id']}'"
+            ).scalar() is not None
+
+        def it_sets_the_organization_key_of_synced_work_items(self, setup):
+            fixture = setup
+            project = fixture.project
+            work_items_source = fixture.work_items_source
+            issue_templates = fixture.issue_templates
+
+            work_item_list = [
+                project.map_issue_to_work_item_data(issue_template)
+                for issue_template in issue_templates
+            ]
+
+            api.sync_work_items(work_items_source.key, work_item_list)
+
+            assert db.connection().execute(
+                f"select count(id) from work_tracking.work_items "
+                f"where organization_key = '{work_items_source.organization_key}'"
+            ).scalar() == 3
+
+        def it_syncs_work_items_using_the_staging_table(self, setup):
+            fixture = setup
+            project = fixture.project
+            work_items_source = fixture.work_items_source
+            issue_templates = fixture.issue_templates
+
+            work_item_list = [
+                project.map_issue_to_work_item_data(issue_template)
+                for issue_template in issue_templates
+            ]
+
+            initial_state = api.sync_work_items(
+                work_items_source.key, work_item_list, staging_mode=SyncStagingMode.staging_table
+            )
+            work_item_list[0]['name'] = 'Updated name'
+            next_state = api.sync_work_items(
+                work_items_source.key, work_item_list, staging_mode=SyncStagingMode.staging_table, skip_unchanged=False
+            )
+
+            assert len(initial_state) == 3
+            assert all([result['is_new'] for result in initial_state])
+            assert len(next_state) == 3
+            assert len([result for result in next_state if result['is_new']]) == 0
+            assert len([result for result in next_state if result['is_updated']]) == 1
+            # staged rows are removed at the end of the sync
+            assert db.connection().execute('select count(*) from work_tracking.work_items_staging').scalar() == 0
+
         class TestParentChildResolution:
 
             def it_resolves_the_parent_child_relationship_if_the_parent_and_child_arrive_together(self, setup):
@@ -505,6 +858,23 @@ class TestSyncApi(WorkItemsSourceTest):
                     assert updated_child['parent_key'] == str(parent_work_item.key)
                     assert updated_child['work_items_source_key'] == str(work_items_source.key)
 
+            def it_only_returns_the_synced_item_when_another_source_has_an_item_with_the_same_source_id(self, setup):
+                fixture = setup
+                project = fixture.project
+                work_items_source = fixture.work_items_source
+                cross_project = fixture.cross_project
+                cross_project_wis = fixture.cross_project_wis
+
+                api.sync_work_items(cross_project_wis.key,
+                                    [cross_project.map_issue_to_work_item_data(fixture.issue_with_components)])
+
+                sync_results = api.sync_work_items(work_items_source.key,
+                                                   [project.map_issue_to_work_item_data(fixture.issue_with_components)])
+
+                assert len(sync_results) == 1
+                assert sync_results[0]['is_new']
+                assert sync_results[0]['work_items_source_key'] == str(work_items_source.key)
+
         class TestChangelogUpdates:
 
             def it_sets_the_changelog_to_null_when_it_is_not_present(self, setup):
@@ -665,3 +1035,187 @@ class TestSyncApi(WorkItemsSourceTest):
 
                 assert len(next_state) == 1
                 assert next_state[0]['changelog'] is not None
+
+
+# Compares the two ingest paths for staging incoming work items on large batches.
+class TestSyncIngestModes(WorkItemsSourceTest):
+    batch_size = 10000
+
+    @pytest.fixture()
+    def setup(self, setup):
+        fixture = setup
+        issue_template = json.loads(
+            pkg_resources.resource_string(__name__, './data/jira_payload_with_components.json')
+        )
+        work_item_list = [
+            dict(
+                name=f'Issue {i}',
+                description='An issue with "quotes", commas\nand newlines',
+                work_item_type='story',
+                is_bug=False,
+                is_epic=False,
+                tags=['tag-1', 'tag "2"'],
+                url=f'http://foo.com/{i}',
+                source_id=str(i),
+                source_display_id=f'PP-{i}',
+                source_state='open',
+                source_created_at=datetime.utcnow(),
+                source_last_updated=datetime.utcnow(),
+                parent_source_display_id=None,
+                priority='Medium',
+                releases=[],
+                story_points=3,
+                sprints=['Sprint 1'],
+                flagged=False,
+                api_payload=issue_template,
+                changelog=[dict(created_at='2023-11-08T22:55:00.575000', status='Done')],
+                commit_identifiers=[f'PP-{i}', f'pp-{i}']
+            )
+            for i in range(0, self.batch_size)
+        ]
+        yield Fixture(
+            parent=fixture,
+            work_item_list=work_item_list
+        )
+
+    def it_stages_the_same_results_using_copy_and_insert(self, setup):
+        fixture = setup
+        work_items_source = fixture.parent.work_items_source
+
+        timings = {}
+        results = {}
+        for ingest_mode in [SyncIngestMode.insert, SyncIngestMode.copy]:
+            db.connection().execute('delete from work_tracking.work_items')
+            start = time.perf_counter()
+            results[ingest_mode] = api.sync_work_items(
+                work_items_source.key,
+                fixture.work_item_list,
+                ingest_mode=ingest_mode
+            )
+            timings[ingest_mode] = time.perf_counter() - start
+
+        logging.getLogger(__name__).info(
+            f"sync_work_items {self.batch_size} items: "
+            f"insert: {timings[SyncIngestMode.insert]:.2f}s copy: {timings[SyncIngestMode.copy]:.2f}s"
+        )
+
+        attributes = ['display_id', 'name', 'description', 'tags', 'sprints', 'story_points', 'flagged',
+                      'commit_identifiers', 'changelog', 'is_new', 'is_updated']
+        for ingest_mode, result in results.items():
+            assert len(result) == self.batch_size
+
+        inserted, copied = [
+            sorted(results[ingest_mode], key=lambda item: item['source_id'])
+            for ingest_mode in [SyncIngestMode.insert, SyncIngestMode.copy]
+        ]
+        assert all(
+            [item[attribute] for attribute in attributes] == [copy_item[attribute] for attribute in attributes]
+            for item, copy_item in zip(inserted, copied)
+        )
+
+    def it_detects_unchanged_items_staged_using_copy(self, setup):
+        fixture = setup
+        work_items_source = fixture.parent.work_items_source
+
+        api.sync_work_items(work_items_source.key, fixture.work_item_list, ingest_mode=SyncIngestMode.insert)
+        result = api.sync_work_items(
+            work_items_source.key,
+            fixture.work_item_list,
+            ingest_mode=SyncIngestMode.copy,
+            skip_unchanged=False
+        )
+
+        assert len(result) == self.batch_size
+        assert not any(item['is_new'] or item['is_updated'] for item in result)
+
+
+# Single item (webhook) syncs should only touch the rows of the item being synced, so their latency
+# must not depend on how many work items the rest of the organization has.
+class TestSingleItemSyncLatency(WorkItemsSourceTest):
+    organization_size = 50000
+    runs = 20
+
+    @staticmethod
+    def work_item_data(source_id, name, parent_source_display_id=None, is_epic=False):
+        return dict(
+            name=name,
+            description='An issue in detail',
+            work_item_type='epic' if is_epic else 'story',
+            is_bug=False,
+            is_epic=is_epic,
+            tags=[],
+            url=f'http://foo.com/{source_id}',
+            source_id=source_id,
+            source_display_id=f'PP-{source_id}',
+            source_state='open',
+            source_created_at=datetime.utcnow(),
+            source_last_updated=datetime.utcnow(),
+            parent_source_display_id=parent_source_display_id,
+            priority='Medium',
+            releases=[],
+            story_points=3,
+            sprints=[],
+            flagged=False,
+            api_payload={},
+            commit_identifiers=[f'PP-{source_id}']
+        )
+
+    def time_single_item_syncs(self, work_items_source):
+        timings = []
+        for run in range(0, self.runs):
+            # each sync changes the item, so it goes through the full update path
+            work_item = self.work_item_data('2', f'Story {run}', parent_source_display_id='PP-1')
+            start = time.perf_counter()
+            result = api.sync_work_items(work_items_source.key, [work_item])
+            timings.append(time.perf_counter() - start)
+            assert len(result) == 1
+            assert result[0]['parent_key'] is not None
+
+        return sorted(timings)[len(timings) // 2]
+
+    def grow_organization(self, work_items_source):
+        with db.orm_session() as session:
+            other_source = work_tracking.WorkItemsSource(
+                key=uuid.uuid4(),
+                connector_key=str(work_items_source.connector_key),
+                integration_type='jira',
+                work_items_source_type=work_items_source.work_items_source_type,
+                name='another project',
+                source_id='10002',
+                organization_key=work_items_source.organization_key,
+                import_state=WorkItemsSourceImportState.auto_update.value
+            )
+            session.add(other_source)
+            session.flush()
+            other_source_id = other_source.id
+
+        db.connection().execute(
+            f"insert into work_tracking.work_items "
+            f"(key, name, work_item_type, is_bug, is_epic, tags, source_state, source_id, source_display_id, "
+            f"source_created_at, source_last_updated, work_items_source_id, organization_key) "
+            f"select uuid_generate_v4(), 'Issue ' || i, 'story', false, false, '{{}}', 'open', i::text, 'OT-' || i, "
+            f"now(), now(), {other_source_id}, '{work_items_source.organization_key}' "
+            f"from generate_series(1, {self.organization_size}) i"
+        )
+        db.connection().execute("analyze work_tracking.work_items")
+
+    def it_does_not_get_slower_as_the_organization_grows(self, setup):
+        fixture = setup
+        work_items_source = fixture.work_items_source
+
+        api.sync_work_items(
+            work_items_source.key,
+            [self.work_item_data('1', 'Epic', is_epic=True), self.work_item_data('2', 'Story', 'PP-1')]
+        )
+        small = self.time_single_item_syncs(work_items_source)
+
+        self.grow_organization(work_items_source)
+        large = self.time_single_item_syncs(work_items_source)
+
+        logging.getLogger(__name__).info(
+            f"single item sync: {small * 1000:.1f}ms with 2 work items in the organization, "
+            f"{large * 1000:.1f}ms with {self.organization_size} more"
+        )
+        # the medians are compared with some slack for noise: a plan that scans the organization
+        # is orders of magnitude slower at this size.
+        assert large < 2 * small + 0.01
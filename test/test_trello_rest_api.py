@@ -136,3 +136,22 @@ class TestTrelloWorkItemSource:
 
         assert not mapped_data['is_bug']
         assert mapped_data['work_item_type'] == TrelloWorkItemType.issue.value
+
+    def it_refetches_the_board_metadata_when_a_card_refers_to_an_unknown_list(self, setup):
+        fixture = setup
+
+        board = fixture.trello_board
+        card = dict(fixture.trello_card, idList='unknown-list')
+
+        assert not board.has_board_metadata_for_card(card)
+
+        with patch.object(TrelloBoard, 'fetch_board_lists') as fetch_board_lists, \
+                patch.object(TrelloBoard, 'fetch_board_labels') as fetch_board_labels:
+            fetch_board_lists.return_value = [[dict(id='unknown-list', name='Doing')]]
+            fetch_board_labels.return_value = [[]]
+            work_items_source_data = board.refresh_source_data_if_stale(
+                force=not board.has_board_metadata_for_card(card)
+            )
+
+            assert work_items_source_data['source_states'] == ['Doing']
+            assert work_items_source_data['source_data']['fetched_at']